@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+""" Compare loading a text PAF with loading its columnar conversion.
+
+Each reader touches the coordinate columns of every batch, which is what
+the filter, repeats and cluster subcommands do. The skip row reads the
+columnar file asking only for alignments of at least --min-length bases,
+so that chunks can be skipped using their stats.
+
+Example:
+    python benchmarks/bench_columnar.py --records 1000000
+    python benchmarks/bench_columnar.py my_alignments.paf
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from typing import Callable, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import synthetic from next to this script and pypafgraph from this
+# checkout, wherever the script is run from.
+sys.path[:0] = [os.path.join(REPO, "benchmarks"), REPO]
+
+from pypafgraph.paf import read_paf_batches, DEFAULT_BATCH_SIZE
+from pypafgraph.columnar import ColumnarPAF, write_columnar
+
+from synthetic import genome_contigs, write_paf
+
+
+def time_reader(name: str, reader: Callable[[], int]) -> float:
+    start = time.perf_counter()
+    nrecords = reader()
+    elapsed = time.perf_counter() - start
+    print(f"{name}\t{nrecords}\t{elapsed:.3f}")
+    return elapsed
+
+
+def touch(batches) -> int:
+    nrecords = 0
+    for batch in batches:
+        qstarts, qends = batch.query_intervals()
+        tstarts, tends = batch.target_intervals()
+        nrecords += len(batch)
+    return nrecords
+
+
+def read_text(path: str) -> int:
+    with open(path) as handle:
+        return touch(read_paf_batches(handle))
+
+
+def read_columnar(path: str, min_length: int = 0) -> int:
+    with ColumnarPAF(path) as paf:
+        return touch(paf.batches({"alilen": (min_length, None)}))
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "inpaf",
+        nargs="?",
+        default=None,
+        help="PAF file to read. Default generate a synthetic one.",
+    )
+    parser.add_argument("--records", default=500000, type=int)
+    parser.add_argument("--chunk-size", default=DEFAULT_BATCH_SIZE, type=int)
+    parser.add_argument("--min-length", default=15000, type=int)
+    parser.add_argument("--seed", default=1, type=int)
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.inpaf is None:
+            path = os.path.join(tmpdir, "synthetic.paf")
+            rng = random.Random(args.seed)
+            contigs = genome_contigs(rng, 10, 50)
+
+            # Sorting by alignment length gives chunks narrow ranges.
+            with open(path, "w") as handle:
+                write_paf(handle, rng, contigs, args.records)
+            with open(path) as handle:
+                lines = sorted(handle, key=lambda l: int(l.split("\t")[10]))
+            with open(path, "w") as handle:
+                handle.writelines(lines)
+        else:
+            path = args.inpaf
+
+        columnar = os.path.join(tmpdir, "converted.ppaf")
+        with open(path) as handle:
+            write_columnar(
+                columnar,
+                read_paf_batches(handle, args.chunk_size)
+            )
+
+        text_size = os.path.getsize(path)
+        columnar_size = os.path.getsize(columnar)
+        print(
+            f"text {text_size} bytes, columnar {columnar_size} bytes",
+            file=sys.stderr
+        )
+
+        print("reader\trecords\tseconds")
+        text = time_reader("text", lambda: read_text(path))
+        col = time_reader("columnar", lambda: read_columnar(columnar))
+        skip = time_reader(
+            f"columnar alilen>={args.min_length}",
+            lambda: read_columnar(columnar, args.min_length)
+        )
+
+    print(f"speedup: {text / col:.2f}x, with skipping {text / skip:.2f}x",
+          file=sys.stderr)
+    return
+
+
+if __name__ == "__main__":
+    main()
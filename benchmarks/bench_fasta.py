@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+""" Compare FASTA read and write throughput of Bio.SeqIO and
+pypafgraph.fasta.
+
+Each reader parses every record and writes it back out uppercased, which
+is what ppg unsoftmask does.
+
+Example:
+    python benchmarks/bench_fasta.py --genomes 2 --contigs 10
+    python benchmarks/bench_fasta.py my_genome.fasta
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from typing import Callable, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import synthetic from next to this script and pypafgraph from this
+# checkout, wherever the script is run from.
+sys.path[:0] = [os.path.join(REPO, "benchmarks"), REPO]
+
+from pypafgraph.fasta import Fasta, write_fasta
+
+from synthetic import genome_contigs, write_fasta as write_synthetic
+
+
+def time_roundtrip(name: str, path: str, func: Callable[[str], int]) -> float:
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    nrecords = func(path)
+    elapsed = time.perf_counter() - start
+    rate = size / elapsed / 2 ** 20
+    print(f"{name}\t{nrecords}\t{elapsed:.3f}\t{rate:.1f}")
+    return rate
+
+
+def seqio_roundtrip(path: str) -> int:
+    from Bio import SeqIO
+
+    nrecords = 0
+    with open(path) as handle, open(os.devnull, "w") as out:
+        for record in SeqIO.parse(handle, format="fasta"):
+            record.seq = record.seq.upper()
+            SeqIO.write(record, out, format="fasta")
+            nrecords += 1
+    return nrecords
+
+
+def fasta_roundtrip(path: str) -> int:
+    nrecords = 0
+    with open(path, "rb") as handle, open(os.devnull, "wb") as out:
+        for record in Fasta.from_file(handle):
+            write_fasta(out, record.description, record.seq.upper())
+            nrecords += 1
+    return nrecords
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "infasta",
+        nargs="?",
+        default=None,
+        help="Fasta file to read. Default generate a synthetic one.",
+    )
+    parser.add_argument("--genomes", default=2, type=int)
+    parser.add_argument("--contigs", default=20, type=int)
+    parser.add_argument("--max-contig-length", default=2000000, type=int)
+    parser.add_argument("--seed", default=1, type=int)
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    with tempfile.NamedTemporaryFile("w", suffix=".fasta") as tmp:
+        if args.infasta is None:
+            rng = random.Random(args.seed)
+            contigs = genome_contigs(
+                rng,
+                args.genomes,
+                args.contigs,
+                max_length=args.max_contig_length
+            )
+            write_synthetic(tmp, rng, contigs)
+            tmp.flush()
+            path = tmp.name
+        else:
+            path = args.infasta
+
+        print("reader\trecords\tseconds\tmb_per_second")
+        baseline = time_roundtrip("Bio.SeqIO", path, seqio_roundtrip)
+        native = time_roundtrip("pypafgraph.fasta", path, fasta_roundtrip)
+
+    print(f"speedup: {native / baseline:.2f}x", file=sys.stderr)
+    return
+
+
+if __name__ == "__main__":
+    main()
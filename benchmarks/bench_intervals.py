@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+""" Compare overlap queries with IntervalTree and with IntervalSet.
+
+For each query interval, count the bases overlapping a set of repeats,
+once per interval with total_intersection on an IntervalTree and once for
+all of the intervals together with IntervalSet.overlap_lengths.
+
+Example:
+    python benchmarks/bench_intervals.py --repeats 100000 --queries 100000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from typing import List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import pypafgraph from this checkout, wherever the script is run from.
+sys.path.insert(0, REPO)
+
+import numpy as np
+
+from intervaltree import Interval, IntervalTree
+
+from pypafgraph.intervals import IntervalSet
+from pypafgraph.interval_utils import total_intersection
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument("--length", default=100000000, type=int)
+    parser.add_argument("--repeats", default=100000, type=int)
+    parser.add_argument("--queries", default=20000, type=int)
+    parser.add_argument("--seed", default=1, type=int)
+    return parser.parse_args(args)
+
+
+def random_intervals(
+    rng: np.random.Generator,
+    n: int,
+    length: int,
+    max_size: int,
+):
+    starts = rng.integers(0, length, n)
+    ends = starts + rng.integers(1, max_size, n)
+    return starts, ends
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+    rng = np.random.default_rng(args.seed)
+
+    rstarts, rends = random_intervals(rng, args.repeats, args.length, 5000)
+    qstarts, qends = random_intervals(rng, args.queries, args.length, 20000)
+
+    start = time.perf_counter()
+    itree = IntervalTree.from_tuples(zip(rstarts.tolist(), rends.tolist()))
+    tree_overlaps = [
+        total_intersection(itree, Interval(s, e))
+        for s, e in zip(qstarts.tolist(), qends.tolist())
+    ]
+    tree_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    repeats = IntervalSet(rstarts, rends)
+    set_overlaps = repeats.overlap_lengths(qstarts, qends)
+    set_time = time.perf_counter() - start
+
+    if set_overlaps.tolist() != tree_overlaps:
+        raise ValueError("The two methods disagree.")
+
+    print("method\tqueries\tseconds")
+    print(f"IntervalTree\t{args.queries}\t{tree_time:.3f}")
+    print(f"IntervalSet\t{args.queries}\t{set_time:.3f}")
+    print(f"speedup: {tree_time / set_time:.2f}x", file=sys.stderr)
+    return
+
+
+if __name__ == "__main__":
+    main()
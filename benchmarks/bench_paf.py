@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+""" Compare PAF parsing throughput of PAF.from_file and read_paf_batches.
+
+Example:
+    python benchmarks/bench_paf.py --records 1000000
+    python benchmarks/bench_paf.py my_alignments.paf
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from typing import Callable, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import synthetic from next to this script and pypafgraph from this
+# checkout, wherever the script is run from.
+sys.path[:0] = [os.path.join(REPO, "benchmarks"), REPO]
+
+from pypafgraph.paf import PAF, read_paf_batches, DEFAULT_BATCH_SIZE
+
+from synthetic import genome_contigs, write_paf
+
+
+def time_reader(name: str, path: str, reader: Callable[[str], int]) -> float:
+    start = time.perf_counter()
+    nrecords = reader(path)
+    elapsed = time.perf_counter() - start
+    rate = nrecords / elapsed
+    print(f"{name}\t{nrecords}\t{elapsed:.3f}\t{rate:.0f}")
+    return rate
+
+
+def read_records(path: str) -> int:
+    with open(path) as handle:
+        return sum(1 for _ in PAF.from_file(handle))
+
+
+def read_batches(path: str, batch_size: int) -> int:
+    with open(path) as handle:
+        return sum(len(b) for b in read_paf_batches(handle, batch_size))
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "inpaf",
+        nargs="?",
+        default=None,
+        help="PAF file to read. Default generate a synthetic one.",
+    )
+    parser.add_argument("--records", default=500000, type=int)
+    parser.add_argument("--batch-size", default=DEFAULT_BATCH_SIZE, type=int)
+    parser.add_argument("--seed", default=1, type=int)
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    with tempfile.NamedTemporaryFile("w", suffix=".paf") as tmp:
+        if args.inpaf is None:
+            rng = random.Random(args.seed)
+            contigs = genome_contigs(rng, 10, 50)
+            write_paf(tmp, rng, contigs, args.records)
+            tmp.flush()
+            path = tmp.name
+        else:
+            path = args.inpaf
+
+        print("reader\trecords\tseconds\trecords_per_second")
+        baseline = time_reader("PAF.from_file", path, read_records)
+        batched = time_reader(
+            "read_paf_batches",
+            path,
+            lambda p: read_batches(p, args.batch_size)
+        )
+
+    print(f"speedup: {batched / baseline:.2f}x", file=sys.stderr)
+    return
+
+
+if __name__ == "__main__":
+    main()
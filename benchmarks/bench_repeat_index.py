@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+""" Compare building a RepeatIndex from a BED file with loading a saved one.
+
+This is the start up cost that ppg filter pays for its repeats argument,
+either a bed file or an index written by ppg index-repeats.
+
+Example:
+    python benchmarks/bench_repeat_index.py --genomes 20 --contigs 5000
+    python benchmarks/bench_repeat_index.py my_repeats.bed
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from typing import Callable, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import synthetic from next to this script and pypafgraph from this
+# checkout, wherever the script is run from.
+sys.path[:0] = [os.path.join(REPO, "benchmarks"), REPO]
+
+import numpy as np
+
+from pypafgraph.bed import BED, RepeatIndex
+
+from synthetic import genome_contigs, write_bed
+
+
+def from_bed(path: str) -> RepeatIndex:
+    with open(path) as handle:
+        return RepeatIndex.from_beds(BED.from_file(handle))
+
+
+def time_index(
+    name: str,
+    func: Callable[[str], RepeatIndex],
+    path: str,
+) -> float:
+    start = time.perf_counter()
+    index = func(path)
+
+    # Touch the index like a first filter batch would.
+    rows = index.lookup(index.seqids[:1000])
+    index.covered(rows, np.zeros(len(rows)), np.full(len(rows), 10 ** 6))
+
+    elapsed = time.perf_counter() - start
+    print(f"{name}\t{len(index.intervals)}\t{elapsed:.3f}")
+    return elapsed
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "inbed",
+        nargs="?",
+        default=None,
+        help="BED file to read. Default generate a synthetic one.",
+    )
+    parser.add_argument("--genomes", default=10, type=int)
+    parser.add_argument("--contigs", default=2000, type=int)
+    parser.add_argument("--repeat-density", default=0.3, type=float)
+    parser.add_argument("--seed", default=1, type=int)
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.inbed is None:
+            path = os.path.join(tmpdir, "repeats.bed")
+            rng = random.Random(args.seed)
+            contigs = genome_contigs(rng, args.genomes, args.contigs)
+            with open(path, "w") as handle:
+                write_bed(handle, rng, contigs, args.repeat_density)
+        else:
+            path = args.inbed
+
+        index_path = os.path.join(tmpdir, "repeats.idx")
+        from_bed(path).save(index_path)
+
+        print("method\tintervals\tseconds")
+        baseline = time_index("bed", from_bed, path)
+        new = time_index("index", RepeatIndex.load, index_path)
+        print(f"speedup: {baseline / new:.2f}x", file=sys.stderr)
+    return
+
+
+if __name__ == "__main__":
+    main()
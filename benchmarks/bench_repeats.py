@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+""" Compare merging repeats with IntervalTree and with RepeatAccumulator.
+
+The batches are parsed up front, so only the interval work is timed. The
+IntervalTree version is the per-sequence approach that ppg repeats used
+to take.
+
+Example:
+    python benchmarks/bench_repeats.py --records 1000000
+    python benchmarks/bench_repeats.py my_alignments.paf
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from collections import defaultdict
+
+from typing import Callable, Dict, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import synthetic from next to this script and pypafgraph from this
+# checkout, wherever the script is run from.
+sys.path[:0] = [os.path.join(REPO, "benchmarks"), REPO]
+
+from intervaltree import Interval, IntervalTree
+
+from pypafgraph.paf import PAFBatch, read_paf_batches
+from pypafgraph.repeats import RepeatAccumulator
+from pypafgraph.interval_utils import sym_diff
+
+from synthetic import genome_contigs, write_paf
+
+
+def interval_trees(batches: List[PAFBatch], sep: str) -> int:
+    repeats: Dict[str, List[Interval]] = defaultdict(list)
+
+    for batch in batches:
+        names = batch.names
+        genomes = names.genome_ids(sep)
+        qstarts, qends = batch.query_intervals()
+        tstarts, tends = batch.target_intervals()
+
+        for i in range(len(batch)):
+            if genomes[batch.query[i]] != genomes[batch.target[i]]:
+                continue
+
+            query = names[batch.query[i]]
+            target = names[batch.target[i]]
+            qinterval = Interval(int(qstarts[i]), int(qends[i]))
+            tinterval = Interval(int(tstarts[i]), int(tends[i]))
+
+            if (query == target) and qinterval.overlaps(tinterval):
+                repeats[query].extend(sym_diff(qinterval, tinterval))
+            else:
+                repeats[query].append(qinterval)
+                repeats[target].append(tinterval)
+
+    nintervals = 0
+    for intervals in repeats.values():
+        itree = IntervalTree(intervals)
+        itree.merge_overlaps()
+        nintervals += len(itree)
+    return nintervals
+
+
+def accumulator(batches: List[PAFBatch], sep: str) -> int:
+    repeats = RepeatAccumulator(sep)
+    for batch in batches:
+        repeats.add(batch)
+
+    return sum(len(keys) for _, keys, _, _ in repeats.finish())
+
+
+def time_method(
+    name: str,
+    func: Callable[[List[PAFBatch], str], int],
+    batches: List[PAFBatch],
+    sep: str,
+) -> float:
+    start = time.perf_counter()
+    nintervals = func(batches, sep)
+    elapsed = time.perf_counter() - start
+    print(f"{name}\t{nintervals}\t{elapsed:.3f}")
+    return elapsed
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "inpaf",
+        nargs="?",
+        default=None,
+        help="PAF file to read. Default generate a synthetic one.",
+    )
+    parser.add_argument("--records", default=500000, type=int)
+    parser.add_argument("--genomes", default=5, type=int)
+    parser.add_argument("--contigs", default=2000, type=int)
+    parser.add_argument("--sep", default=".", type=str)
+    parser.add_argument("--seed", default=1, type=int)
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    with tempfile.NamedTemporaryFile("w", suffix=".paf") as tmp:
+        if args.inpaf is None:
+            rng = random.Random(args.seed)
+            contigs = genome_contigs(rng, args.genomes, args.contigs)
+            write_paf(tmp, rng, contigs, args.records)
+            tmp.flush()
+            path = tmp.name
+        else:
+            path = args.inpaf
+
+        with open(path) as handle:
+            batches = list(read_paf_batches(handle))
+
+    print("method\tintervals\tseconds")
+    baseline = time_method("IntervalTree", interval_trees, batches, args.sep)
+    new = time_method("RepeatAccumulator", accumulator, batches, args.sep)
+    print(f"speedup: {baseline / new:.2f}x", file=sys.stderr)
+    return
+
+
+if __name__ == "__main__":
+    main()
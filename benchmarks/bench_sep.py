@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+""" Time the same-genome check used by filter and repeats with --sep.
+
+The batches are parsed up front, so only the check itself is timed:
+
+    per-record   split both names of every record, like the old repeats
+    per-batch    split the distinct names of each batch, like the old filter
+    genome-ids   NameTable.genome_ids, which splits each name once
+
+With --profile, the filter_batch call for every batch is also run under
+cProfile to show where the time goes in the whole --sep path.
+
+Example:
+    python benchmarks/bench_sep.py --records 1000000 --contigs 20000
+    python benchmarks/bench_sep.py my_alignments.paf --profile
+"""
+
+import os
+import sys
+import time
+import random
+import pstats
+import argparse
+import cProfile
+import tempfile
+
+from typing import Callable, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import synthetic from next to this script and pypafgraph from this
+# checkout, wherever the script is run from.
+sys.path[:0] = [os.path.join(REPO, "benchmarks"), REPO]
+
+import numpy as np
+
+from pypafgraph.bed import RepeatIndex
+from pypafgraph.paf import PAFBatch, NameTable, read_paf_batches
+from pypafgraph.utils import get_genome_name
+from pypafgraph.scripts.filter import filter_batch
+
+from synthetic import genome_contigs, write_paf
+
+
+def per_record(batches: List[PAFBatch], sep: str) -> int:
+    nsame = 0
+    for batch in batches:
+        names = batch.names
+        for q, t in zip(batch.query.tolist(), batch.target.tolist()):
+            qgenome = get_genome_name(names[q], sep)
+            tgenome = get_genome_name(names[t], sep)
+            nsame += qgenome == tgenome
+    return nsame
+
+
+def per_batch(batches: List[PAFBatch], sep: str) -> int:
+    nsame = 0
+    for batch in batches:
+        nrecords = len(batch)
+        ids, inverse = np.unique(
+            np.concatenate([batch.query, batch.target]),
+            return_inverse=True
+        )
+        seqids = [batch.names[i] for i in ids.tolist()]
+        genomes = NameTable().encode([get_genome_name(s, sep) for s in seqids])
+        genomes = genomes[inverse]
+        nsame += int((genomes[:nrecords] == genomes[nrecords:]).sum())
+    return nsame
+
+
+def genome_ids(batches: List[PAFBatch], sep: str) -> int:
+    nsame = 0
+    for batch in batches:
+        genomes = batch.names.genome_ids(sep)
+        nsame += int((genomes[batch.query] == genomes[batch.target]).sum())
+    return nsame
+
+
+def time_check(
+    name: str,
+    func: Callable[[List[PAFBatch], str], int],
+    batches: List[PAFBatch],
+    sep: str,
+) -> float:
+    start = time.perf_counter()
+    nsame = func(batches, sep)
+    elapsed = time.perf_counter() - start
+    print(f"{name}\t{nsame}\t{elapsed:.3f}")
+    return elapsed
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__)
+    parser.add_argument(
+        "inpaf",
+        nargs="?",
+        default=None,
+        help="PAF file to read. Default generate a synthetic one.",
+    )
+    parser.add_argument("--records", default=500000, type=int)
+    parser.add_argument("--genomes", default=10, type=int)
+    parser.add_argument("--contigs", default=2000, type=int)
+    parser.add_argument("--sep", default=".", type=str)
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--profile", default=False, action="store_true")
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    with tempfile.NamedTemporaryFile("w", suffix=".paf") as tmp:
+        if args.inpaf is None:
+            rng = random.Random(args.seed)
+            contigs = genome_contigs(rng, args.genomes, args.contigs)
+            write_paf(tmp, rng, contigs, args.records)
+            tmp.flush()
+            path = tmp.name
+        else:
+            path = args.inpaf
+
+        with open(path) as handle:
+            batches = list(read_paf_batches(handle))
+
+    print("method\tsame_genome\tseconds")
+    baseline = time_check("per-record", per_record, batches, args.sep)
+    time_check("per-batch", per_batch, batches, args.sep)
+
+    # The cache is filled on first use, so time a cold and a warm run.
+    cold = time_check("genome-ids", genome_ids, batches, args.sep)
+    time_check("genome-ids (cached)", genome_ids, batches, args.sep)
+    print(f"speedup: {baseline / cold:.2f}x", file=sys.stderr)
+
+    if args.profile:
+        index = RepeatIndex.from_beds([])
+        profiler = cProfile.Profile()
+        profiler.enable()
+        for batch in batches:
+            filter_batch(batch, index, 1, 0.5, args.sep)
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+""" Measure how long ppg takes to start for each subcommand.
+
+For each subcommand this reports the total import time from
+python -X importtime, the wall time of `ppg <subcommand> --help`, and
+any heavy optional dependencies that got imported. Subcommands are only
+imported when they're run, so e.g. filter shouldn't pull in scipy or
+markov_clustering.
+
+Exits with an error if a subcommand imports a dependency it shouldn't,
+or if --max-import-ms is given and an import takes longer, so it can be
+used to guard against regressions.
+
+Example:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --max-import-ms 500
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+from typing import Dict, List, Optional, Tuple
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import pypafgraph from this checkout, wherever the script is run from.
+sys.path.insert(0, REPO)
+
+from pypafgraph.scripts import SUBCOMMANDS
+
+# Dependencies that only some subcommands need.
+HEAVY = (
+    "scipy",
+    "sklearn",
+    "markov_clustering",
+    "networkx",
+    "matplotlib",
+    "Bio",
+)
+
+# The heavy dependencies that each subcommand is allowed to import.
+ALLOWED = {
+    "cluster": ("scipy",),
+}
+
+
+def python(args: List[str]) -> Tuple[float, str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (REPO, env.get("PYTHONPATH")) if p
+    )
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable] + args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    elapsed = time.perf_counter() - start
+    return elapsed, result.stdout.decode(), result.stderr.decode()
+
+
+def import_time(module: str) -> Tuple[float, List[str]]:
+    """ The total import time in ms of the module and everything it
+    imports, and the heavy dependencies it imported.
+    """
+
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    )
+    _, stdout, stderr = python(["-X", "importtime", "-c", code])
+
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        _, cumulative, name = line.split("|")
+        # Only count the top level imports, which include their children.
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            total += int(cumulative)
+    return total / 1000, stdout.split()
+
+
+def help_time(name: Optional[str], repeats: int) -> float:
+    """ The fastest wall time in ms of ppg --help. """
+
+    args = [] if name is None else [name]
+    code = (
+        "import sys; sys.argv[0] = 'ppg'; "
+        "from pypafgraph.scripts import main; main()"
+    )
+
+    times = []
+    for _ in range(repeats):
+        elapsed, _, _ = python(["-c", code] + args + ["--help"])
+        times.append(elapsed)
+    return min(times) * 1000
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--repeats", default=5, type=int)
+    parser.add_argument(
+        "--max-import-ms",
+        default=None,
+        type=float,
+        help="Fail if any subcommand takes longer than this to import.",
+    )
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    modules: Dict[Optional[str], str] = {None: "pypafgraph.scripts"}
+    modules.update({s.name: s.module for s in SUBCOMMANDS})
+
+    problems = []
+    print("subcommand\timport_ms\thelp_ms\theavy_imports")
+    for name, module in modules.items():
+        milliseconds, heavy = import_time(module)
+        wall = help_time(name, args.repeats)
+        label = "(none)" if name is None else name
+        print(f"{label}\t{milliseconds:.1f}\t{wall:.1f}\t{','.join(heavy)}")
+
+        allowed = ALLOWED.get(name, ()) if name is not None else ()
+        unexpected = [m for m in heavy if m not in allowed]
+        if len(unexpected) > 0:
+            problems.append(f"{label} imports {', '.join(unexpected)}")
+
+        if args.max_import_ms is not None and \
+                milliseconds > args.max_import_ms:
+            problems.append(
+                f"{label} takes {milliseconds:.0f}ms to import, more than "
+                f"{args.max_import_ms:g}ms"
+            )
+
+    for problem in problems:
+        print(problem, file=sys.stderr)
+
+    if len(problems) > 0:
+        sys.exit(1)
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+""" Time every ppg subcommand on synthetic inputs at several scales.
+
+Each scale generates a seeded all-vs-all PAF, a BED of repeats, a
+softmasked FASTA and a clusters tsv describing the same genomes. Each
+subcommand is run in a fresh process with ppg --stats, so the per-stage
+times and peak memory of the whole run (including worker processes) are
+recorded alongside the wall time.
+
+The results are written as JSON with the commit they were run at, so
+runs from different commits can be compared with --compare.
+
+Example:
+    python benchmarks/suite.py --scales small medium -o results.json
+    python benchmarks/suite.py --scales small --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from os.path import join as pjoin
+from datetime import datetime, timezone
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from typing import TextIO
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import synthetic from next to this script, wherever it's run from.
+sys.path.insert(0, os.path.join(REPO, "benchmarks"))
+
+from synthetic import genome_contigs, write_paf, write_bed, write_fasta
+from synthetic import write_clusters
+
+# Run ppg from this checkout rather than whatever is installed.
+PPG = (
+    "import sys; sys.argv[0] = 'ppg'; "
+    "from pypafgraph.scripts import main; main()"
+)
+
+
+class Scale(NamedTuple):
+    genomes: int
+    contigs: int
+    max_length: int
+    records: int
+
+
+SCALES = {
+    "small": Scale(genomes=3, contigs=20, max_length=100000, records=20000),
+    "medium": Scale(genomes=5, contigs=100, max_length=200000,
+                    records=200000),
+    "large": Scale(genomes=10, contigs=400, max_length=200000,
+                   records=2000000),
+}
+
+
+class Benchmark(NamedTuple):
+    name: str
+    args: List[str]
+    # Which generated file the throughput is measured against.
+    input: str
+
+
+def generate(
+    directory: str,
+    scale: Scale,
+    seed: int,
+    repeat_density: float,
+) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """ Write the synthetic inputs for a scale.
+
+    Returns the paths and the number of records in each file.
+    """
+
+    contigs = genome_contigs(
+        random.Random(seed),
+        scale.genomes,
+        scale.contigs,
+        max_length=scale.max_length,
+    )
+
+    paths = {
+        kind: pjoin(directory, f"input.{kind}")
+        for kind in ("paf", "bed", "fasta", "tsv")
+    }
+
+    rng = random.Random(seed + 1)
+    with open(paths["paf"], "w") as handle:
+        write_paf(handle, rng, contigs, scale.records)
+
+    with open(paths["bed"], "w") as handle:
+        write_bed(handle, rng, contigs, repeat_density)
+
+    with open(paths["fasta"], "w") as handle:
+        write_fasta(handle, rng, contigs, repeat_density)
+
+    with open(paths["tsv"], "w") as handle:
+        write_clusters(handle, rng, contigs)
+
+    with open(paths["bed"]) as handle:
+        nrepeats = sum(1 for _ in handle)
+
+    nrecords = {
+        "paf": scale.records,
+        "bed": nrepeats,
+        "fasta": len(contigs),
+        "tsv": len(contigs),
+    }
+    return paths, nrecords
+
+
+def benchmarks(
+    paths: Dict[str, str],
+    outdir: str,
+    threads: int,
+) -> List[Benchmark]:
+    paf = paths["paf"]
+    columnar = pjoin(outdir, "input.ppaf")
+    index = pjoin(outdir, "input.idx")
+
+    suite = [
+        Benchmark("filter", ["filter", paths["bed"], paf, "-s", "."], "paf"),
+        Benchmark("repeats", ["repeats", paf, "-s", "."], "paf"),
+        Benchmark("cluster", ["cluster", paf], "paf"),
+        Benchmark(
+            "unsoftmask",
+            ["unsoftmask", paths["fasta"], "-f", pjoin(outdir, "out.fasta")],
+            "fasta"
+        ),
+        Benchmark(
+            "selectseqs",
+            ["selectseqs", paths["tsv"], paths["fasta"],
+             "-o", pjoin(outdir, "selectseqs")],
+            "fasta"
+        ),
+        Benchmark("convert", ["convert", paf, "-o", columnar], "paf"),
+        Benchmark(
+            "filter-columnar",
+            ["filter", paths["bed"], columnar, "-s", "."],
+            "paf"
+        ),
+        Benchmark(
+            "index-repeats",
+            ["index-repeats", paths["bed"], "-o", index],
+            "bed"
+        ),
+        Benchmark("filter-index", ["filter", index, paf, "-s", "."], "paf"),
+    ]
+
+    if threads > 1:
+        suite.append(Benchmark(
+            f"filter-t{threads}",
+            ["filter", paths["bed"], paf, "-s", ".", "-t", str(threads)],
+            "paf"
+        ))
+
+    # Everything that writes to stdout gets its own output file instead.
+    has_output = ("unsoftmask", "selectseqs", "convert", "index-repeats")
+    for benchmark in suite:
+        if benchmark.name not in has_output:
+            benchmark.args.extend(["-o", pjoin(outdir, benchmark.name)])
+        elif benchmark.name == "unsoftmask":
+            benchmark.args.extend(["-o", pjoin(outdir, "out.bed")])
+    return suite
+
+
+def run_ppg(args: List[str], stats_path: str) -> Tuple[float, Dict[str, Any]]:
+    """ Run ppg in a new process, returning the wall time and its stats. """
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (REPO, env.get("PYTHONPATH")) if p
+    )
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", PPG, "--stats", stats_path] + args,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    elapsed = time.perf_counter() - start
+
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ppg {' '.join(args)} failed:\n{result.stderr.decode()}"
+        )
+
+    with open(stats_path) as handle:
+        return elapsed, json.load(handle)
+
+
+def run_benchmark(
+    benchmark: Benchmark,
+    scale: str,
+    paths: Dict[str, str],
+    nrecords: Dict[str, int],
+    repeats: int,
+    stats_path: str,
+) -> Dict[str, Any]:
+    """ Run a benchmark several times, keeping the stats of the fastest. """
+
+    walls = []
+    best: Optional[Dict[str, Any]] = None
+    for _ in range(repeats):
+        elapsed, stats = run_ppg(benchmark.args, stats_path)
+        walls.append(round(elapsed, 6))
+        if best is None or elapsed <= min(walls):
+            best = stats
+
+    assert best is not None
+    wall = min(walls)
+    size = os.path.getsize(paths[benchmark.input])
+    records = nrecords[benchmark.input]
+    return {
+        "scale": scale,
+        "name": benchmark.name,
+        "args": ["ppg"] + benchmark.args,
+        "input_records": records,
+        "input_bytes": size,
+        "wall_seconds": wall,
+        "all_wall_seconds": walls,
+        # From when ppg starts importing, so without interpreter startup.
+        "main_wall_seconds": best["wall_seconds"],
+        "cpu_seconds": best["cpu_seconds"],
+        "peak_rss_bytes": best["peak_rss_bytes"],
+        "records_per_second": round(records / wall, 3),
+        "megabytes_per_second": round(size / 1e6 / wall, 3),
+        "stages": best["stages"],
+        "counters": best["counters"],
+    }
+
+
+def git_info() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        result = subprocess.run(
+            ["git", "-C", REPO] + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return result.stdout.decode().strip()
+
+    return {
+        "commit": git("rev-parse", "HEAD") or None,
+        "dirty": git("status", "--porcelain", "--untracked-files=no") != "",
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], handle: TextIO):
+    """ Write the change in wall time and memory of each benchmark. """
+
+    before = {(r["scale"], r["name"]): r for r in old["results"]}
+    print(
+        f"# {old.get('commit')} -> {new.get('commit')}\n"
+        "scale\tname\told_s\tnew_s\ttime_ratio\told_rss_mb\tnew_rss_mb",
+        file=handle
+    )
+    for result in new["results"]:
+        previous = before.get((result["scale"], result["name"]))
+        if previous is None:
+            continue
+
+        ratio = result["wall_seconds"] / previous["wall_seconds"]
+        print(
+            f"{result['scale']}\t{result['name']}\t"
+            f"{previous['wall_seconds']:.3f}\t{result['wall_seconds']:.3f}\t"
+            f"{ratio:.2f}\t{previous['peak_rss_bytes'] / 1e6:.1f}\t"
+            f"{result['peak_rss_bytes'] / 1e6:.1f}",
+            file=handle
+        )
+    return
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        default=["small", "medium"],
+        choices=list(SCALES),
+        help="Which input sizes to run. Default small and medium.",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        default=None,
+        help="Only run the benchmarks with these names.",
+    )
+    parser.add_argument(
+        "-o", "--outfile",
+        default=None,
+        type=str,
+        help="Where to write the JSON results. Default stdout.",
+    )
+    parser.add_argument(
+        "--compare",
+        default=None,
+        type=argparse.FileType("r"),
+        help="Compare against the JSON results of an earlier run.",
+    )
+    parser.add_argument(
+        "--repeats",
+        default=3,
+        type=int,
+        help="How many times to run each benchmark. The fastest is kept.",
+    )
+    parser.add_argument(
+        "--threads",
+        default=1,
+        type=int,
+        help="Also run filter with this many threads.",
+    )
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--repeat-density", default=0.2, type=float)
+    parser.add_argument(
+        "--tmpdir",
+        default=None,
+        type=str,
+        help="Where to write the inputs and outputs.",
+    )
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    report = git_info()
+    report.update({
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "repeats": args.repeats,
+        "scales": {s: SCALES[s]._asdict() for s in args.scales},
+        "results": [],
+    })
+
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory(dir=args.tmpdir) as directory:
+            print(f"Generating {scale} inputs.", file=sys.stderr)
+            paths, nrecords = generate(
+                directory,
+                SCALES[scale],
+                args.seed,
+                args.repeat_density,
+            )
+
+            stats_path = pjoin(directory, "stats.json")
+            for benchmark in benchmarks(paths, directory, args.threads):
+                if args.only is not None and benchmark.name not in args.only:
+                    continue
+
+                result = run_benchmark(
+                    benchmark,
+                    scale,
+                    paths,
+                    nrecords,
+                    args.repeats,
+                    stats_path,
+                )
+                report["results"].append(result)
+                print(
+                    f"{scale}\t{benchmark.name}\t"
+                    f"{result['wall_seconds']:.3f}s\t"
+                    f"{result['records_per_second']:.0f} records/s\t"
+                    f"{result['peak_rss_bytes'] / 1e6:.1f}MB",
+                    file=sys.stderr
+                )
+
+    if args.outfile is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.outfile, "w") as handle:
+            json.dump(report, handle, indent=2)
+            handle.write("\n")
+
+    if args.compare is not None:
+        compare(json.load(args.compare), report, sys.stderr)
+    return
+
+
+if __name__ == "__main__":
+    main()
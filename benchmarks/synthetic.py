@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+""" Seeded synthetic data generators for the benchmarks. """
+
+import sys
+import random
+import argparse
+
+from typing import List, Tuple, TextIO
+
+
+def genome_contigs(
+    rng: random.Random,
+    ngenomes: int,
+    ncontigs: int,
+    min_length: int = 5000,
+    max_length: int = 500000,
+) -> List[Tuple[str, int]]:
+    contigs = []
+    for g in range(ngenomes):
+        for c in range(ncontigs):
+            length = rng.randint(min_length, max_length)
+            contigs.append((f"genome{g}.contig{c}", length))
+    return contigs
+
+
+def write_paf(
+    handle: TextIO,
+    rng: random.Random,
+    contigs: List[Tuple[str, int]],
+    nrecords: int,
+    prop_self: float = 0.05,
+    sorted_by_query: bool = False,
+):
+    """ Write an all-vs-all style PAF with random alignments.
+
+    If sorted_by_query, each pair of sequences is only aligned one way
+    round, with the query's name first, like minimap2 -X. Sorting by query
+    then means that no sequence appears as a target after its own block
+    of queries, as ppg repeats --sorted needs.
+    """
+
+    records = []
+    for _ in range(nrecords):
+        query, qlen = rng.choice(contigs)
+        if rng.random() < prop_self:
+            target, tlen = query, qlen
+        else:
+            target, tlen = rng.choice(contigs)
+
+        alilen = rng.randint(100, min(qlen, tlen, 20000))
+        qstart = rng.randint(0, qlen - alilen)
+        tstart = rng.randint(0, tlen - alilen)
+        nmatch = rng.randint(alilen // 2, alilen)
+        strand = rng.choice("+-")
+        mq = rng.randint(0, 60)
+
+        if sorted_by_query and target < query:
+            query, qlen, qstart, target, tlen, tstart = \
+                target, tlen, tstart, query, qlen, qstart
+
+        line = (
+            f"{query}\t{qlen}\t{qstart}\t{qstart + alilen}\t{strand}\t"
+            f"{target}\t{tlen}\t{tstart}\t{tstart + alilen}\t"
+            f"{nmatch}\t{alilen}\t{mq}\ttp:A:P\tcm:i:{alilen // 50}"
+        )
+
+        if sorted_by_query:
+            records.append((query, qstart, line))
+        else:
+            print(line, file=handle)
+
+    if sorted_by_query:
+        records.sort()
+        for _, _, line in records:
+            print(line, file=handle)
+    return
+
+
+def write_bed(
+    handle: TextIO,
+    rng: random.Random,
+    contigs: List[Tuple[str, int]],
+    repeat_density: float = 0.2,
+    mean_repeat_length: int = 2000,
+):
+    """ Write sorted repeat regions covering roughly `repeat_density`. """
+
+    for seqid, length in sorted(contigs):
+        nrepeats = int(length * repeat_density / mean_repeat_length)
+        starts = sorted(rng.randint(0, length - 1) for _ in range(nrepeats))
+        for start in starts:
+            rlength = rng.randint(1, 2 * mean_repeat_length)
+            end = min(start + rlength, length)
+            print(f"{seqid}\t{start}\t{end}", file=handle)
+    return
+
+
+def write_fasta(
+    handle: TextIO,
+    rng: random.Random,
+    contigs: List[Tuple[str, int]],
+    repeat_density: float = 0.2,
+    mean_repeat_length: int = 2000,
+    width: int = 60,
+):
+    """ Write a softmasked fasta with the contig names and lengths. """
+
+    for seqid, length in contigs:
+        seq = bytearray(rng.choices(b"ACGT", k=length))
+        nrepeats = int(length * repeat_density / mean_repeat_length)
+        for _ in range(nrepeats):
+            start = rng.randint(0, length - 1)
+            end = min(start + rng.randint(1, 2 * mean_repeat_length), length)
+            seq[start:end] = seq[start:end].lower()
+
+        print(f">{seqid} synthetic", file=handle)
+        for i in range(0, length, width):
+            print(seq[i: i + width].decode(), file=handle)
+    return
+
+
+def write_clusters(
+    handle: TextIO,
+    rng: random.Random,
+    contigs: List[Tuple[str, int]],
+    mean_cluster_size: int = 5,
+):
+    """ Write a clusters tsv like ppg cluster does, with random clusters. """
+
+    nclusters = max(1, len(contigs) // mean_cluster_size)
+    for seqid, _ in contigs:
+        print(f"{rng.randint(1, nclusters)}\t{seqid}", file=handle)
+    return
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Generate synthetic PAF, BED, FASTA and cluster files."
+    )
+
+    parser.add_argument(
+        "kind",
+        choices=["paf", "bed", "fasta", "clusters"],
+        help="What kind of file to generate.",
+    )
+    parser.add_argument(
+        "-o", "--outfile",
+        default=sys.stdout,
+        type=argparse.FileType('w'),
+        help="Output file path. Default stdout.",
+    )
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--genomes", default=5, type=int)
+    parser.add_argument("--contigs", default=20, type=int)
+    parser.add_argument("--min-contig-length", default=5000, type=int)
+    parser.add_argument("--max-contig-length", default=500000, type=int)
+    parser.add_argument("--records", default=100000, type=int)
+    parser.add_argument("--prop-self", default=0.05, type=float)
+    parser.add_argument("--sorted", default=False, action="store_true")
+    parser.add_argument("--repeat-density", default=0.2, type=float)
+    parser.add_argument("--repeat-length", default=2000, type=int)
+    parser.add_argument("--cluster-size", default=5, type=int)
+    return parser.parse_args(args)
+
+
+def main():
+    args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    # The contigs come from their own generator so that paf, bed and fasta
+    # files generated with the same seed describe the same genomes.
+    contigs = genome_contigs(
+        random.Random(args.seed),
+        args.genomes,
+        args.contigs,
+        args.min_contig_length,
+        args.max_contig_length,
+    )
+    rng = random.Random(args.seed + 1)
+
+    if args.kind == "paf":
+        write_paf(args.outfile, rng, contigs, args.records,
+                  args.prop_self, args.sorted)
+    elif args.kind == "bed":
+        write_bed(args.outfile, rng, contigs,
+                  args.repeat_density, args.repeat_length)
+    elif args.kind == "fasta":
+        write_fasta(args.outfile, rng, contigs,
+                    args.repeat_density, args.repeat_length)
+    else:
+        write_clusters(args.outfile, rng, contigs, args.cluster_size)
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import json
+import struct
+
+from typing import Any, Dict, List
+from typing import BinaryIO
+
+import numpy as np
+
+# Arrays are aligned so that the memory mapped views are too.
+ALIGNMENT = 64
+FOOTER = struct.Struct("<Q8s")
+
+Descriptor = Dict[str, Any]
+
+
+def has_magic(path: str, magic: bytes) -> bool:
+    """ Check if a file starts with some magic bytes. """
+
+    try:
+        with open(path, "rb") as handle:
+            return handle.read(len(magic)) == magic
+    except OSError:
+        return False
+
+
+class ArrayWriter(object):
+
+    """ Write a file of aligned arrays followed by a JSON footer.
+
+    The file starts with 8 magic bytes. Each array is described by a
+    descriptor giving its offset, dtype and length, which should be put in
+    the footer so that readers can find it. The footer is followed by its
+    length and the magic bytes again, so truncated files can be detected.
+
+    Example:
+    >>> import io
+    >>> handle = io.BytesIO()
+    >>> writer = ArrayWriter(handle, b"\\x89TEST\\r\\n\\n")
+    >>> descriptor = writer.write_array(np.arange(3, dtype=np.int64))
+    >>> descriptor
+    {'offset': 64, 'dtype': '<i8', 'length': 3}
+    >>> writer.finish({"array": descriptor})
+    >>> data = np.frombuffer(handle.getvalue(), dtype=np.uint8)
+    >>> footer = read_footer(data, b"\\x89TEST\\r\\n\\n")
+    >>> read_array(data, footer["array"])
+    array([0, 1, 2])
+    """
+
+    def __init__(self, handle: BinaryIO, magic: bytes):
+        self.handle = handle
+        self.magic = magic
+        self.handle.write(magic)
+        self.position = len(magic)
+        return
+
+    def write_array(self, array: np.ndarray) -> Descriptor:
+        padding = -self.position % ALIGNMENT
+        self.handle.write(b"\0" * padding)
+        self.position += padding
+
+        array = np.ascontiguousarray(array)
+        descriptor = {
+            "offset": self.position,
+            "dtype": array.dtype.str,
+            "length": len(array),
+        }
+
+        self.handle.write(array.tobytes())
+        self.position += array.nbytes
+        return descriptor
+
+    def write_strings(self, strings: List[str]) -> Descriptor:
+        """ Write newline terminated strings as an array of bytes. """
+
+        blob = "".join(f"{s}\n" for s in strings).encode()
+        return self.write_array(np.frombuffer(blob, dtype=np.uint8))
+
+    def finish(self, footer: Dict[str, Any]):
+        footer_bytes = json.dumps(footer, separators=(",", ":")).encode()
+        self.handle.write(footer_bytes)
+        self.handle.write(FOOTER.pack(len(footer_bytes), self.magic))
+        self.position += len(footer_bytes) + FOOTER.size
+        return
+
+
+def read_footer(data: np.ndarray, magic: bytes) -> Dict[str, Any]:
+    """ Read the footer of a file written by ArrayWriter.
+
+    data is the whole file as a uint8 array, usually a memory map.
+    Raises ValueError if the file is the wrong type or is truncated.
+    """
+
+    if data[:len(magic)].tobytes() != magic:
+        raise ValueError("it has the wrong magic bytes")
+
+    try:
+        size, end_magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+        if end_magic != magic:
+            raise ValueError("missing footer")
+
+        start = len(data) - FOOTER.size - size
+        return json.loads(data[start:start + size].tobytes())
+    except (struct.error, ValueError) as e:
+        raise ValueError(f"it is truncated or corrupt ({e})")
+
+
+def read_array(data: np.ndarray, descriptor: Descriptor) -> np.ndarray:
+    """ A view of an array described by a descriptor. """
+
+    start = descriptor["offset"]
+    dtype = np.dtype(descriptor["dtype"])
+    end = start + descriptor["length"] * dtype.itemsize
+    return np.asarray(data[start:end]).view(dtype)
+
+
+def read_strings(data: np.ndarray, descriptor: Descriptor) -> List[str]:
+    blob = read_array(data, descriptor).tobytes().decode()
+    return blob.split("\n")[:-1]
@@ -1,12 +1,31 @@
+import argparse
+
 from typing import NamedTuple
 from typing import List, Sequence, Iterator, Iterable
+from typing import Optional
 from typing import Tuple
 from typing import Dict
+from typing import IO, Union
 
 from collections import defaultdict
+from collections import OrderedDict
+
+import numpy as np
 
 from intervaltree import Interval, IntervalTree
 
+from pypafgraph.intervals import IntervalSet
+from pypafgraph.files import InputFile
+from pypafgraph.errors import InputOrderError
+from pypafgraph.arrayfile import ArrayWriter, has_magic
+from pypafgraph.arrayfile import read_footer, read_array, read_strings
+
+INDEX_MAGIC = b"\x89PPGRPT\n"
+INDEX_VERSION = 1
+
+# The number of merged intervals that SortedBedRepeats keeps in memory.
+DEFAULT_WINDOW_SIZE = 2 ** 22
+
 
 class BED(NamedTuple):
 
@@ -44,3 +63,385 @@ def bed_to_itree(beds: Iterable[BED]) -> IntervalTree:
     for it in itree.values():
         it.merge_overlaps()
     return itree
+
+
+class RepeatIndex(object):
+
+    """ Merged repeat regions for many sequences, stored as flat arrays.
+
+    The merged intervals of each sequence are laid end to end in a single
+    IntervalSet, sequence i being shifted by bases[i]. This means the number
+    of repeat bases overlapping any number of intervals can be found with a
+    single searchsorted.
+
+    Example:
+    >>> index = RepeatIndex.from_beds([
+    ...     BED("a", 10, 20), BED("a", 15, 30), BED("a", 50, 60),
+    ...     BED("b", 0, 5),
+    ... ])
+    >>> rows = index.lookup(["a", "b", "c"])
+    >>> rows
+    array([ 0,  1, -1])
+    >>> index.covered(rows, np.array([0, 0, 0]), np.array([55, 100, 100]))
+    array([25,  5,  0])
+
+    The index can be saved to a file and memory mapped back in with load,
+    so it only needs to be built once for many runs.
+    """
+
+    def __init__(
+        self,
+        seqids: List[str],
+        bases: np.ndarray,
+        spans: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        cumulative: Optional[np.ndarray] = None,
+    ):
+        self.seqids = seqids
+        self.rows: Dict[str, int] = {s: i for i, s in enumerate(seqids)}
+        self.bases = bases
+        self.spans = spans
+        self.intervals = IntervalSet.from_merged(starts, ends, cumulative)
+        return
+
+    def __len__(self) -> int:
+        return len(self.seqids)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        intervals: Dict[str, Tuple[np.ndarray, np.ndarray]],
+    ) -> 'RepeatIndex':
+        return cls.from_interval_sets({
+            seqid: IntervalSet(starts, ends)
+            for seqid, (starts, ends) in intervals.items()
+        })
+
+    @classmethod
+    def from_interval_sets(
+        cls,
+        intervals: Dict[str, IntervalSet],
+    ) -> 'RepeatIndex':
+        seqids = []
+        spans = []
+        all_starts = []
+        all_ends = []
+
+        base = 0
+        for seqid, repeats in intervals.items():
+            if len(repeats) == 0:
+                continue
+
+            span = int(repeats.ends[-1])
+            seqids.append(seqid)
+            spans.append(span)
+            all_starts.append(repeats.starts + base)
+            all_ends.append(repeats.ends + base)
+            base += span
+
+        spans = np.array(spans, dtype=np.int64)
+        bases = np.concatenate([[0], np.cumsum(spans)[:-1]]).astype(np.int64)
+
+        if len(seqids) == 0:
+            all_starts = [np.zeros(0, dtype=np.int64)]
+            all_ends = [np.zeros(0, dtype=np.int64)]
+
+        return cls(
+            seqids,
+            bases,
+            spans,
+            np.concatenate(all_starts),
+            np.concatenate(all_ends),
+        )
+
+    @classmethod
+    def from_beds(cls, beds: Iterable[BED]) -> 'RepeatIndex':
+        starts: Dict[str, List[int]] = defaultdict(list)
+        ends: Dict[str, List[int]] = defaultdict(list)
+
+        for record in beds:
+            starts[record.seqid].append(record.start)
+            ends[record.seqid].append(record.end)
+
+        return cls.from_arrays({
+            s: (np.array(starts[s]), np.array(ends[s]))
+            for s in starts
+        })
+
+    def save(self, path: str):
+        """ Write the index to a file that load can memory map.
+
+        Example:
+        >>> import os, tempfile
+        >>> index = RepeatIndex.from_beds([BED("a", 10, 20), BED("b", 0, 5)])
+        >>> with tempfile.TemporaryDirectory() as tmpdir:
+        ...     path = os.path.join(tmpdir, "repeats.idx")
+        ...     index.save(path)
+        ...     loaded = RepeatIndex.load(path)
+        >>> loaded.seqids, loaded.intervals
+        (['a', 'b'], IntervalSet([(10, 20), (20, 25)]))
+        """
+
+        with open(path, "wb") as handle:
+            writer = ArrayWriter(handle, INDEX_MAGIC)
+            writer.finish({
+                "version": INDEX_VERSION,
+                "seqids": writer.write_strings(self.seqids),
+                "bases": writer.write_array(self.bases),
+                "spans": writer.write_array(self.spans),
+                "starts": writer.write_array(self.intervals.starts),
+                "ends": writer.write_array(self.intervals.ends),
+                "cumulative": writer.write_array(self.intervals.cumulative),
+            })
+        return
+
+    @classmethod
+    def load(cls, path: str) -> 'RepeatIndex':
+        """ Memory map an index written by save.
+
+        The arrays are views of the file, so nothing is parsed or copied
+        and processes using the same index share its pages.
+        """
+
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        try:
+            footer = read_footer(data, INDEX_MAGIC)
+        except ValueError as e:
+            raise ValueError(f"Can't read {path}, {e}.")
+
+        if footer["version"] != INDEX_VERSION:
+            raise ValueError(
+                f"{path} has index version {footer['version']}, "
+                f"but only version {INDEX_VERSION} is supported."
+            )
+
+        arrays = {
+            k: read_array(data, footer[k])
+            for k in ("bases", "spans", "starts", "ends", "cumulative")
+        }
+        return cls(read_strings(data, footer["seqids"]), **arrays)
+
+    def lookup(self, seqids: Sequence[str]) -> np.ndarray:
+        """ Find the row of each seqid, -1 if it has no repeats. """
+        return np.fromiter(
+            (self.rows.get(s, -1) for s in seqids),
+            dtype=np.int64,
+            count=len(seqids)
+        )
+
+    def covered(
+        self,
+        rows: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+    ) -> np.ndarray:
+        """ The number of repeat bases overlapping each interval.
+
+        rows are the index rows of the sequences that the intervals are on,
+        as returned by lookup. Intervals on rows < 0 have no repeats.
+        """
+
+        if len(self) == 0:
+            return np.zeros(len(rows), dtype=np.int64)
+
+        present = rows >= 0
+        r = np.where(present, rows, 0)
+
+        # Positions past the last repeat of a sequence are clipped to it,
+        # so that they can't run into the next sequence.
+        spans = self.spans[r]
+        bases = self.bases[r]
+        vstarts = bases + np.clip(starts, 0, spans)
+        vends = bases + np.clip(ends, 0, spans)
+
+        covered = self.intervals.overlap_lengths(vstarts, vends)
+        return np.where(present, covered, 0)
+
+
+class SortedBedRepeats(object):
+
+    """ Repeats read on demand from a coordinate sorted bed file.
+
+    The file is scanned once to find the byte range of each sequence's
+    block, then the repeats of each batch's sequences are read and merged
+    as they're needed. The most recently used sequences are kept, up to
+    window_size intervals, so with query sorted alignments each query's
+    repeats are only read once. Memory is proportional to the number of
+    sequences and the window rather than the number of repeats.
+
+    This isn't a single pass merge join, because a query sorted paf still
+    has its targets in any order, so they need random access to the bed.
+    The handle should be closed, e.g. by using this as a context manager.
+
+    It can stand in for a RepeatIndex in filter_batch. lookup loads the
+    repeats of the given sequences, and covered answers for the sequences
+    from the last lookup.
+
+    Example:
+    >>> import os, tempfile
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     path = os.path.join(tmpdir, "repeats.bed")
+    ...     with open(path, "w") as handle:
+    ...         _ = handle.write("a\\t10\\t20\\na\\t15\\t30\\nb\\t0\\t5\\n")
+    ...     with SortedBedRepeats(path) as repeats:
+    ...         rows = repeats.lookup(["b", "a", "c"])
+    ...         repeats.covered(rows, np.array([0, 0, 0]),
+    ...                         np.array([100, 25, 100]))
+    array([ 5, 15,  0])
+    """
+
+    def __init__(self, path: str, window_size: int = DEFAULT_WINDOW_SIZE):
+        self.handle = open(path, "rb")
+        self.window_size = window_size
+        try:
+            self.offsets = self._scan(self.handle, path)
+        except BaseException:
+            self.handle.close()
+            raise
+
+        self.cache: OrderedDict = OrderedDict()
+        self.ncached = 0
+        self.current = RepeatIndex.from_interval_sets({})
+        return
+
+    def __enter__(self) -> 'SortedBedRepeats':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def close(self):
+        self.handle.close()
+        return
+
+    @staticmethod
+    def _scan(handle: IO, path: str) -> Dict[str, Tuple[int, int]]:
+        """ Find the byte range of each sequence's block of repeats,
+        checking that the file is sorted.
+        """
+
+        offsets: Dict[str, Tuple[int, int]] = dict()
+        seqid = None
+        block_start = 0
+        last_start = -1
+        position = 0
+
+        for lineno, line in enumerate(handle, 1):
+            if len(line.strip()) == 0:
+                position += len(line)
+                continue
+
+            fields = line.split(b"\t", 3)
+            if fields[0] != seqid:
+                if seqid is not None:
+                    offsets[seqid.decode()] = (block_start, position)
+
+                seqid = fields[0]
+                if seqid.decode() in offsets:
+                    raise InputOrderError(
+                        f"{path} is not sorted. The repeats of "
+                        f"{seqid.decode()} are split into more than one "
+                        f"block (line {lineno})."
+                    )
+                block_start = position
+                last_start = -1
+
+            start = int(fields[1])
+            if start < last_start:
+                raise InputOrderError(
+                    f"{path} is not sorted. The repeats of {seqid.decode()} "
+                    f"aren't sorted by start (line {lineno})."
+                )
+
+            last_start = start
+            position += len(line)
+
+        if seqid is not None:
+            offsets[seqid.decode()] = (block_start, position)
+        return offsets
+
+    def _read(self, seqid: str) -> IntervalSet:
+        start, end = self.offsets[seqid]
+        self.handle.seek(start)
+        lines = self.handle.read(end - start).split(b"\n")
+        fields = [line.split(b"\t", 3) for line in lines if len(line) > 0]
+        return IntervalSet(
+            np.array([int(f[1]) for f in fields], dtype=np.int64),
+            np.array([int(f[2]) for f in fields], dtype=np.int64),
+        )
+
+    def _get(self, seqid: str) -> IntervalSet:
+        repeats = self.cache.get(seqid)
+        if repeats is not None:
+            self.cache.move_to_end(seqid)
+            return repeats
+
+        repeats = self._read(seqid)
+        self.cache[seqid] = repeats
+        self.ncached += len(repeats)
+        return repeats
+
+    def _evict(self):
+        """ Drop the least recently used sequences beyond the window. """
+
+        while self.ncached > self.window_size and len(self.cache) > 1:
+            _, repeats = self.cache.popitem(last=False)
+            self.ncached -= len(repeats)
+        return
+
+    def lookup(self, seqids: Sequence[str]) -> np.ndarray:
+        """ Load the repeats of some sequences, returning their rows as
+        RepeatIndex.lookup does.
+        """
+
+        intervals = dict()
+        for seqid in seqids:
+            if seqid in self.offsets and seqid not in intervals:
+                intervals[seqid] = self._get(seqid)
+
+        self.current = RepeatIndex.from_interval_sets(intervals)
+        self._evict()
+        return self.current.lookup(seqids)
+
+    def covered(
+        self,
+        rows: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+    ) -> np.ndarray:
+        """ The number of repeat bases overlapping each interval, for rows
+        from the last lookup.
+        """
+        return self.current.covered(rows, starts, ends)
+
+
+def is_repeat_index(path: str) -> bool:
+    """ Check if a file starts with the repeat index magic bytes. """
+    return has_magic(path, INDEX_MAGIC)
+
+
+class RepeatsInput(InputFile):
+
+    """ An argparse type for repeat inputs, which may be saved indices.
+
+    Indices are memory mapped, anything else is opened as a BED file with
+    InputFile.
+    """
+
+    def __init__(self):
+        super().__init__("r")
+        return
+
+    def __call__(self, string: str) -> Union[IO, RepeatIndex]:
+        if string == "-" or not is_repeat_index(string):
+            return super().__call__(string)
+
+        try:
+            return RepeatIndex.load(string)
+        except (OSError, ValueError) as e:
+            raise argparse.ArgumentTypeError(f"can't open '{string}': {e}")
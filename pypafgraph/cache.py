@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+from os.path import join as pjoin
+
+from typing import List, Tuple
+from typing import Optional
+
+import numpy as np
+
+from pypafgraph.clustering import CoverageTable
+
+# Bump this when the layout of a cache entry changes.
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_SIZE = 2 ** 32
+
+
+def file_key(path: str) -> str:
+    """ Identify a file by its absolute path, size and modification time.
+
+    Any change to the file gives a different key.
+    """
+
+    info = os.stat(path)
+    string = "\0".join([
+        str(CACHE_VERSION),
+        os.path.abspath(path),
+        str(info.st_size),
+        str(info.st_mtime_ns),
+    ])
+    return hashlib.sha1(string.encode()).hexdigest()
+
+
+def _entry_size(directory: str) -> int:
+    return sum(
+        entry.stat().st_size
+        for entry in os.scandir(directory)
+        if entry.is_file()
+    )
+
+
+class CoverageCache(object):
+
+    """ An on-disk cache of pairwise coverage tables, keyed by input file.
+
+    Each entry is a directory holding the sequence names and memory-mapped
+    .npy arrays of the pairs. Entries are evicted least recently used first
+    when the cache grows beyond max_size bytes.
+
+    Example:
+    >>> import tempfile
+    >>> table = CoverageTable(
+    ...     ["a", "b", "c"],
+    ...     np.array([2, 0]),
+    ...     np.array([1, 1]),
+    ...     np.array([0.1, 0.5]),
+    ... )
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     cache = CoverageCache(tmpdir)
+    ...     cache.put("key", table)
+    ...     cached = cache.get("key")
+    ...     missing = cache.get("other")
+    >>> cached.names
+    ['a', 'b', 'c']
+    >>> cached.cov.tolist()
+    [0.1, 0.5]
+    >>> missing is None
+    True
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_size: Optional[int] = DEFAULT_CACHE_SIZE,
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        return
+
+    def _path(self, key: str) -> str:
+        return pjoin(self.directory, key)
+
+    def get(self, key: str) -> Optional[CoverageTable]:
+        """ Load a cached table, or return None if there isn't one. """
+
+        path = self._path(key)
+        try:
+            with open(pjoin(path, "names.txt"), "r") as handle:
+                names = handle.read().split("\n")[:-1]
+
+            arrays = [
+                np.load(pjoin(path, f"{column}.npy"), mmap_mode="r")
+                for column in ("query", "target", "cov")
+            ]
+        except (OSError, ValueError):
+            return None
+
+        # Mark the entry as recently used. The entry may have been evicted
+        # by another run since it was loaded, or be read-only, but the
+        # arrays are already open.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return CoverageTable(names, *arrays)
+
+    def put(self, key: str, table: CoverageTable):
+        """ Store a table, then evict old entries if the cache is too big.
+
+        The entry is written to a temporary directory and renamed into place,
+        so concurrent runs never see a partial entry. Existing entries are
+        never replaced, since a key always gives the same table. If another
+        run stores the same key first, this copy is discarded.
+        """
+
+        path = self._path(key)
+        if os.path.isdir(path):
+            return
+
+        tmp = tempfile.mkdtemp(prefix=".tmp_", dir=self.directory)
+        try:
+            with open(pjoin(tmp, "names.txt"), "w") as handle:
+                for name in table.names:
+                    handle.write(f"{name}\n")
+
+            np.save(pjoin(tmp, "query.npy"), np.asarray(table.query))
+            np.save(pjoin(tmp, "target.npy"), np.asarray(table.target))
+            np.save(pjoin(tmp, "cov.npy"), np.asarray(table.cov))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        try:
+            # This fails if the entry appeared while we were writing ours.
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        self.evict(keep=key)
+        return
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """ The last access time, size and key of each entry. """
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+
+            try:
+                mtime = entry.stat().st_mtime
+                size = _entry_size(entry.path)
+            except OSError:
+                continue
+
+            entries.append((mtime, size, entry.name))
+        return entries
+
+    def evict(self, keep: Optional[str] = None):
+        """ Remove least recently used entries until under max_size. """
+
+        if self.max_size is None:
+            return
+
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, key in entries:
+            if total <= self.max_size:
+                break
+            elif key == keep:
+                continue
+
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+        return
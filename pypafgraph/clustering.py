@@ -1,77 +1,937 @@
 #!/usr/bin/env python3
 
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Callable
 from typing import Dict
 from typing import List, Iterable
 from typing import Tuple
+from typing import Optional
+from typing import NamedTuple
+from typing import TextIO
 
-from collections import defaultdict
+import numpy as np
 
-from intervaltree import Interval, IntervalTree
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
 
-import networkx as nx
+from pypafgraph.paf import PAFBatch, NameTable, QueryBlocks
+from pypafgraph.intervals import merge_keyed_intervals
+from pypafgraph.spill import SpillRuns
+from pypafgraph.parallel import get_context
+from pypafgraph.utils import grow_array
 
-from pypafgraph.paf import PAF
+# The number of buffered alignments that triggers a merge.
+DEFAULT_BUFFER_SIZE = 2 ** 20
 
 
-def paf_to_intervals(pafs: Iterable[PAF]) -> Dict[Tuple[str, str], float]:
-    """ """
+class CoverageAccumulator(object):
+
+    """ Accumulates the aligned regions of each pair of sequences.
+
+    Alignments are recorded on the shorter sequence of each pair, and are
+    kept as flat arrays of merged intervals sorted by pair. New alignments
+    are buffered and merged into these arrays as the buffer grows, so memory
+    is proportional to the merged intervals rather than the alignments.
+
+    If the input is sorted by query, a pair is finalised to a single
+    coverage value as soon as both of its sequences have been passed as
+    queries. Only the pairs of the queries that just ended are merged then,
+    the rest wait for the buffer to fill. If max_memory is given, partial
+    pair states are spilled to temporary files when they exceed it and
+    merged at the end.
+    """
+
+    columns = ("key", "start", "end", "first")
+
+    def __init__(
+        self,
+        sorted_by_query: bool = False,
+        max_memory: Optional[int] = None,
+        tmpdir: Optional[str] = None,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+    ):
+        self.sorted_by_query = sorted_by_query
+        self.max_memory = max_memory
+        self.buffer_size = buffer_size
+
+        self.names: Optional[NameTable] = None
+        self.lengths = np.zeros(0, dtype=np.int64)
+        self.blocks = QueryBlocks()
+        self.nrecords = 0
+
+        self._set_state(self._empty())
+        self.pending: List[Dict[str, np.ndarray]] = []
+        self.npending = 0
+
+        self.results: List[Dict[str, np.ndarray]] = []
+        self.spills = SpillRuns(tmpdir)
+        self.spilled_keys = np.zeros(0, dtype=np.int64)
+        return
+
+    @classmethod
+    def _empty(cls) -> Dict[str, np.ndarray]:
+        return {c: np.zeros(0, dtype=np.int64) for c in cls.columns}
+
+    @staticmethod
+    def _nbytes(columns: Dict[str, np.ndarray]) -> int:
+        return sum(v.nbytes for v in columns.values())
+
+    def nbytes(self) -> int:
+        """ An estimate of the memory used by the pair states. """
+        return (self._nbytes(self.state) +
+                sum(self._nbytes(p) for p in self.pending))
+
+    def add(self, batch: PAFBatch):
+        """ Record the alignments in a batch. """
+
+        self.names = batch.names
+        nnames = len(batch.names)
+        self.lengths = grow_array(self.lengths, nnames)
+
+        self.lengths[batch.query] = batch.qlen
+        self.lengths[batch.target] = batch.tlen
+
+        ended = np.zeros(0, dtype=np.int64)
+        if self.sorted_by_query:
+            # Marks the queries that won't be seen again as finished.
+            ended, _ = self.blocks.update(batch.query, nnames)
+
+        # Intervals are taken from the shorter sequence, ties are broken by
+        # taking the sequence with the lowest name.
+        use_query = batch.qlen < batch.tlen
+        names = batch.names
+        for i in (batch.qlen == batch.tlen).nonzero()[0].tolist():
+            use_query[i] = names[batch.query[i]] < names[batch.target[i]]
+
+        qstarts, qends = batch.query_intervals()
+        tstarts, tends = batch.target_intervals()
+        firsts = np.where(use_query, batch.query, batch.target)
+        seconds = np.where(use_query, batch.target, batch.query)
+        rows = np.arange(self.nrecords, self.nrecords + len(batch))
+        self.nrecords += len(batch)
+
+        distinct = firsts != seconds
+        self.pending.append({
+            "key": self._key(firsts[distinct], seconds[distinct]),
+            "start": np.where(use_query, qstarts, tstarts)[distinct],
+            "end": np.where(use_query, qends, tends)[distinct],
+            "first": rows[distinct],
+        })
+        self.npending += int(distinct.sum())
+
+        if len(ended) > 0:
+            self._finish_pairs(ended)
+
+        if self.npending >= max(self.buffer_size, len(self.state["key"])):
+            self.compact()
+
+        if self.max_memory is not None and self.nbytes() > self.max_memory:
+            self.spill()
+        return
+
+    @staticmethod
+    def _key(firsts: np.ndarray, seconds: np.ndarray) -> np.ndarray:
+        return (firsts.astype(np.int64) << 32) | seconds.astype(np.int64)
+
+    @staticmethod
+    def _unkey(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return keys >> 32, keys & 0xFFFFFFFF
+
+    @staticmethod
+    def _merge(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """ Merge the intervals of each pair, keeping the earliest row. """
+
+        keys = columns["key"]
+        if len(keys) == 0:
+            return columns
+
+        order = np.argsort(keys, kind="stable")
+        ukeys, group_starts = np.unique(keys[order], return_index=True)
+        group_first = np.minimum.reduceat(columns["first"][order],
+                                          group_starts)
+
+        mkeys, mstarts, mends = merge_keyed_intervals(
+            keys,
+            columns["start"],
+            columns["end"],
+            strict=False,
+        )
+
+        # Empty intervals are dropped, so some pairs may have no runs left.
+        # Those are kept as a single empty run so that they still get a
+        # coverage of 0.
+        missing = np.setdiff1d(ukeys, mkeys, assume_unique=True)
+        if len(missing) > 0:
+            mkeys = np.concatenate([mkeys, missing])
+            mstarts = np.concatenate([mstarts, np.zeros_like(missing)])
+            mends = np.concatenate([mends, np.zeros_like(missing)])
+            order = np.argsort(mkeys, kind="stable")
+            mkeys, mstarts, mends = mkeys[order], mstarts[order], mends[order]
+
+        index = np.searchsorted(ukeys, mkeys)
+        return {
+            "key": mkeys,
+            "start": mstarts,
+            "end": mends,
+            "first": group_first[index],
+        }
+
+    def _concatenate(
+        self,
+        columns: List[Dict[str, np.ndarray]]
+    ) -> Dict[str, np.ndarray]:
+        return {
+            c: np.concatenate([p[c] for p in columns])
+            for c in self.columns
+        }
+
+    def _set_state(self, state: Dict[str, np.ndarray]):
+        self.state = state
+        self.stale = np.zeros(len(state["key"]), dtype=bool)
+
+        # The state is sorted by key, so by first sequence. Finding the
+        # pairs of a sequence that came second needs another order.
+        if self.sorted_by_query:
+            _, seconds = self._unkey(state["key"])
+            self.by_second = np.argsort(seconds, kind="stable")
+            self.sorted_seconds = seconds[self.by_second]
+        return
+
+    def _finish_pairs(self, ended: np.ndarray):
+        """ Finalise the pairs that the queries that just ended completed.
+
+        A pair is completed by whichever of its sequences ends last, so
+        only the pairs of the ended sequences need to be looked at. They're
+        marked as stale in the state, and dropped at the next compaction.
+        Pairs with spilled states are finalised when the spills are merged.
+        """
+
+        finished = self.blocks.finished
+        parts = []
+
+        pending = []
+        for chunk in self.pending:
+            # Earlier pairs were finalised when they were completed, so
+            # every completed pair in the buffer is new.
+            firsts, seconds = self._unkey(chunk["key"])
+            done = (
+                finished[firsts] &
+                finished[seconds] &
+                ~np.isin(chunk["key"], self.spilled_keys)
+            )
+            if np.any(done):
+                parts.append({c: v[done] for c, v in chunk.items()})
+                chunk = {c: v[~done] for c, v in chunk.items()}
+            pending.append(chunk)
+
+        self.pending = pending
+        self.npending = sum(len(chunk["key"]) for chunk in pending)
+
+        # Each ended sequence's pairs are a slice of the state when it came
+        # first, and of the second order when it came second.
+        ended = ended.astype(np.int64)
+        keys = self.state["key"]
+        as_first = self._slices(
+            np.searchsorted(keys, ended << 32),
+            np.searchsorted(keys, (ended + 1) << 32),
+        )
+        as_second = self.by_second[self._slices(
+            np.searchsorted(self.sorted_seconds, ended, side="left"),
+            np.searchsorted(self.sorted_seconds, ended, side="right"),
+        )]
+
+        index = np.union1d(as_first, as_second)
+        firsts, seconds = self._unkey(keys[index])
+        done = (
+            finished[firsts] &
+            finished[seconds] &
+            ~self.stale[index] &
+            ~np.isin(keys[index], self.spilled_keys)
+        )
+        index = index[done]
+        self.stale[index] = True
+        parts.append({c: v[index] for c, v in self.state.items()})
+
+        self._finalise(self._merge(self._concatenate(parts)))
+        return
+
+    @staticmethod
+    def _slices(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """ The indices in all of the slices lo[i]:hi[i]. """
 
-    pairwise_intervals: Dict[Tuple[str, str], List[Interval]] = defaultdict(list)  # noqa
-    lengths: Dict[str, int] = dict()
-
-    for paf in pafs:
-        if paf.query == paf.target:
-            continue
-
-        lengths[paf.query] = paf.qlen
-        lengths[paf.target] = paf.tlen
-
-        if paf.qlen < paf.tlen:
-            _, interval = paf.query_as_interval()
-            id_ = (paf.query, paf.target)
-        elif paf.tlen < paf.qlen:
-            _, interval = paf.target_as_interval()
-            id_ = (paf.target, paf.query)
-        elif paf.query < paf.target:
-            _, interval = paf.query_as_interval()
-            id_ = (paf.query, paf.target)
+        sizes = hi - lo
+        offsets = np.cumsum(sizes) - sizes
+        return np.arange(sizes.sum()) + np.repeat(lo - offsets, sizes)
+
+    def compact(self):
+        """ Merge the buffered alignments into the pair states. """
+
+        state = self.state
+        if np.any(self.stale):
+            state = {c: v[~self.stale] for c, v in state.items()}
+
+        self._set_state(self._merge(self._concatenate([state] + self.pending)))
+        self.pending = []
+        self.npending = 0
+        return
+
+    def spill(self):
+        """ Write the pair states out to a temporary file. """
+
+        self.compact()
+        if len(self.state["key"]) > 0:
+            self.spills.write(self.state)
+            self.spilled_keys = np.union1d(self.spilled_keys,
+                                           self.state["key"])
+        self._set_state(self._empty())
+        return
+
+    def _finalise(self, state: Dict[str, np.ndarray]):
+        """ Convert merged pair states to coverages. """
+
+        keys = state["key"]
+        if len(keys) == 0:
+            return
+
+        _, group_starts = np.unique(keys, return_index=True)
+        covered = np.add.reduceat(state["end"] - state["start"], group_starts)
+        firsts, seconds = self._unkey(keys[group_starts])
+
+        self.results.append({
+            "query": firsts,
+            "target": seconds,
+            "cov": covered / self.lengths[firsts],
+            "first": state["first"][group_starts],
+        })
+        return
+
+    def finish(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ Get the query ids, target ids and coverages of every pair.
+
+        The query is the shorter sequence of the pair, and pairs are
+        ordered by the first alignment between them.
+        """
+
+        self.compact()
+
+        if len(self.spills) > 0:
+            self.spill()
+            for window in self.spills.windows():
+                self._finalise(self._merge(window))
+            self.spills.close()
         else:
-            _, interval = paf.target_as_interval()
-            id_ = (paf.target, paf.query)
+            self._finalise(self.state)
 
-        pairwise_intervals[id_].append(interval)
+        self._set_state(self._empty())
 
-    pairwise_covs: Dict[Tuple[str, str], float] = dict()
+        if len(self.results) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float64)
+
+        results = {
+            c: np.concatenate([r[c] for r in self.results])
+            for c in ("query", "target", "cov", "first")
+        }
+        self.results = []
+
+        order = np.argsort(results["first"], kind="stable")
+        return (
+            results["query"][order],
+            results["target"][order],
+            results["cov"][order],
+        )
+
+
+class CoverageGraph(NamedTuple):
+
+    """ A symmetric sparse matrix of coverages between sequences.
+
+    names[i] is the sequence for row and column i of the matrix.
+    """
+
+    matrix: sparse.csr_matrix
+    names: List[str]
+
+    def to_networkx(self, G: 'nx.Graph' = None) -> 'nx.Graph':
+        import networkx as nx
+
+        if G is None:
+            G = nx.Graph()
+
+        coo = sparse.triu(self.matrix, format="coo")
+        names = self.names
+        for i, j, cov in zip(coo.row.tolist(), coo.col.tolist(),
+                             coo.data.tolist()):
+            G.add_edge(names[i], names[j], weight=cov)
+        return G
+
+
+class CoverageTable(NamedTuple):
+
+    """ The coverage of each pair of sequences with alignments.
+
+    query and target are ids into names, query being the shorter sequence.
+    Pairs are ordered by the first alignment between them.
+    """
+
+    names: List[str]
+    query: np.ndarray
+    target: np.ndarray
+    cov: np.ndarray
+
+    def to_graph(self, min_cov: float = 0.0) -> CoverageGraph:
+        """ Build a sparse graph from the pairs with at least min_cov.
+
+        Nodes are numbered in the order that they first appear in the
+        table, which is the same order networkx would give them.
+
+        Example:
+        >>> table = CoverageTable(
+        ...     ["a", "b", "c"],
+        ...     np.array([2, 0]),
+        ...     np.array([1, 1]),
+        ...     np.array([0.1, 0.5]),
+        ... )
+        >>> graph = table.to_graph(min_cov=0.2)
+        >>> graph.names
+        ['a', 'b']
+        >>> graph.matrix.toarray()
+        array([[0. , 0.5],
+               [0.5, 0. ]])
+        """
+
+        keep = self.cov >= min_cov
+        query = self.query[keep]
+        target = self.target[keep]
+        cov = self.cov[keep]
+
+        nodes = np.stack([query, target], axis=1).ravel()
+        ids, first, inverse = np.unique(
+            nodes,
+            return_index=True,
+            return_inverse=True
+        )
+
+        # Renumber the nodes by their first appearance.
+        order = np.argsort(first, kind="stable")
+        rank = np.empty(len(ids), dtype=np.int64)
+        rank[order] = np.arange(len(ids))
+        nodes = rank[inverse.ravel()].reshape(-1, 2)
+
+        matrix = sparse.coo_matrix(
+            (
+                np.concatenate([cov, cov]),
+                (np.concatenate([nodes[:, 0], nodes[:, 1]]),
+                 np.concatenate([nodes[:, 1], nodes[:, 0]])),
+            ),
+            shape=(len(ids), len(ids)),
+            dtype=np.float64,
+        ).tocsr()
+
+        names = [self.names[i] for i in ids[order].tolist()]
+        return CoverageGraph(matrix, names)
+
+
+def pairwise_coverage(
+    pafs: Iterable[PAFBatch],
+    sorted_by_query: bool = False,
+    max_memory: Optional[int] = None,
+    tmpdir: Optional[str] = None,
+) -> CoverageTable:
+    """ Find the proportion of the shorter sequence covered by alignments
+    for each pair of sequences.
+    """
+
+    accumulator = CoverageAccumulator(sorted_by_query, max_memory, tmpdir)
+    for batch in pafs:
+        accumulator.add(batch)
+
+    queries, targets, covs = accumulator.finish()
+
+    if accumulator.names is None:
+        names: List[str] = []
+    else:
+        names = accumulator.names.names
+
+    return CoverageTable(names, queries, targets, covs)
 
-    for (query, target), intervals in pairwise_intervals.items():
-        itree = IntervalTree(intervals)
-        itree.merge_overlaps()
 
-        ali_length = 0
-        for interval in itree:
-            ali_length += interval.length()
+def paf_to_intervals(
+    pafs: Iterable[PAFBatch],
+    sorted_by_query: bool = False,
+    max_memory: Optional[int] = None,
+    tmpdir: Optional[str] = None,
+) -> Dict[Tuple[str, str], float]:
+    """ Find the proportion of the shorter sequence covered by alignments
+    for each pair of sequences.
+    """
 
-        contig_length = lengths[query]
-        cov = ali_length / contig_length
-        pairwise_covs[(query, target)] = cov
+    table = pairwise_coverage(pafs, sorted_by_query, max_memory, tmpdir)
+    names = table.names
+
+    pairwise_covs: Dict[Tuple[str, str], float] = dict()
+    for query, target, cov in zip(table.query.tolist(),
+                                  table.target.tolist(),
+                                  table.cov.tolist()):
+        pairwise_covs[(names[query], names[target])] = cov
 
     return pairwise_covs
 
 
+def paf_to_matrix(
+    pafs: Iterable[PAFBatch],
+    min_cov: float = 0.0,
+    sorted_by_query: bool = False,
+    max_memory: Optional[int] = None,
+    tmpdir: Optional[str] = None,
+) -> CoverageGraph:
+    """ Build a sparse coverage graph without going through networkx. """
+
+    table = pairwise_coverage(pafs, sorted_by_query, max_memory, tmpdir)
+    return table.to_graph(min_cov)
+
+
 def paf_to_graph(
-    pafs: Iterable[PAF],
+    pafs: Iterable[PAFBatch],
     min_cov: float = 0.0,
-    G: nx.Graph = None
-) -> nx.Graph:
+    G: 'nx.Graph' = None,
+    sorted_by_query: bool = False,
+    max_memory: Optional[int] = None,
+    tmpdir: Optional[str] = None,
+) -> 'nx.Graph':
     """ """
 
+    import networkx as nx
+
     if G is None:
         G = nx.Graph()
 
-    covs = paf_to_intervals(pafs)
+    covs = paf_to_intervals(pafs, sorted_by_query, max_memory, tmpdir)
 
     for (query, target), cov in covs.items():
         if cov >= min_cov:
             G.add_edge(query, target, weight=cov)
 
     return G
+
+
+def _normalise_columns(matrix: sparse.csc_matrix) -> sparse.csc_matrix:
+    """ Scale each column of a CSC matrix to sum to 1. """
+
+    sums = np.asarray(matrix.sum(axis=0)).ravel()
+    sums[sums == 0] = 1
+    counts = np.diff(matrix.indptr)
+    matrix.data /= np.repeat(sums, counts)
+    return matrix
+
+
+def _expand(
+    matrix: sparse.csc_matrix,
+    power: int,
+    executor: Optional[ThreadPoolExecutor] = None,
+    nblocks: int = 1,
+) -> sparse.csc_matrix:
+    """ Raise a matrix to an integer power.
+
+    Each column block of the result is multiplied by the original matrix
+    power - 1 times. Given an executor, the blocks are multiplied in
+    separate threads.
+    """
+
+    ncols = matrix.shape[1]
+    bounds = np.linspace(0, ncols, nblocks + 1).astype(int)
+    blocks = [
+        matrix[:, start:end]
+        for start, end in zip(bounds[:-1], bounds[1:])
+        if end > start
+    ]
+    left = matrix.tocsr()
+
+    result = blocks
+    for _ in range(power - 1):
+        if executor is None or len(result) == 1:
+            result = [(left @ b).tocsc() for b in result]
+        else:
+            result = list(executor.map(lambda b: (left @ b).tocsc(), result))
+
+    if len(result) == 1:
+        return result[0].tocsc()
+    return sparse.hstack(result, format="csc")
+
+
+def _prune(
+    matrix: sparse.csc_matrix,
+    threshold: float,
+    select: int,
+    recover: int,
+    recover_pct: float,
+) -> sparse.csc_matrix:
+    """ Remove small entries from each column, like mcl's -P, -S and -R.
+
+    Entries below threshold are removed. If that leaves less than
+    recover_pct of a column's mass, the largest recover entries are kept
+    instead. Finally at most select entries are kept in each column.
+    The largest entry of a column is never removed.
+    """
+
+    matrix.sum_duplicates()
+    ncols = matrix.shape[1]
+    counts = np.diff(matrix.indptr)
+    cols = np.repeat(np.arange(ncols), counts)
+    data = matrix.data
+
+    above = data >= threshold
+    nabove = np.bincount(cols, weights=above, minlength=ncols).astype(int)
+    mass = np.bincount(cols, weights=np.where(above, data, 0),
+                       minlength=ncols)
+
+    nkeep = np.maximum(nabove, 1)
+    recovering = (mass < recover_pct) & (nabove < recover)
+    nkeep[recovering] = np.minimum(recover, counts[recovering])
+    nkeep = np.minimum(nkeep, max(select, 1))
+
+    # Most columns just keep the entries above the threshold, only the
+    # others need their entries ranked.
+    ranked = (nkeep != nabove) & (counts > 0)
+    keep = above & ~ranked[cols]
+
+    selected = np.flatnonzero(ranked[cols])
+    if len(selected) > 0:
+        order = np.argsort(-data[selected], kind="stable")
+        order = order[np.argsort(cols[selected][order], kind="stable")]
+        selected = selected[order]
+
+        # selected is now grouped by column, largest entries first.
+        scols = cols[selected]
+        group_starts = np.flatnonzero(np.diff(scols)) + 1
+        group_starts = np.concatenate([[0], group_starts])
+        rank = np.arange(len(selected)) - np.repeat(
+            group_starts,
+            np.diff(np.concatenate([group_starts, [len(selected)]]))
+        )
+        keep[selected[rank < nkeep[scols]]] = True
+
+    kept_counts = np.bincount(cols[keep], minlength=ncols)
+    indptr = np.concatenate([[0], np.cumsum(kept_counts)])
+
+    pruned = sparse.csc_matrix(
+        (data[keep], matrix.indices[keep], indptr),
+        shape=matrix.shape
+    )
+    return _normalise_columns(pruned)
+
+
+def _chaos(matrix: sparse.csc_matrix) -> float:
+    """ How far the columns are from being idempotent, as in mcl.
+
+    For each column this is (max - sum of squares) * number of entries,
+    which is 0 when all entries of the column are equal.
+    """
+
+    counts = np.diff(matrix.indptr)
+    nonempty = counts > 0
+    if not np.any(nonempty):
+        return 0.0
+
+    starts = matrix.indptr[:-1][nonempty]
+    maxes = np.maximum.reduceat(matrix.data, starts)
+    sumsq = np.add.reduceat(matrix.data ** 2, starts)
+    return float(np.max((maxes - sumsq) * counts[nonempty]))
+
+
+def mcl(
+    matrix: sparse.spmatrix,
+    expansion: int = 2,
+    inflation: float = 2.0,
+    loop_value: float = 1.0,
+    iterations: int = 100,
+    pruning_threshold: float = 1 / 4000,
+    select: int = 500,
+    recover: int = 600,
+    recover_pct: float = 0.9,
+    chaos_threshold: float = 1e-4,
+    threads: int = 1,
+    log: Optional[TextIO] = None,
+) -> sparse.csc_matrix:
+    """ Markov clustering of a sparse similarity matrix.
+
+    The pruning parameters follow the reference mcl implementation (-P, -S,
+    -R and -pct). Iterations stop when the chaos falls below
+    chaos_threshold. If log is given, the time, number of non-zero entries
+    and chaos of each iteration are written to it.
+
+    Example:
+    >>> matrix = sparse.csr_matrix(np.array([
+    ...     [0, 1, 1, 0, 0],
+    ...     [1, 0, 1, 0, 0],
+    ...     [1, 1, 0, 0, 0],
+    ...     [0, 0, 0, 0, 1],
+    ...     [0, 0, 0, 1, 0],
+    ... ], dtype=float))
+    >>> get_clusters(mcl(matrix))
+    [(0, 1, 2), (3, 4)]
+    """
+
+    if expansion < 2:
+        raise ValueError("The expansion parameter must be at least 2.")
+
+    if inflation <= 1:
+        raise ValueError("The inflation parameter must be greater than 1.")
+
+    matrix = sparse.csc_matrix(matrix, dtype=np.float64, copy=True)
+    if loop_value > 0:
+        matrix.setdiag(loop_value)
+    matrix.eliminate_zeros()
+    matrix = _normalise_columns(matrix)
+
+    executor = ThreadPoolExecutor(threads) if threads > 1 else None
+    try:
+        for i in range(1, iterations + 1):
+            start = time.perf_counter()
+
+            matrix = _expand(matrix, expansion, executor, threads)
+            matrix.data **= inflation
+            matrix = _prune(
+                _normalise_columns(matrix),
+                pruning_threshold,
+                select,
+                recover,
+                recover_pct
+            )
+            chaos = _chaos(matrix)
+
+            if log is not None:
+                elapsed = time.perf_counter() - start
+                print(
+                    f"iteration {i}\tseconds {elapsed:.3f}\t"
+                    f"nnz {matrix.nnz}\tchaos {chaos:.6g}",
+                    file=log
+                )
+
+            if chaos < chaos_threshold:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return matrix
+
+
+def get_clusters(matrix: sparse.spmatrix) -> List[Tuple[int, ...]]:
+    """ Get the clusters from an MCL result, as markov_clustering does.
+
+    The attractors are the nodes with a non-zero diagonal, and each cluster
+    is the set of nodes in an attractor's row.
+    """
+
+    matrix = sparse.csr_matrix(matrix)
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    attractors = matrix.diagonal().nonzero()[0]
+
+    clusters = set()
+    for attractor in attractors.tolist():
+        start, end = matrix.indptr[attractor], matrix.indptr[attractor + 1]
+        clusters.add(tuple(matrix.indices[start:end].tolist()))
+
+    return sorted(clusters)
+
+
+def mcl_clusters(
+    matrix: sparse.spmatrix,
+    engine: str = "markov_clustering",
+    expansion: int = 2,
+    inflation: float = 2.0,
+    iterations: int = 100,
+    threads: int = 1,
+    verbose: bool = False,
+    **kwargs
+) -> List[Tuple[int, ...]]:
+    """ Run MCL with either engine and return the clusters.
+
+    Additional keyword arguments are passed to the native engine.
+    """
+
+    if engine == "native":
+        result = mcl(
+            matrix,
+            expansion=expansion,
+            inflation=inflation,
+            iterations=iterations,
+            threads=threads,
+            log=sys.stderr if verbose else None,
+            **kwargs
+        )
+        return get_clusters(result)
+
+    elif engine == "markov_clustering":
+        import markov_clustering as mc
+        result = mc.run_mcl(
+            matrix,
+            expansion=expansion,
+            inflation=inflation,
+            iterations=iterations,
+        )
+        return mc.get_clusters(result)
+
+    else:
+        raise ValueError(f"Unknown MCL engine {engine}.")
+
+
+def _cluster_component(
+    cluster_func: Callable[..., List[Tuple[int, ...]]],
+    matrix: sparse.spmatrix,
+    nodes: np.ndarray,
+    threads: int,
+) -> List[Tuple[int, ...]]:
+    """ Cluster a subgraph, and map the clusters back to the full graph. """
+
+    clusters = cluster_func(matrix, threads=threads)
+    return [tuple(sorted(nodes[list(c)].tolist())) for c in clusters]
+
+
+def _pack_components(
+    components: List[np.ndarray],
+    block_size: int,
+) -> List[np.ndarray]:
+    """ Group components into blocks of roughly block_size nodes.
+
+    Components larger than block_size get a block of their own.
+    """
+
+    blocks = []
+    current: List[np.ndarray] = []
+    current_size = 0
+
+    for component in sorted(components, key=len, reverse=True):
+        current.append(component)
+        current_size += len(component)
+
+        if current_size >= block_size:
+            blocks.append(np.concatenate(current))
+            current = []
+            current_size = 0
+
+    if len(current) > 0:
+        blocks.append(np.concatenate(current))
+    return blocks
+
+
+def cluster_components(
+    matrix: sparse.spmatrix,
+    cluster_func: Callable[..., List[Tuple[int, ...]]],
+    min_size: int = 2,
+    block_size: int = 2000,
+    threads: int = 1,
+) -> List[Tuple[int, ...]]:
+    """ Cluster the connected components of a graph separately.
+
+    Components with fewer than min_size nodes are taken as a cluster as
+    they are. MCL always leaves a single node as its own cluster, but it
+    can split a weakly linked pair, so only the default of 2 gives exactly
+    the MCL result. The rest are packed into blocks of about block_size nodes,
+    and each block is passed to cluster_func(matrix, threads=n).
+    MCL never moves flow between components, so clustering a block gives
+    the same result as clustering the whole graph.
+    Blocks are clustered in worker processes if there is more than one of
+    them and threads > 1.
+    Clusters are sorted as markov_clustering.get_clusters sorts them.
+
+    Example:
+    >>> from functools import partial
+    >>> matrix = sparse.csr_matrix(np.array([
+    ...     [0, 1, 0, 0, 0],
+    ...     [1, 0, 0, 0, 0],
+    ...     [0, 0, 0, 1, 1],
+    ...     [0, 0, 1, 0, 1],
+    ...     [0, 0, 1, 1, 0],
+    ... ], dtype=float))
+    >>> cluster_components(matrix, partial(mcl_clusters, engine="native"))
+    [(0, 1), (2, 3, 4)]
+    """
+
+    matrix = sparse.csr_matrix(matrix)
+    ncomponents, labels = connected_components(matrix, directed=False)
+
+    order = np.argsort(labels, kind="stable")
+    sizes = np.bincount(labels, minlength=ncomponents)
+    components = np.split(order, np.cumsum(sizes)[:-1])
+
+    clusters: List[Tuple[int, ...]] = [
+        tuple(c.tolist())
+        for c in components
+        if len(c) < min_size
+    ]
+
+    # The largest blocks come first so that the workers stay busy.
+    blocks = _pack_components(
+        [c for c in components if len(c) >= min_size],
+        block_size
+    )
+
+    if threads > 1 and len(blocks) > 1:
+        tasks = [(cluster_func, matrix[b][:, b], b, 1) for b in blocks]
+        with get_context().Pool(min(threads, len(blocks))) as pool:
+            for result in pool.starmap(_cluster_component, tasks):
+                clusters.extend(result)
+    else:
+        for b in blocks:
+            clusters.extend(_cluster_component(
+                cluster_func,
+                matrix[b][:, b],
+                b,
+                threads
+            ))
+
+    return sorted(set(clusters))
+
+
+def modularity(
+    matrix: sparse.spmatrix,
+    clusters: List[Tuple[int, ...]],
+) -> float:
+    """ The weighted Newman modularity of a clustering.
+
+    Nodes in more than one cluster count towards the first one only.
+
+    Example:
+    >>> matrix = sparse.csr_matrix(np.array([
+    ...     [0, 1, 0, 0],
+    ...     [1, 0, 0, 0],
+    ...     [0, 0, 0, 1],
+    ...     [0, 0, 1, 0],
+    ... ], dtype=float))
+    >>> modularity(matrix, [(0, 1), (2, 3)])
+    0.5
+    >>> modularity(matrix, [(0, 1, 2, 3)])
+    0.0
+    """
+
+    matrix = sparse.coo_matrix(matrix)
+    total = matrix.sum()
+    if total == 0:
+        return 0.0
+
+    labels = np.full(matrix.shape[0], -1, dtype=np.int64)
+    for i, cluster in reversed(list(enumerate(clusters))):
+        labels[list(cluster)] = i
+
+    # Unclustered nodes each get their own label.
+    missing = labels < 0
+    labels[missing] = len(clusters) + np.arange(missing.sum())
+    nlabels = len(clusters) + int(missing.sum())
+
+    degree = np.asarray(matrix.sum(axis=1)).ravel()
+    within = labels[matrix.row] == labels[matrix.col]
+
+    inside = np.bincount(
+        labels[matrix.row[within]],
+        weights=matrix.data[within],
+        minlength=nlabels
+    )
+    degrees = np.bincount(labels, weights=degree, minlength=nlabels)
+    return float(np.sum(inside / total - (degrees / total) ** 2))
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+
+from typing import Any, Dict, List
+from typing import Iterable, Iterator
+from typing import Optional, Tuple
+from typing import BinaryIO, IO
+
+import numpy as np
+
+from pypafgraph.paf import PAF, PAFBatch, NameTable, ColumnRanges
+from pypafgraph.paf import NON_INT_COLUMNS
+from pypafgraph.files import InputFile
+from pypafgraph.arrayfile import ArrayWriter, Descriptor, has_magic
+from pypafgraph.arrayfile import read_footer, read_array, read_strings
+
+MAGIC = b"\x89PPGPAF\n"
+FORMAT_VERSION = 1
+
+INT_COLUMNS = tuple(c for c in PAF.columns() if c not in NON_INT_COLUMNS)
+STAT_COLUMNS = ("query", "target") + INT_COLUMNS
+UINT_TYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+
+def is_columnar(path: str) -> bool:
+    """ Check if a file starts with the columnar PAF magic bytes. """
+    return has_magic(path, MAGIC)
+
+
+def smallest_uint(array: np.ndarray) -> np.ndarray:
+    """ Store non-negative integers in the narrowest type that fits.
+
+    Example:
+    >>> smallest_uint(np.array([0, 255])).dtype
+    dtype('uint8')
+    >>> smallest_uint(np.array([0, 70000])).dtype
+    dtype('uint32')
+    """
+
+    maximum = int(array.max()) if len(array) > 0 else 0
+    for dtype in UINT_TYPES:
+        if maximum <= np.iinfo(dtype).max:
+            return array.astype(dtype)
+    raise ValueError("Integer column is too large to store.")
+
+
+class ColumnarWriter(object):
+
+    """ Write PAF batches to the columnar format.
+
+    The file is a series of aligned arrays followed by a JSON footer that
+    describes where each array is. Every batch becomes a chunk, with the
+    min and max of each numeric column stored so that readers can skip
+    chunks without touching their data. The sequence names are written
+    once at the end, as ids are shared between chunks.
+    """
+
+    def __init__(self, handle: BinaryIO, tags: bool = True):
+        self.handle = handle
+        self.writer = ArrayWriter(handle, MAGIC)
+        self.tags = tags
+        self.names: Optional[NameTable] = None
+        self.chunks: List[Dict[str, Any]] = []
+        self.nrecords = 0
+        return
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def _write_array(self, array: np.ndarray) -> Descriptor:
+        return self.writer.write_array(array)
+
+    def write(self, batch: PAFBatch):
+        if self.names is None:
+            self.names = batch.names
+        elif batch.names is not self.names:
+            raise ValueError("All batches must share a single NameTable.")
+
+        if len(batch) == 0:
+            return
+
+        columns = dict()
+        stats = dict()
+        for column in STAT_COLUMNS:
+            values = getattr(batch, column)
+            stats[column] = [int(values.min()), int(values.max())]
+
+            if column in INT_COLUMNS:
+                values = smallest_uint(values)
+            columns[column] = self._write_array(values)
+
+        columns["strand"] = self._write_array(batch.strand)
+
+        tags = None
+        if self.tags:
+            data, offsets = batch.tags()
+            tags = {
+                "data": self._write_array(data),
+                "offsets": self._write_array(smallest_uint(offsets)),
+            }
+
+        self.chunks.append({
+            "nrecords": len(batch),
+            "columns": columns,
+            "stats": stats,
+            "tags": tags,
+        })
+        self.nrecords += len(batch)
+        return
+
+    def close(self):
+        if self.handle is None:
+            return
+
+        names = [] if self.names is None else self.names.names
+        self.writer.finish({
+            "version": FORMAT_VERSION,
+            "nrecords": self.nrecords,
+            "names": self.writer.write_strings(names),
+            "chunks": self.chunks,
+        })
+        self.handle.close()
+        self.handle = None
+        return
+
+
+def write_columnar(
+    path: str,
+    batches: Iterable[PAFBatch],
+    tags: bool = True,
+) -> int:
+    """ Write batches to a columnar file, returning the number of records.
+
+    Example:
+    >>> import tempfile
+    >>> batch = PAFBatch.from_lines([
+    ...     "a\\t9\\t0\\t5\\t+\\tb\\t8\\t1\\t6\\t4\\t5\\t60\\ttp:A:P\\n",
+    ...     "c\\t9\\t2\\t4\\t-\\ta\\t9\\t0\\t2\\t2\\t2\\t0\\n",
+    ... ])
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     path = os.path.join(tmpdir, "test.ppaf")
+    ...     write_columnar(path, [batch])
+    ...     with ColumnarPAF(path) as paf:
+    ...         print(paf.names.names, paf.nrecords)
+    ...         loaded = next(paf.batches())
+    ...         print(loaded.text() == batch.text(), loaded.attrs(0))
+    2
+    ['a', 'b', 'c'] 2
+    True ['tp:A:P']
+    """
+
+    with ColumnarWriter(open(path, "wb"), tags) as writer:
+        for batch in batches:
+            writer.write(batch)
+        return writer.nrecords
+
+
+class ColumnarBatch(PAFBatch):
+
+    """ A PAFBatch read from a columnar file.
+
+    There is no original text to slice, so lines are formatted from the
+    columns and stored tags when they are asked for.
+    """
+
+    def __init__(
+        self,
+        *args,
+        tag_data: Optional[np.ndarray] = None,
+        tag_offsets: Optional[np.ndarray] = None,
+    ):
+        super().__init__(*args, data=None, line_starts=None, line_ends=None)
+        self.tag_data = tag_data
+        self.tag_offsets = tag_offsets
+        self._tag_bytes: Optional[bytes] = None
+        return
+
+    def _tags(self, rows: np.ndarray) -> List[str]:
+        if self.tag_data is None:
+            return ["" for _ in range(len(rows))]
+
+        if self._tag_bytes is None:
+            self._tag_bytes = self.tag_data.tobytes()
+
+        blob = self._tag_bytes
+        starts = self.tag_offsets[rows].tolist()
+        ends = self.tag_offsets[rows + 1].tolist()
+        return [blob[s:e].decode() for s, e in zip(starts, ends)]
+
+    def _lines(self, rows: np.ndarray) -> List[str]:
+        names = self.names.names
+        columns = [
+            [names[i] for i in self.query[rows].tolist()],
+            *(map(str, getattr(self, c)[rows].tolist())
+              for c in ("qlen", "qstart", "qend")),
+            np.where(self.strand[rows], "+", "-").tolist(),
+            [names[i] for i in self.target[rows].tolist()],
+            *(map(str, getattr(self, c)[rows].tolist())
+              for c in INT_COLUMNS[3:]),
+        ]
+
+        lines = []
+        for line, tags in zip(map("\t".join, zip(*columns)),
+                              self._tags(rows)):
+            lines.append(f"{line}\t{tags}" if len(tags) > 0 else line)
+        return lines
+
+    def line(self, i: int) -> str:
+        return self._lines(np.array([i]))[0]
+
+    def text(self, mask: Optional[np.ndarray] = None) -> str:
+        if mask is None:
+            rows = np.arange(len(self))
+        else:
+            rows = np.flatnonzero(mask)
+
+        return "".join(f"{line}\n" for line in self._lines(rows))
+
+    def attrs(self, i: int) -> List[str]:
+        tags = self._tags(np.array([i]))[0]
+        return tags.split("\t") if len(tags) > 0 else []
+
+    def tags(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.tag_data is None:
+            return (np.zeros(0, dtype=np.uint8),
+                    np.zeros(len(self) + 1, dtype=np.int64))
+        return self.tag_data, self.tag_offsets
+
+
+class ColumnarPAF(object):
+
+    """ A memory mapped columnar PAF file.
+
+    Nothing is parsed when reading. The columns of each chunk are views of
+    the mapped file, and only the integer columns are widened to int64 to
+    match batches parsed from text. The mapping stays open until the last
+    view of it is gone.
+    """
+
+    def __init__(self, path: str):
+        self.name = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+
+        if self.data[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f"{path} isn't a columnar PAF file.")
+
+        try:
+            footer = read_footer(self.data, MAGIC)
+        except ValueError as e:
+            raise ValueError(f"Can't read {path}, {e}.")
+
+        if footer["version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} has format version {footer['version']}, "
+                f"but only version {FORMAT_VERSION} is supported."
+            )
+
+        self.nrecords: int = footer["nrecords"]
+        self.chunks: List[Dict[str, Any]] = footer["chunks"]
+
+        self.names = NameTable(read_strings(self.data, footer["names"]))
+        return
+
+    def __enter__(self) -> 'ColumnarPAF':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def close(self):
+        # Batches might still be using the mapping, so just drop ours.
+        self.data = np.zeros(0, dtype=np.uint8)
+        return
+
+    def _array(self, descriptor: Descriptor) -> np.ndarray:
+        return read_array(self.data, descriptor)
+
+    def chunk_ids(self, ranges: Optional[ColumnRanges] = None) -> List[int]:
+        """ The chunks that might have records within the column ranges.
+
+        Each range is an inclusive (min, max) pair, where None is unbounded.
+        """
+
+        if ranges is None:
+            return list(range(len(self.chunks)))
+
+        selected = []
+        for i, chunk in enumerate(self.chunks):
+            stats = chunk["stats"]
+            for column, (lower, upper) in ranges.items():
+                cmin, cmax = stats[column]
+                if lower is not None and cmax < lower:
+                    break
+                elif upper is not None and cmin > upper:
+                    break
+            else:
+                selected.append(i)
+        return selected
+
+    def batch(
+        self,
+        i: int,
+        names: Optional[NameTable] = None,
+    ) -> ColumnarBatch:
+        """ Load a chunk, optionally with ids from another NameTable. """
+
+        chunk = self.chunks[i]
+        columns = {
+            c: self._array(d)
+            for c, d in chunk["columns"].items()
+        }
+
+        query = columns["query"]
+        target = columns["target"]
+        if names is None:
+            names = self.names
+        elif names is not self.names:
+            recode = names.encode(self.names.names)
+            query = recode[query]
+            target = recode[target]
+
+        ints = {c: columns[c].astype(np.int64) for c in INT_COLUMNS}
+
+        tag_data = tag_offsets = None
+        if chunk["tags"] is not None:
+            tag_data = self._array(chunk["tags"]["data"])
+            tag_offsets = self._array(chunk["tags"]["offsets"])
+            tag_offsets = tag_offsets.astype(np.int64)
+
+        return ColumnarBatch(
+            names,
+            query,
+            ints["qlen"],
+            ints["qstart"],
+            ints["qend"],
+            columns["strand"],
+            target,
+            ints["tlen"],
+            ints["tstart"],
+            ints["tend"],
+            ints["nmatch"],
+            ints["alilen"],
+            ints["mq"],
+            tag_data=tag_data,
+            tag_offsets=tag_offsets,
+        )
+
+    def batches(
+        self,
+        ranges: Optional[ColumnRanges] = None,
+        names: Optional[NameTable] = None,
+    ) -> Iterator[ColumnarBatch]:
+        for i in self.chunk_ids(ranges):
+            yield self.batch(i, names)
+        return
+
+
+class PAFInput(InputFile):
+
+    """ An argparse type for PAF inputs, which may be columnar files.
+
+    Columnar files are memory mapped, anything else is opened as text with
+    InputFile.
+    """
+
+    def __init__(self):
+        super().__init__("r")
+        return
+
+    def __call__(self, string: str) -> IO:
+        if string == "-" or not is_columnar(string):
+            return super().__call__(string)
+
+        try:
+            return ColumnarPAF(string)
+        except (OSError, ValueError) as e:
+            raise argparse.ArgumentTypeError(f"can't open '{string}': {e}")
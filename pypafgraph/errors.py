@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+
+
+class InputOrderError(ValueError):
+
+    """ An input isn't sorted the way that an option needs it to be.
+
+    This is a problem with the input rather than a bug, so ppg reports it
+    without a traceback.
+    """
+
+    pass
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+
+import os
+import mmap
+
+from typing import BinaryIO, TextIO
+from typing import Iterator, List, Set
+from typing import NamedTuple
+from typing import Optional
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 2 ** 20
+DEFAULT_LINE_WIDTH = 60
+
+# Below this many lines, slicing is faster than setting up numpy arrays.
+MIN_NUMPY_LINES = 32
+
+# Sequence lines have all whitespace removed, like Bio.SeqIO does.
+WHITESPACE = b" \t\r\n\x0b\x0c"
+
+
+class Fasta(NamedTuple):
+    id: str
+    description: str
+    seq: bytes
+
+    @classmethod
+    def from_record(cls, record: bytes) -> 'Fasta':
+        """ Parse the text of a record, without the leading '>'.
+
+        Example:
+        >>> Fasta.from_record(b"seq1 some description\\nAC GT\\r\\nTT\\n")
+        Fasta(id='seq1', description='seq1 some description', seq=b'ACGTTT')
+        """
+
+        end = record.find(b"\n")
+        if end < 0:
+            end = len(record)
+
+        description = record[:end].decode().rstrip()
+        split = description.split(None, 1)
+        id = split[0] if len(split) > 0 else ""
+
+        seq = record[end + 1:].translate(None, WHITESPACE)
+        return cls(id, description, seq)
+
+    @classmethod
+    def from_file(
+        cls,
+        handle: BinaryIO,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Iterator['Fasta']:
+        for record in split_records(handle, chunk_size):
+            yield cls.from_record(record)
+        return
+
+    def __str__(self) -> str:
+        return format_fasta(self.description, self.seq).decode()
+
+
+def split_records(
+    handle: BinaryIO,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """ Read a binary fasta handle in chunks and yield the text of each
+    record, without the leading '>'.
+
+    Example:
+    >>> from io import BytesIO
+    >>> handle = BytesIO(b"\\n>one\\nAC\\nG>T\\n>two\\nTT\\n")
+    >>> list(split_records(handle, chunk_size=4))
+    [b'one\\nAC\\nG>T\\n', b'two\\nTT\\n']
+    """
+
+    record: List[bytes] = []
+    started = False
+    previous = b"\n"
+
+    while True:
+        chunk = handle.read(chunk_size)
+        if len(chunk) == 0:
+            break
+
+        # Find the '>' that start a line.
+        if previous == b"\n" and chunk[:1] == b">":
+            position = 0
+        else:
+            position = chunk.find(b"\n>")
+            position = position + 1 if position >= 0 else -1
+
+        last = 0
+        while position >= 0:
+            record.append(chunk[last:position])
+            if started:
+                yield b"".join(record)
+            else:
+                _check_leading(record)
+
+            started = True
+            record = []
+            last = position + 1
+
+            position = chunk.find(b"\n>", last)
+            if position >= 0:
+                position += 1
+
+        record.append(chunk[last:])
+        previous = chunk[-1:]
+
+    if started:
+        yield b"".join(record)
+    else:
+        _check_leading(record)
+    return
+
+
+def _check_leading(pieces: List[bytes]):
+    """ Only blank lines are allowed before the first record. """
+
+    if any(p.strip() != b"" for p in pieces):
+        raise ValueError("The fasta file has text before the first record.")
+    return
+
+
+def wrap(seq: bytes, width: Optional[int] = DEFAULT_LINE_WIDTH) -> bytes:
+    """ Split a sequence into newline terminated lines.
+
+    Example:
+    >>> wrap(b"ACGTACG", 3)
+    b'ACG\\nTAC\\nG\\n'
+    >>> wrap(b"ACG", None)
+    b'ACG\\n'
+    >>> wrap(b"", 3)
+    b''
+    """
+
+    length = len(seq)
+    if length == 0:
+        return b""
+    elif width is None or width <= 0 or length <= width:
+        return seq + b"\n"
+
+    nlines = -(-length // width)
+    if nlines < MIN_NUMPY_LINES:
+        rows = [seq[i: i + width] for i in range(0, length, width)]
+        return b"\n".join(rows) + b"\n"
+
+    # Lay the sequence out as rows of a matrix with a newline column.
+    padded = np.empty(nlines * width, dtype=np.uint8)
+    padded[:length] = np.frombuffer(seq, dtype=np.uint8)
+
+    lines = np.full((nlines, width + 1), ord("\n"), dtype=np.uint8)
+    lines[:, :width] = padded.reshape(nlines, width)
+
+    flat = lines.reshape(-1)
+    total = length + nlines
+    flat[total - 1] = ord("\n")
+    return flat[:total].tobytes()
+
+
+def format_fasta(
+    description: str,
+    seq: bytes,
+    width: Optional[int] = DEFAULT_LINE_WIDTH,
+) -> bytes:
+    """ Format a record like Bio.SeqIO.write does.
+
+    Example:
+    >>> format_fasta("seq1 desc", b"ACGTAC", width=4)
+    b'>seq1 desc\\nACGT\\nAC\\n'
+    """
+
+    return b">" + description.encode() + b"\n" + wrap(seq, width)
+
+
+def write_fasta(
+    handle: BinaryIO,
+    description: str,
+    seq: bytes,
+    width: Optional[int] = DEFAULT_LINE_WIDTH,
+):
+    handle.write(format_fasta(description, seq, width))
+    return
+
+
+class FaiRecord(NamedTuple):
+
+    """ A line of a samtools faidx style .fai index. """
+
+    name: str
+    length: int
+    offset: int
+    line_bases: int
+    line_bytes: int
+
+    @classmethod
+    def from_line(cls, line: str) -> 'FaiRecord':
+        """ Parse a line of a .fai file.
+
+        Example:
+        >>> FaiRecord.from_line("chr1\\t10\\t6\\t4\\t5")
+        FaiRecord(name='chr1', length=10, offset=6, line_bases=4, line_bytes=5)
+        """
+
+        sline = line.rstrip("\r\n").split("\t")
+        if len(sline) < 5:
+            raise ValueError(f"Invalid fai line: {line}")
+
+        name = sline[0]
+        length, offset, line_bases, line_bytes = (int(s) for s in sline[1:5])
+        return cls(name, length, offset, line_bases, line_bytes)
+
+    @classmethod
+    def from_file(cls, handle: TextIO) -> Iterator['FaiRecord']:
+        for line in handle:
+            if line.strip() == "":
+                continue
+            yield cls.from_line(line)
+        return
+
+    def __str__(self) -> str:
+        return "\t".join(str(v) for v in self)
+
+    def span(self) -> int:
+        """ The number of bytes from the first base to the last one. """
+
+        if self.length == 0:
+            return 0
+
+        nlines, remainder = divmod(self.length, self.line_bases)
+        if remainder == 0:
+            return nlines * self.line_bytes - (self.line_bytes
+                                               - self.line_bases)
+        return nlines * self.line_bytes + remainder
+
+
+def _index_record(
+    data: mmap.mmap,
+    name: str,
+    offset: int,
+    end: int,
+) -> FaiRecord:
+    """ Find the line layout of the sequence between offset and end. """
+
+    if end <= offset:
+        return FaiRecord(name, 0, offset, 0, 0)
+
+    region = np.frombuffer(data, dtype=np.uint8, count=end - offset,
+                           offset=offset)
+
+    newlines = np.flatnonzero(region == ord("\n"))
+    ends = newlines
+    if len(newlines) == 0 or newlines[-1] != len(region) - 1:
+        ends = np.append(newlines, len(region))
+
+    starts = np.concatenate([[0], newlines + 1])[:len(ends)]
+    nbytes = ends - starts
+    cr = np.zeros(len(ends), dtype=np.int64)
+    cr[nbytes > 0] = region[ends[nbytes > 0] - 1] == ord("\r")
+
+    nother = (
+        np.count_nonzero((region == ord(" ")) | (region == ord("\t")))
+        + np.count_nonzero(region == ord("\r")) - cr.sum()
+    )
+    del region
+
+    bases = nbytes - cr
+    line_bases = int(bases[0])
+    if (
+        nother > 0
+        or line_bases == 0
+        or np.any(bases[:-1] != line_bases)
+        or np.any(cr[:-1] != cr[0])
+        or bases[-1] > line_bases
+        or bases[-1] == 0
+    ):
+        raise ValueError(
+            f"Sequence {name} doesn't have a regular line layout, "
+            "so it can't be indexed."
+        )
+
+    line_bytes = line_bases + int(cr[0]) + 1
+    return FaiRecord(name, int(bases.sum()), offset, line_bases, line_bytes)
+
+
+def build_fai(path: str) -> List[FaiRecord]:
+    """ Index a fasta file like samtools faidx does.
+
+    Raises a ValueError if the lines of a sequence have different lengths,
+    or if sequence names are repeated.
+    """
+
+    records: List[FaiRecord] = []
+    names: Set[str] = set()
+
+    with open(path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return records
+
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if data[:1] == b">":
+                start = 0
+            else:
+                start = data.find(b"\n>")
+                if data[:max(start, 0)].strip() != b"":
+                    raise ValueError(
+                        "The fasta file has text before the first record."
+                    )
+                start = start + 1 if start >= 0 else -1
+
+            while start >= 0:
+                header_end = data.find(b"\n", start)
+                if header_end < 0:
+                    header_end = len(data)
+
+                header = data[start + 1:header_end].decode().split(None, 1)
+                name = header[0] if len(header) > 0 else ""
+                if name in names:
+                    raise ValueError(f"Sequence {name} is repeated.")
+                names.add(name)
+
+                next_start = data.find(b"\n>", header_end)
+                end = len(data) if next_start < 0 else next_start + 1
+                offset = min(header_end + 1, len(data))
+
+                records.append(_index_record(data, name, offset, end))
+                start = -1 if next_start < 0 else next_start + 1
+        finally:
+            data.close()
+
+    return records
+
+
+def load_fai(path: str, write: bool = True) -> List[FaiRecord]:
+    """ Read the .fai index of a fasta file, building it if it doesn't
+    exist or is older than the fasta.
+
+    A new index is written next to the fasta if write is True and the
+    directory is writable.
+    """
+
+    fai_path = f"{path}.fai"
+    if (
+        os.path.exists(fai_path)
+        and os.path.getmtime(fai_path) >= os.path.getmtime(path)
+    ):
+        with open(fai_path, "r") as handle:
+            return list(FaiRecord.from_file(handle))
+
+    records = build_fai(path)
+
+    if write:
+        try:
+            with open(fai_path, "w") as handle:
+                for record in records:
+                    print(record, file=handle)
+        except OSError:
+            pass
+
+    return records
+
+
+class IndexedFasta(object):
+
+    """ Random access to the records of a fasta file through its index.
+
+    Example:
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmpdir:
+    ...     path = os.path.join(tmpdir, "test.fasta")
+    ...     with open(path, "wb") as handle:
+    ...         _ = handle.write(b">one desc\\nACGT\\nAC\\n>two\\nGG\\n")
+    ...     with IndexedFasta(path, build_fai(path)) as fasta:
+    ...         fasta.records[1]
+    ...         fasta.description(0)
+    ...         fasta.seq(0)
+    ...         fasta.format(0, width=3)
+    FaiRecord(name='two', length=2, offset=23, line_bases=2, line_bytes=3)
+    'one desc'
+    b'ACGTAC'
+    b'>one desc\\nACG\\nTAC\\n'
+    """
+
+    def __init__(self, path: str, records: List[FaiRecord]):
+        self.path = path
+        self.records = records
+        self.handle = open(path, "rb")
+
+        if os.fstat(self.handle.fileno()).st_size == 0:
+            self.data = b""
+        else:
+            self.data = mmap.mmap(
+                self.handle.fileno(),
+                0,
+                access=mmap.ACCESS_READ
+            )
+        return
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __enter__(self) -> 'IndexedFasta':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.handle.close()
+        return
+
+    def description(self, i: int) -> str:
+        """ The header line of a record, without the '>'. """
+
+        offset = self.records[i].offset
+        start = self.data.rfind(b"\n", 0, offset - 1) + 1
+        return self.data[start + 1:offset].decode().rstrip()
+
+    def raw(self, i: int) -> bytes:
+        """ The bytes from the first base of a record to its last one. """
+
+        record = self.records[i]
+        return self.data[record.offset: record.offset + record.span()]
+
+    def seq(self, i: int) -> bytes:
+        return self.raw(i).translate(None, WHITESPACE)
+
+    def format(
+        self,
+        i: int,
+        width: Optional[int] = DEFAULT_LINE_WIDTH
+    ) -> bytes:
+        """ Format a record like format_fasta.
+
+        If the record is already wrapped to width with '\\n' line endings,
+        its bytes are copied as they are.
+        """
+
+        record = self.records[i]
+        if record.length == 0:
+            return b">" + self.description(i).encode() + b"\n"
+
+        elif (
+            width is not None
+            and record.line_bases == width
+            and record.line_bytes == width + 1
+        ):
+            return b"".join([
+                b">",
+                self.description(i).encode(),
+                b"\n",
+                self.raw(i),
+                b"\n",
+            ])
+
+        return format_fasta(self.description(i), self.seq(i), width)
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import zlib
+import argparse
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import IO, BinaryIO
+from typing import Callable, Iterator
+from typing import Optional
+
+from pypafgraph.utils import is_regular_file
+
+COMPRESSION_METHODS = ("gzip", "bgzf", "zstd")
+
+SUFFIXES = {"gzip": ".gz", "bgzf": ".gz", "zstd": ".zst"}
+SUFFIX_METHODS = {".gz": "gzip", ".bgz": "bgzf", ".zst": "zstd"}
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+DEFAULT_THREADS = min(4, os.cpu_count() or 1)
+DEFAULT_BUFFER_SIZE = 2 ** 20
+
+# BGZF blocks hold at most 64 KiB, including the header and footer.
+BGZF_BLOCK_SIZE = 65280
+BGZF_EOF = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000"
+)
+GZIP_MEMBER_SIZE = 2 ** 20
+COMPRESSION_LEVEL = 6
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """ Guess the compression of a file from its first bytes.
+
+    Example:
+    >>> detect_compression(BGZF_EOF)
+    'bgzf'
+    >>> import gzip
+    >>> detect_compression(gzip.compress(b"test"))
+    'gzip'
+    >>> detect_compression(b"query\\t100") is None
+    True
+    """
+
+    if head[:2] == GZIP_MAGIC:
+        # BGZF has an extra field with a BC subfield.
+        if len(head) >= 14 and head[3] & 4 and head[12:14] == b"BC":
+            return "bgzf"
+        return "gzip"
+    elif head[:4] == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def compression_from_suffix(path: str) -> Optional[str]:
+    """ Guess the compression to use from a file extension.
+
+    Example:
+    >>> compression_from_suffix("out.paf.gz")
+    'gzip'
+    >>> compression_from_suffix("out.paf") is None
+    True
+    """
+
+    _, suffix = os.path.splitext(path)
+    return SUFFIX_METHODS.get(suffix.lower(), None)
+
+
+def compressed_name(path: str, compression: Optional[str]) -> str:
+    """ Add the usual extension for a compression method.
+
+    Example:
+    >>> compressed_name("component1.fasta", "zstd")
+    'component1.fasta.zst'
+    >>> compressed_name("component1.fasta", None)
+    'component1.fasta'
+    """
+
+    if compression is None:
+        return path
+    return path + SUFFIXES[compression]
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(
+            "Reading or writing zstd files needs the zstandard package. "
+            "Install it with 'pip install zstandard'."
+        )
+    return zstandard
+
+
+def file_compression(path: str) -> Optional[str]:
+    with open(path, "rb") as handle:
+        return detect_compression(handle.read(18))
+
+
+def is_plain_file(handle: IO) -> bool:
+    """ Check if a handle is an uncompressed regular file, which can be
+    re-opened and read from any offset.
+    """
+
+    if not is_regular_file(handle):
+        return False
+
+    try:
+        return file_compression(handle.name) is None
+    except OSError:
+        return False
+
+
+def _ordered_map(
+    executor: ThreadPoolExecutor,
+    func: Callable[[bytes], bytes],
+    items: Iterator[bytes],
+    window: int,
+) -> Iterator[bytes]:
+    """ Like executor.map, but with at most window tasks in flight. """
+
+    pending: deque = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while len(pending) > 0:
+        yield pending.popleft().result()
+    return
+
+
+def _bgzf_blocks(handle: BinaryIO) -> Iterator[bytes]:
+    """ Read the raw BGZF blocks of a file. """
+
+    while True:
+        header = handle.read(12)
+        if len(header) == 0:
+            return
+        elif len(header) < 12 or header[:2] != GZIP_MAGIC:
+            raise ValueError("Invalid BGZF block header.")
+
+        xlen = int.from_bytes(header[10:12], "little")
+        extra = handle.read(xlen)
+
+        bsize = None
+        i = 0
+        while i + 4 <= len(extra):
+            slen = int.from_bytes(extra[i + 2: i + 4], "little")
+            if extra[i: i + 2] == b"BC" and slen == 2:
+                bsize = int.from_bytes(extra[i + 4: i + 6], "little")
+            i += 4 + slen
+
+        if bsize is None:
+            raise ValueError("Invalid BGZF block, missing the BC field.")
+
+        rest = handle.read(bsize + 1 - 12 - xlen)
+        if len(rest) != bsize + 1 - 12 - xlen:
+            raise ValueError("The BGZF file is truncated.")
+        yield rest
+
+
+def _inflate_bgzf(rest: bytes) -> bytes:
+    data = zlib.decompress(rest[:-8], -15)
+    crc = int.from_bytes(rest[-8:-4], "little")
+    if zlib.crc32(data) != crc:
+        raise ValueError("BGZF block failed its CRC check.")
+    return data
+
+
+class _ChunkReader(io.RawIOBase):
+
+    """ A readable stream over an iterator of byte strings. """
+
+    def __init__(self, chunks: Iterator[bytes], close: Callable[[], None]):
+        self.chunks = chunks
+        self.current = b""
+        self.position = 0
+        self._close = close
+        return
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self.position >= len(self.current):
+            try:
+                self.current = next(self.chunks)
+            except StopIteration:
+                return 0
+            self.position = 0
+
+        n = min(len(buffer), len(self.current) - self.position)
+        buffer[:n] = self.current[self.position: self.position + n]
+        self.position += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._close()
+        super().close()
+        return
+
+
+def _bgzf_reader(
+    raw: BinaryIO,
+    threads: int = DEFAULT_THREADS
+) -> io.RawIOBase:
+    """ Decompress BGZF blocks in a pool of threads. """
+
+    executor = ThreadPoolExecutor(max(1, threads))
+    chunks = _ordered_map(
+        executor,
+        _inflate_bgzf,
+        _bgzf_blocks(raw),
+        4 * max(1, threads)
+    )
+
+    def close():
+        executor.shutdown()
+        return
+
+    return _ChunkReader(chunks, close)
+
+
+class _DecompressedReader(io.BufferedReader):
+
+    """ A buffered decompressing stream that remembers the file it reads,
+    and closes it.
+    """
+
+    def __init__(self, stream: IO, raw: BinaryIO, name: str):
+        super().__init__(stream, buffer_size=DEFAULT_BUFFER_SIZE)
+        self.source = raw
+        self._name = name
+        return
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def close(self):
+        if self.closed:
+            return
+
+        super().close()
+        if self.source is not sys.stdin.buffer:
+            self.source.close()
+        return
+
+
+def open_input(
+    path: str,
+    mode: str = "r",
+    threads: int = DEFAULT_THREADS,
+) -> IO:
+    """ Open a file or stdin ('-'), decompressing gzip, bgzf or zstd.
+
+    Uncompressed files are opened as they would be with open().
+    """
+
+    if path == "-":
+        raw = sys.stdin.buffer
+    else:
+        raw = open(path, "rb")
+
+    if not hasattr(raw, "peek"):
+        raw = io.BufferedReader(raw)
+
+    compression = detect_compression(raw.peek(18)[:18])
+
+    if compression is None:
+        if path == "-":
+            return sys.stdin.buffer if "b" in mode else sys.stdin
+        elif "b" in mode:
+            return raw
+
+        raw.close()
+        return open(path, mode)
+
+    elif compression == "bgzf":
+        stream = _bgzf_reader(raw, threads)
+    elif compression == "gzip":
+        import gzip
+        stream = gzip.GzipFile(fileobj=raw, mode="rb")
+    else:
+        zstandard = _zstandard()
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            raw,
+            read_across_frames=True,
+            closefd=False,
+        )
+
+    buffered = _DecompressedReader(stream, raw, path)
+    if "b" in mode:
+        return buffered
+    return io.TextIOWrapper(buffered)
+
+
+class InputFile(object):
+
+    """ Like argparse.FileType, but transparently decompresses. """
+
+    def __init__(self, mode: str = "r"):
+        self.mode = mode
+        return
+
+    def __call__(self, string: str) -> IO:
+        try:
+            return open_input(string, self.mode)
+        except (OSError, ValueError) as e:
+            raise argparse.ArgumentTypeError(f"can't open '{string}': {e}")
+
+
+def _deflate_gzip(data: bytes) -> bytes:
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _deflate_bgzf(data: bytes) -> bytes:
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    bsize = 18 + len(cdata) + 8 - 1
+
+    return b"".join([
+        b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00",
+        bsize.to_bytes(2, "little"),
+        cdata,
+        zlib.crc32(data).to_bytes(4, "little"),
+        len(data).to_bytes(4, "little"),
+    ])
+
+
+class BlockWriter(io.BufferedIOBase):
+
+    """ Compress blocks of data in a pool of threads.
+
+    gzip output is written as a series of gzip members, and bgzf output as
+    BGZF blocks followed by the end-of-file marker. Both are valid gzip
+    files, and either can be appended to an existing file.
+
+    An executor can be shared between writers, so that many open files
+    don't each start their own threads.
+    """
+
+    def __init__(
+        self,
+        raw: BinaryIO,
+        compression: str = "bgzf",
+        threads: int = DEFAULT_THREADS,
+        closefd: bool = True,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        if compression == "bgzf":
+            self.block_size = BGZF_BLOCK_SIZE
+            self.func = _deflate_bgzf
+        elif compression == "gzip":
+            self.block_size = GZIP_MEMBER_SIZE
+            self.func = _deflate_gzip
+        else:
+            raise ValueError(f"Can't write {compression} blocks.")
+
+        self.raw = raw
+        self.compression = compression
+        self.closefd = closefd
+        self.threads = max(1, threads)
+        self.owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(self.threads)
+        self.executor = executor
+        self.pending: deque = deque()
+        self.buffer = bytearray()
+        return
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer.extend(data)
+
+        nblocks = len(self.buffer) // self.block_size
+        if nblocks > 0:
+            end = nblocks * self.block_size
+            for i in range(0, end, self.block_size):
+                block = bytes(self.buffer[i: i + self.block_size])
+                self._submit(block)
+            del self.buffer[:end]
+        return len(data)
+
+    def _submit(self, block: bytes):
+        self.pending.append(self.executor.submit(self.func, block))
+
+        while len(self.pending) >= 2 * self.threads:
+            self.raw.write(self.pending.popleft().result())
+        return
+
+    def flush(self):
+        if self.closed:
+            return
+
+        # Only whole blocks are written, so that output isn't fragmented.
+        while len(self.pending) > 0:
+            self.raw.write(self.pending.popleft().result())
+        self.raw.flush()
+        return
+
+    def close(self):
+        if self.closed:
+            return
+
+        if len(self.buffer) > 0:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+
+        self.flush()
+        if self.compression == "bgzf":
+            self.raw.write(BGZF_EOF)
+
+        if self.owns_executor:
+            self.executor.shutdown()
+        super().close()
+
+        if self.closefd:
+            self.raw.close()
+        return
+
+
+class _Unclosable(object):
+
+    """ Wraps a handle so that closing it only flushes it.
+
+    This is used for stdout, which can still be written to after an output
+    file is closed, e.g. by --stats or an error message.
+
+    Example:
+    >>> handle = io.StringIO()
+    >>> with _Unclosable(handle) as wrapped:
+    ...     _ = wrapped.write("text")
+    >>> handle.closed, handle.getvalue()
+    (False, 'text')
+    """
+
+    def __init__(self, handle: IO):
+        self.handle = handle
+        return
+
+    def __getattr__(self, name: str):
+        return getattr(self.handle, name)
+
+    def __iter__(self):
+        return iter(self.handle)
+
+    def close(self):
+        self.handle.flush()
+        return
+
+    def __enter__(self) -> '_Unclosable':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return
+
+
+def open_output(
+    path: str,
+    mode: str = "w",
+    compression: Optional[str] = None,
+    threads: int = DEFAULT_THREADS,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> IO:
+    """ Open a file or stdout ('-') for writing, optionally compressed.
+
+    If compression is None, it is guessed from the file extension.
+    mode can be 'w', 'wb', 'a' or 'ab'. gzip and bgzf compression can use
+    a shared executor with the given number of threads.
+    """
+
+    if compression is None and path != "-":
+        compression = compression_from_suffix(path)
+
+    if compression is None:
+        if path == "-":
+            return _Unclosable(sys.stdout.buffer if "b" in mode
+                               else sys.stdout)
+        return open(path, mode)
+
+    if path == "-":
+        raw = sys.stdout.buffer
+    else:
+        raw = open(path, "ab" if "a" in mode else "wb")
+
+    closefd = path != "-"
+    if compression == "zstd":
+        zstandard = _zstandard()
+        compressor = zstandard.ZstdCompressor(threads=threads)
+        stream = compressor.stream_writer(raw, closefd=closefd)
+    else:
+        stream = BlockWriter(raw, compression, threads, closefd, executor)
+
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream, write_through=True)
+
+
+def add_compression_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--compress",
+        default=None,
+        choices=COMPRESSION_METHODS,
+        help=(
+            "Compress the output files, using multiple threads. "
+            "Default guess from the output file extension."
+        ),
+    )
+
+    parser.add_argument(
+        "--compress-threads",
+        default=DEFAULT_THREADS,
+        type=int,
+        help="The number of threads to use for compression.",
+    )
+    return
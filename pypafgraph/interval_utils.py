@@ -1,6 +1,15 @@
 from typing import List
+
+import numpy as np
+
 from intervaltree import Interval, IntervalTree
 
+# The array versions live in pypafgraph.intervals, these are kept so that
+# existing imports still work.
+from pypafgraph.intervals import IntervalSet
+from pypafgraph.intervals import merge_keyed_intervals  # noqa: F401
+from pypafgraph.intervals import merge_intervals  # noqa: F401
+
 
 def intersect(left: Interval, right: Interval) -> Interval:
     """ Find the intersection of two interval objects.
@@ -13,13 +22,9 @@ def intersect(left: Interval, right: Interval) -> Interval:
     Interval(3, 5)
     """
 
-    lstart = min([left.begin, left.end])
-    lend = max([left.begin, left.end])
-    rstart = min([right.begin, right.end])
-    rend = max([right.begin, right.end])
-    lbound = max([lstart, rstart])
-    rbound = min([lend, rend])
-    return Interval(lbound, rbound)
+    lstart, lend = sorted((left.begin, left.end))
+    rstart, rend = sorted((right.begin, right.end))
+    return Interval(max(lstart, rstart), min(lend, rend))
 
 
 def union(left: Interval, right: Interval) -> Interval:
@@ -33,17 +38,13 @@ def union(left: Interval, right: Interval) -> Interval:
     Interval(0, 10)
     """
 
-    lstart = min([left.begin, left.end])
-    lend = max([left.begin, left.end])
-    rstart = min([right.begin, right.end])
-    rend = max([right.begin, right.end])
+    lstart, lend = sorted((left.begin, left.end))
+    rstart, rend = sorted((right.begin, right.end))
 
     if not ((lstart < rend) and (lend > rstart)):
         raise ValueError("Left and right must be overlapping.")
 
-    lbound = min([lstart, rstart])
-    rbound = max([lend, rend])
-    return Interval(lbound, rbound)
+    return Interval(min(lstart, rstart), max(lend, rend))
 
 
 def diff(left: Interval, right: Interval) -> List[Interval]:
@@ -79,19 +80,11 @@ def diff(left: Interval, right: Interval) -> List[Interval]:
     if not left.overlaps(right):
         return [left]
 
-    lstart = min([left.begin, left.end])
-    lend = max([left.begin, left.end])
-    rstart = min([right.begin, right.end])
-    rend = max([right.begin, right.end])
-
-    out = []
-    if rstart > lstart:
-        out.append(Interval(lstart, min([rstart, lend])))
-
-    if rend < lend:
-        out.append(Interval(max([lstart, rend]), lend))
-
-    return out
+    difference = (
+        IntervalSet.from_intervals([left]) -
+        IntervalSet.from_intervals([right])
+    )
+    return difference.to_intervals()
 
 
 def sym_diff(left: Interval, right: Interval) -> List[Interval]:
@@ -102,21 +95,36 @@ def sym_diff(left: Interval, right: Interval) -> List[Interval]:
     >>> right = Interval(8, 15)
     >>> sym_diff(left, right)
     [Interval(0, 8), Interval(10, 15)]
+    >>> sym_diff(Interval(0, 10), Interval(10, 20))
+    Traceback (most recent call last):
+    ...
+    ValueError: Left and right must be overlapping.
     """
-    inter = intersect(left, right)
-    uni = union(left, right)
-    return diff(uni, inter)
+
+    # Like union, this is only defined for overlapping intervals.
+    union(left, right)
+
+    difference = (
+        IntervalSet.from_intervals([left]) ^
+        IntervalSet.from_intervals([right])
+    )
+    return difference.to_intervals()
 
 
 def total_intersection(itree: IntervalTree, interval: Interval) -> int:
+    """ The number of bases in a tree that overlap an interval.
+
+    Example:
+    >>> itree = IntervalTree([Interval(0, 10), Interval(5, 15)])
+    >>> total_intersection(itree, Interval(8, 20))
+    7
+    """
+
     if interval.length() <= 0:
         return 0
 
-    total = 0
-    ovlps = IntervalTree(itree.overlap(interval))
-    ovlps.merge_overlaps()
-    for ovlp in ovlps:
-        inter = intersect(interval, ovlp)
-        total += inter.length()
-
-    return total
+    overlaps = IntervalSet.from_intervals(itree.overlap(interval))
+    return int(overlaps.overlap_lengths(
+        np.array([interval.begin]),
+        np.array([interval.end]),
+    )[0])
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+from typing import Callable, Iterable, Iterator, List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from intervaltree import Interval
+
+
+def merge_keyed_intervals(
+    keys: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    strict: bool = True,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Merge overlapping intervals that share a key.
+
+    The output is sorted by key and then start. Like
+    IntervalTree.merge_overlaps, intervals that only touch are kept separate
+    unless strict is False. Empty intervals are dropped.
+
+    Examples:
+    >>> merge_keyed_intervals(
+    ...     np.array([1, 0, 1, 0]),
+    ...     np.array([5, 0, 0, 3]),
+    ...     np.array([9, 5, 6, 8]),
+    ... )
+    (array([0, 1]), array([0, 0]), array([8, 9]))
+    >>> merge_keyed_intervals(
+    ...     np.array([0, 0, 1]),
+    ...     np.array([0, 5, 5]),
+    ...     np.array([5, 9, 9]),
+    ... )
+    (array([0, 0, 1]), array([0, 5, 5]), array([5, 9, 9]))
+    """
+
+    keys = np.asarray(keys, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    nonempty = ends > starts
+    keys = keys[nonempty]
+    starts = starts[nonempty]
+    ends = ends[nonempty]
+
+    if len(keys) == 0:
+        return keys, starts, ends
+
+    order = np.lexsort((starts, keys))
+    keys = keys[order]
+    starts = starts[order]
+    ends = ends[order]
+
+    # Shift each key's intervals past all of the previous key's, so that
+    # the running maximum end can't carry over between keys.
+    new_key = np.concatenate([[True], keys[1:] != keys[:-1]])
+    shift = (np.cumsum(new_key) - 1) * (int(ends.max()) + 1)
+    run_ends = np.maximum.accumulate(ends + shift)
+    shifted_starts = starts + shift
+
+    # An interval starts a new run if it begins after every previous end.
+    if strict:
+        new_run = shifted_starts[1:] >= run_ends[:-1]
+    else:
+        new_run = shifted_starts[1:] > run_ends[:-1]
+
+    breaks = np.flatnonzero(new_key | np.concatenate([[True], new_run]))
+    return keys[breaks], starts[breaks], np.maximum.reduceat(ends, breaks)
+
+
+def merge_intervals(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    strict: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ Merge overlapping intervals given as arrays of starts and ends.
+
+    Like IntervalTree.merge_overlaps, intervals that only touch are kept
+    separate unless strict is False. Empty intervals are dropped.
+
+    Examples:
+    >>> merge_intervals(np.array([5, 0, 12, 10]), np.array([8, 6, 15, 12]))
+    (array([ 0, 10, 12]), array([ 8, 12, 15]))
+    >>> merge_intervals(np.array([0, 10, 12]), np.array([8, 12, 15]),
+    ...                 strict=False)
+    (array([ 0, 10]), array([ 8, 15]))
+    """
+
+    _, starts, ends = merge_keyed_intervals(
+        np.zeros(len(starts), dtype=np.int64),
+        starts,
+        ends,
+        strict=strict
+    )
+    return starts, ends
+
+
+class IntervalSet(object):
+
+    """ A set of half open intervals, stored as sorted arrays of the starts
+    and ends of disjoint intervals.
+
+    Intervals are merged as they would be by IntervalTree.merge_overlaps,
+    so intervals that only touch are kept separate unless strict is False.
+    The results of set operations are always fully merged.
+
+    Queries take arrays of intervals and are answered with a searchsorted
+    against the starts and a prefix sum of the interval lengths.
+
+    Example:
+    >>> a = IntervalSet([0, 20], [10, 30])
+    >>> b = IntervalSet([5], [25])
+    >>> a | b
+    IntervalSet([(0, 30)])
+    >>> a & b
+    IntervalSet([(5, 10), (20, 25)])
+    >>> a - b
+    IntervalSet([(0, 5), (25, 30)])
+    >>> a ^ b
+    IntervalSet([(0, 5), (10, 20), (25, 30)])
+    >>> a.coverage()
+    20
+    >>> a.overlap_lengths(np.array([0, 8, 40]), np.array([25, 22, 50]))
+    array([15,  4,  0])
+    """
+
+    def __init__(
+        self,
+        starts: Iterable[int],
+        ends: Iterable[int],
+        strict: bool = True,
+    ):
+        starts, ends = merge_intervals(
+            np.asarray(starts, dtype=np.int64),
+            np.asarray(ends, dtype=np.int64),
+            strict=strict,
+        )
+        self._set(starts, ends)
+        return
+
+    def _set(self, starts: np.ndarray, ends: np.ndarray):
+        self.starts = starts
+        self.ends = ends
+        self.cumulative = np.concatenate([[0], np.cumsum(ends - starts)])
+        return
+
+    @classmethod
+    def from_merged(
+        cls,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        cumulative: Optional[np.ndarray] = None,
+    ) -> 'IntervalSet':
+        """ Wrap arrays that are already sorted, disjoint and non-empty.
+
+        The prefix sum of the lengths can be given too if it has been
+        stored, e.g. in a memory mapped file.
+        """
+
+        interval_set = cls.__new__(cls)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        if cumulative is None:
+            interval_set._set(starts, ends)
+        else:
+            interval_set.starts = starts
+            interval_set.ends = ends
+            interval_set.cumulative = np.asarray(cumulative, dtype=np.int64)
+        return interval_set
+
+    @classmethod
+    def from_intervals(
+        cls,
+        intervals: Iterable[Interval],
+        strict: bool = True,
+    ) -> 'IntervalSet':
+        """ Build a set from Interval objects, which may be reversed.
+
+        Example:
+        >>> IntervalSet.from_intervals([Interval(9, 3), Interval(0, 2)])
+        IntervalSet([(0, 2), (3, 9)])
+        """
+
+        bounds = [(i.begin, i.end) for i in intervals]
+        if len(bounds) == 0:
+            return cls.from_merged(np.zeros(0), np.zeros(0))
+
+        array = np.sort(np.array(bounds, dtype=np.int64), axis=1)
+        return cls(array[:, 0], array[:, 1], strict=strict)
+
+    def to_intervals(self) -> List[Interval]:
+        return [Interval(s, e) for s, e in self]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.starts.tolist(), self.ends.tolist())
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, IntervalSet):
+            return NotImplemented
+
+        return (np.array_equal(self.starts, other.starts) and
+                np.array_equal(self.ends, other.ends))
+
+    def __repr__(self) -> str:
+        return f"IntervalSet({list(self)})"
+
+    def coverage(self) -> int:
+        """ The total number of bases in the set. """
+        return int(self.cumulative[-1])
+
+    def _covers(self, positions: np.ndarray) -> np.ndarray:
+        """ Check if each position is inside one of the intervals. """
+
+        if len(self) == 0:
+            return np.zeros(len(positions), dtype=bool)
+
+        i = np.searchsorted(self.starts, positions, side="right") - 1
+        return (i >= 0) & (self.ends[np.maximum(i, 0)] > positions)
+
+    def covered_before(self, positions: np.ndarray) -> np.ndarray:
+        """ The number of bases in the set before each position. """
+
+        if len(self) == 0:
+            return np.zeros(len(positions), dtype=np.int64)
+
+        i = np.searchsorted(self.starts, positions, side="right") - 1
+        j = np.maximum(i, 0)
+        within = np.clip(
+            positions - self.starts[j],
+            0,
+            self.ends[j] - self.starts[j]
+        )
+        return np.where(i >= 0, self.cumulative[j] + within, 0)
+
+    def overlap_lengths(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+    ) -> np.ndarray:
+        """ The number of bases in the set overlapping each interval. """
+
+        overlap = self.covered_before(ends) - self.covered_before(starts)
+        return np.maximum(overlap, 0)
+
+    def overlaps(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """ Check if each interval shares any bases with the set. """
+        return self.overlap_lengths(starts, ends) > 0
+
+    def _combine(
+        self,
+        other: 'IntervalSet',
+        keep: Callable[[np.ndarray, np.ndarray], np.ndarray],
+    ) -> 'IntervalSet':
+        """ Sweep over the boundaries of both sets, keeping the segments
+        between them where keep is true, and joining adjacent segments.
+        """
+
+        points = np.unique(np.concatenate([
+            self.starts, self.ends,
+            other.starts, other.ends,
+        ]))
+        lefts = points[:-1]
+        rights = points[1:]
+
+        selected = keep(self._covers(lefts), other._covers(lefts))
+        edges = np.diff(np.concatenate([[0], selected, [0]]).astype(np.int8))
+
+        return IntervalSet.from_merged(
+            lefts[np.flatnonzero(edges == 1)],
+            rights[np.flatnonzero(edges == -1) - 1],
+        )
+
+    def union(self, other: 'IntervalSet') -> 'IntervalSet':
+        return self._combine(other, np.logical_or)
+
+    def intersection(self, other: 'IntervalSet') -> 'IntervalSet':
+        return self._combine(other, np.logical_and)
+
+    def difference(self, other: 'IntervalSet') -> 'IntervalSet':
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def symmetric_difference(self, other: 'IntervalSet') -> 'IntervalSet':
+        return self._combine(other, np.logical_xor)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __xor__ = symmetric_difference
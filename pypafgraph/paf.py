@@ -1,8 +1,23 @@
 from typing import NamedTuple
-from typing import Sequence, Iterator, List
+from typing import Sequence, Iterator, Iterable, List
+from typing import Dict, Tuple
+from typing import Optional
+
+from itertools import islice
+
+import numpy as np
 
 from intervaltree import Interval
 
+from pypafgraph.utils import get_genome_name, grow_array
+from pypafgraph.errors import InputOrderError
+
+DEFAULT_BATCH_SIZE = 100000
+NON_INT_COLUMNS = ("query", "strand", "target")
+
+# Inclusive (min, max) bounds on columns, None is unbounded.
+ColumnRanges = Dict[str, Tuple[Optional[int], Optional[int]]]
+
 
 class PAF(NamedTuple):
 
@@ -78,3 +93,549 @@ class PAF(NamedTuple):
         start = min([self.tstart, self.tend])
         end = max([self.tstart, self.tend])
         return self.target, Interval(start, end)
+
+
+class NameTable(object):
+
+    """ Interns sequence names to stable integer ids.
+
+    Ids are assigned in the order that names are first seen, so a table
+    shared between batches gives the same id to a name in every batch.
+
+    Example:
+    >>> names = NameTable()
+    >>> names.encode(["b", "a", "b"])
+    array([0, 1, 0], dtype=int32)
+    >>> names[1]
+    'a'
+    """
+
+    def __init__(self, names: Optional[Sequence[str]] = None):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = dict()
+        self._genomes: Dict[str, Tuple['NameTable', np.ndarray]] = dict()
+
+        if names is not None:
+            for name in names:
+                self.intern(name)
+        return
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, i: int) -> str:
+        return self.names[i]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def intern(self, name: str) -> int:
+        id_ = self.ids.get(name, None)
+        if id_ is None:
+            id_ = len(self.names)
+            self.ids[name] = id_
+            self.names.append(name)
+        return id_
+
+    def encode(self, names: Sequence[str]) -> np.ndarray:
+        """ Convert a sequence of names to an array of ids. """
+
+        ids = self.ids
+        # Only new names need to go through the slow path.
+        for name in dict.fromkeys(names):
+            if name not in ids:
+                self.intern(name)
+
+        return np.fromiter(
+            map(ids.__getitem__, names),
+            dtype=np.int32,
+            count=len(names)
+        )
+
+    def genome_ids(self, sep: str) -> np.ndarray:
+        """ Ids of the genome prefix of every name, split by sep.
+
+        The prefixes are only found once for each name. The result is
+        cached and extended as names are added, so checking if two ids are
+        from the same genome is an array lookup.
+
+        Example:
+        >>> names = NameTable(["g1.c1", "g2.c1", "g1.c2"])
+        >>> names.genome_ids(".")
+        array([0, 1, 0], dtype=int32)
+        >>> _ = names.intern("g3")
+        >>> names.genome_ids(".")
+        array([0, 1, 0, 2], dtype=int32)
+        """
+
+        if sep not in self._genomes:
+            self._genomes[sep] = (NameTable(), np.zeros(0, dtype=np.int32))
+
+        genomes, ids = self._genomes[sep]
+
+        if len(ids) < len(self.names):
+            new = genomes.encode([
+                get_genome_name(name, sep)
+                for name in self.names[len(ids):]
+            ])
+            ids = np.concatenate([ids, new])
+            self._genomes[sep] = (genomes, ids)
+
+        return ids
+
+
+def _parse_ints(
+    data: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray
+) -> np.ndarray:
+    """ Parse unsigned integer fields from a byte array.
+
+    Example:
+    >>> data = np.frombuffer(b"12\\t0\\t345", dtype=np.uint8)
+    >>> _parse_ints(data, np.array([0, 3, 5]), np.array([2, 4, 8]))
+    array([ 12,   0, 345])
+    """
+
+    lengths = ends - starts
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if lengths.min() <= 0:
+        raise ValueError("Encountered an empty integer field.")
+
+    values = np.zeros(len(starts), dtype=np.int64)
+    last = len(data) - 1
+
+    # One pass per digit position, fields shorter than i are left alone.
+    for i in range(lengths.max()):
+        active = lengths > i
+        digits = data[np.minimum(starts + i, last)].astype(np.int64)
+        digits -= ord("0")
+        if np.any(active & ((digits < 0) | (digits > 9))):
+            raise ValueError("Encountered a non-integer field.")
+        values = np.where(active, values * 10 + digits, values)
+
+    return values
+
+
+def _encode_names(
+    data: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    names: NameTable,
+) -> np.ndarray:
+    """ Intern byte fields in a NameTable, in the order they appear.
+
+    Example:
+    >>> data = np.frombuffer(b"b a b", dtype=np.uint8)
+    >>> names = NameTable(["a"])
+    >>> _encode_names(data, np.array([0, 2, 4]), np.array([1, 3, 5]), names)
+    array([1, 0, 1], dtype=int32)
+    """
+
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    lengths = ends - starts
+    width = max(int(lengths.max()), 1)
+    offsets = np.arange(width)
+    index = np.minimum(starts[:, None] + offsets, len(data) - 1)
+    chars = np.where(offsets < lengths[:, None], data[index], 0)
+    chars = np.ascontiguousarray(chars, dtype=np.uint8)
+    keys = chars.view(f"S{width}")[:, 0]
+
+    # Sorting integers is much faster than sorting strings, so names are
+    # grouped by a hash and we check that there weren't any collisions.
+    hashes = np.zeros(len(starts), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for i in range(width):
+            hashes = hashes * np.uint64(1099511628211) + chars[:, i]
+
+    _, first, inverse = np.unique(
+        hashes,
+        return_index=True,
+        return_inverse=True
+    )
+    inverse = inverse.ravel()
+
+    if np.any(keys[first[inverse]] != keys):
+        _, first, inverse = np.unique(
+            keys,
+            return_index=True,
+            return_inverse=True
+        )
+        inverse = inverse.ravel()
+
+    order = np.argsort(first, kind="stable")
+    ids = np.zeros(len(first), dtype=np.int32)
+    ids[order] = names.encode([k.decode() for k in keys[first[order]]])
+    return ids[inverse]
+
+
+class PAFBatch(object):
+
+    """ A chunk of PAF records stored as typed column arrays.
+
+    Sequence names are stored as ids into a NameTable that can be shared
+    between batches, strand is stored as a boolean array (True is '+').
+    The raw bytes of the chunk are kept so that records can be written out
+    unchanged, and so that the optional tags are only split when they are
+    asked for.
+    """
+
+    def __init__(
+        self,
+        names: NameTable,
+        query: np.ndarray,
+        qlen: np.ndarray,
+        qstart: np.ndarray,
+        qend: np.ndarray,
+        strand: np.ndarray,
+        target: np.ndarray,
+        tlen: np.ndarray,
+        tstart: np.ndarray,
+        tend: np.ndarray,
+        nmatch: np.ndarray,
+        alilen: np.ndarray,
+        mq: np.ndarray,
+        data: Optional[np.ndarray],
+        line_starts: Optional[np.ndarray],
+        line_ends: Optional[np.ndarray],
+    ):
+        self.names = names
+        self.query = query
+        self.qlen = qlen
+        self.qstart = qstart
+        self.qend = qend
+        self.strand = strand
+        self.target = target
+        self.tlen = tlen
+        self.tstart = tstart
+        self.tend = tend
+        self.nmatch = nmatch
+        self.alilen = alilen
+        self.mq = mq
+        self.data = data
+        self.line_starts = line_starts
+        self.line_ends = line_ends
+        return
+
+    def __len__(self) -> int:
+        return len(self.query)
+
+    @classmethod
+    def from_bytes(
+        cls,
+        chunk: bytes,
+        names: Optional[NameTable] = None,
+    ) -> 'PAFBatch':
+        """ Parse a chunk of newline separated PAF records.
+
+        Example:
+        >>> batch = PAFBatch.from_bytes(
+        ...     b"a\\t9\\t0\\t5\\t+\\tb\\t8\\t1\\t6\\t4\\t5\\t60\\ttp:A:P\\n"
+        ...     b"c\\t9\\t2\\t4\\t-\\ta\\t9\\t0\\t2\\t2\\t2\\t0\\n"
+        ... )
+        >>> batch.names.names
+        ['a', 'b', 'c']
+        >>> batch.query, batch.target
+        (array([0, 2], dtype=int32), array([1, 0], dtype=int32))
+        >>> batch.strand
+        array([ True, False])
+        >>> batch.qlen
+        array([9, 9])
+        >>> batch.attrs(0)
+        ['tp:A:P']
+        """
+
+        if names is None:
+            names = NameTable()
+
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n")
+
+        if not chunk.endswith(b"\n"):
+            chunk += b"\n"
+
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        line_ends = np.flatnonzero(data == ord("\n"))
+        line_starts = np.concatenate([[0], line_ends[:-1] + 1])
+        tabs = np.flatnonzero(data == ord("\t"))
+
+        ncolumns = len(PAF.columns())
+        first_tab = np.searchsorted(tabs, line_starts)
+        ntabs = np.searchsorted(tabs, line_ends) - first_tab
+
+        if np.any(ntabs < ncolumns - 1):
+            i = int(np.argmax(ntabs < ncolumns - 1))
+            line = chunk[line_starts[i]: line_ends[i]].decode()
+            raise AssertionError(f"Wrong number of columns {line}")
+
+        # The column boundaries are the tabs following the start of a line.
+        # The last column might be terminated by a tab or the line end.
+        field_starts = [line_starts]
+        field_ends = []
+        for i in range(ncolumns - 1):
+            field_ends.append(tabs[first_tab + i])
+            field_starts.append(tabs[first_tab + i] + 1)
+
+        last_tab = np.minimum(first_tab + ncolumns - 1, len(tabs) - 1)
+        field_ends.append(
+            np.where(ntabs >= ncolumns, tabs[last_tab], line_ends)
+        )
+
+        columns = dict(zip(PAF.columns(), zip(field_starts, field_ends)))
+
+        # Names are interned in the order they appear, query then target.
+        qstart, qend = columns["query"]
+        tstart, tend = columns["target"]
+        codes = _encode_names(
+            data,
+            np.stack([qstart, tstart], axis=1).ravel(),
+            np.stack([qend, tend], axis=1).ravel(),
+            names,
+        ).reshape(-1, 2)
+
+        sstart, send = columns["strand"]
+        strand = (data[sstart] == ord("+")) & (send - sstart == 1)
+
+        int_columns = [c for c in PAF.columns() if c not in NON_INT_COLUMNS]
+        ints = _parse_ints(
+            data,
+            np.concatenate([columns[c][0] for c in int_columns]),
+            np.concatenate([columns[c][1] for c in int_columns]),
+        )
+        ints = dict(zip(int_columns, ints.reshape(len(int_columns), -1)))
+
+        return cls(
+            names,
+            codes[:, 0],
+            ints["qlen"],
+            ints["qstart"],
+            ints["qend"],
+            strand,
+            codes[:, 1],
+            ints["tlen"],
+            ints["tstart"],
+            ints["tend"],
+            ints["nmatch"],
+            ints["alilen"],
+            ints["mq"],
+            data,
+            line_starts,
+            line_ends,
+        )
+
+    @classmethod
+    def from_lines(
+        cls,
+        lines: Sequence[str],
+        names: Optional[NameTable] = None,
+    ) -> 'PAFBatch':
+        """ Parse a chunk of newline terminated PAF lines. """
+        return cls.from_bytes("".join(lines).encode(), names)
+
+    def line(self, i: int) -> str:
+        """ The original text of record i, without the newline. """
+        start = self.line_starts[i]
+        end = self.line_ends[i]
+        return self.data[start: end].tobytes().decode()
+
+    def text(self, mask: Optional[np.ndarray] = None) -> str:
+        """ The original text of the selected records, newline terminated.
+
+        Example:
+        >>> batch = PAFBatch.from_lines([
+        ...     "a\\t9\\t0\\t5\\t+\\tb\\t8\\t1\\t6\\t4\\t5\\t60\\n",
+        ...     "c\\t9\\t2\\t4\\t-\\ta\\t9\\t0\\t2\\t2\\t2\\t0\\n",
+        ... ])
+        >>> batch.text(np.array([False, True]))
+        'c\\t9\\t2\\t4\\t-\\ta\\t9\\t0\\t2\\t2\\t2\\t0\\n'
+        """
+
+        if mask is None:
+            return self.data.tobytes().decode()
+
+        # Mark the bytes of each selected line including its newline.
+        delta = np.zeros(len(self.data) + 1, dtype=np.int64)
+        delta[self.line_starts[mask]] += 1
+        delta[self.line_ends[mask] + 1] -= 1
+        selected = np.cumsum(delta[:-1]) > 0
+        return self.data[selected].tobytes().decode()
+
+    def attrs(self, i: int) -> List[str]:
+        """ The optional tag columns for record i. """
+        return self.line(i).split("\t")[len(PAF.columns()):]
+
+    def tags(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ The optional tag columns of every record as one byte array.
+
+        The tags of record i are data[offsets[i]:offsets[i + 1]], still
+        separated by tabs.
+
+        Example:
+        >>> batch = PAFBatch.from_lines([
+        ...     "a\\t9\\t0\\t5\\t+\\tb\\t8\\t1\\t6\\t4\\t5\\t0\\tx\\tyy\\n",
+        ...     "c\\t9\\t2\\t4\\t-\\ta\\t9\\t0\\t2\\t2\\t2\\t0\\n",
+        ... ])
+        >>> data, offsets = batch.tags()
+        >>> data.tobytes(), offsets
+        (b'x\\tyy', array([0, 4, 4]))
+        """
+
+        data = self.data
+        tabs = np.flatnonzero(data == ord("\t"))
+        first_tab = np.searchsorted(tabs, self.line_starts)
+        ntabs = np.searchsorted(tabs, self.line_ends) - first_tab
+
+        ncolumns = len(PAF.columns())
+        last_tab = np.minimum(first_tab + ncolumns - 1, len(tabs) - 1)
+        starts = np.where(
+            ntabs >= ncolumns,
+            tabs[last_tab] + 1,
+            self.line_ends
+        )
+        lengths = self.line_ends - starts
+
+        delta = np.zeros(len(data) + 1, dtype=np.int64)
+        np.add.at(delta, starts, 1)
+        np.add.at(delta, self.line_ends, -1)
+        selected = np.cumsum(delta[:-1]) > 0
+
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return data[selected], offsets
+
+    def record(self, i: int) -> PAF:
+        return PAF(
+            self.names[self.query[i]],
+            int(self.qlen[i]),
+            int(self.qstart[i]),
+            int(self.qend[i]),
+            "+" if self.strand[i] else "-",
+            self.names[self.target[i]],
+            int(self.tlen[i]),
+            int(self.tstart[i]),
+            int(self.tend[i]),
+            int(self.nmatch[i]),
+            int(self.alilen[i]),
+            int(self.mq[i]),
+            self.attrs(i),
+        )
+
+    def records(self) -> Iterator[PAF]:
+        for i in range(len(self)):
+            yield self.record(i)
+        return
+
+    def query_intervals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ The query start and end positions, with start <= end. """
+        return (np.minimum(self.qstart, self.qend),
+                np.maximum(self.qstart, self.qend))
+
+    def target_intervals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ The target start and end positions, with start <= end. """
+        return (np.minimum(self.tstart, self.tend),
+                np.maximum(self.tstart, self.tend))
+
+
+class QueryBlocks(object):
+
+    """ Checks that batches are sorted by query, so that each query is in
+    a single contiguous block, and finds where the blocks end.
+
+    Example:
+    >>> blocks = QueryBlocks()
+    >>> blocks.update(np.array([0, 0, 1]), 3)
+    (array([0]), array([2]))
+    >>> blocks.update(np.array([1, 2]), 3)
+    (array([1]), array([1]))
+    >>> blocks.update(np.array([0]), 3)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    pypafgraph.errors.InputOrderError: The input PAF is not sorted ...
+    """
+
+    def __init__(self):
+        self.finished = np.zeros(0, dtype=bool)
+        self.current: Optional[int] = None
+        return
+
+    def update(
+        self,
+        query: np.ndarray,
+        nnames: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ Add the queries of a batch, with ids from a NameTable of
+        nnames names.
+
+        Returns the queries whose blocks ended in this batch, and the row
+        that each ended at. A block that ends at the start of a batch is
+        returned with that batch.
+        """
+
+        self.finished = grow_array(self.finished, nnames, False)
+
+        if len(query) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        changes = np.flatnonzero(query[1:] != query[:-1]) + 1
+        block_starts = np.concatenate([[0], changes])
+        blocks = query[block_starts]
+
+        ended = blocks[:-1]
+        ended_at = block_starts[1:]
+        if self.current is not None and blocks[0] != self.current:
+            self.finished[self.current] = True
+            ended = np.concatenate([[self.current], ended])
+            ended_at = np.concatenate([[0], ended_at])
+
+        unsorted = (
+            np.any(self.finished[blocks]) or
+            len(np.unique(blocks)) != len(blocks)
+        )
+        if unsorted:
+            raise InputOrderError(
+                "The input PAF is not sorted by query. "
+                "Each query must be in a single contiguous block."
+            )
+
+        self.finished[ended] = True
+        self.current = int(blocks[-1])
+        return ended, ended_at
+
+
+def read_paf_batches(
+    handle: Iterable[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    names: Optional[NameTable] = None,
+    ranges: Optional[ColumnRanges] = None,
+) -> Iterator[PAFBatch]:
+    """ Read a PAF file as a stream of PAFBatch objects.
+
+    All batches share a single NameTable, so sequence ids are comparable
+    between batches.
+
+    The handle can also be a ColumnarPAF, in which case no parsing is done.
+    Its chunks are used as the batches, and the chunks that can't have any
+    records with values in the given column ranges are skipped. Text input
+    is never skipped, so the caller must still apply its own filters.
+    """
+
+    from pypafgraph.columnar import ColumnarPAF
+    if isinstance(handle, ColumnarPAF):
+        yield from handle.batches(ranges, names)
+        return
+
+    if names is None:
+        names = NameTable()
+
+    handle = iter(handle)
+    while True:
+        lines = list(islice(handle, batch_size))
+        if len(lines) == 0:
+            break
+
+        yield PAFBatch.from_lines(lines, names)
+    return
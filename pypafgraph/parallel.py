@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import multiprocessing.pool
+
+from os.path import getsize
+from collections import deque
+
+from typing import TypeVar
+from typing import Callable, Iterator, Iterable
+from typing import Tuple
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+DEFAULT_CHUNK_SIZE = 2 ** 25
+
+
+def get_context() -> multiprocessing.context.BaseContext:
+    """ Prefer forking so that workers share the parent's memory. """
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def file_chunks(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Tuple[int, int]]:
+    """ Split a file into byte ranges that end at line boundaries.
+
+    Every range except possibly the last is at least chunk_size bytes.
+    """
+
+    size = getsize(path)
+    with open(path, "rb") as handle:
+        start = 0
+        while start < size:
+            handle.seek(min(start + chunk_size, size))
+            handle.readline()
+            end = handle.tell()
+            yield start, end
+            start = end
+    return
+
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        return handle.read(end - start)
+
+
+def imap_ordered(
+    pool: multiprocessing.pool.Pool,
+    func: Callable[[T], U],
+    items: Iterable[T],
+    window: int,
+) -> Iterator[U]:
+    """ Like pool.imap, but with at most `window` tasks in flight.
+
+    This stops results from piling up in memory when the consumer is
+    slower than the workers.
+    """
+
+    pending: deque = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+
+        if len(pending) >= window:
+            yield pending.popleft().get()
+
+    while len(pending) > 0:
+        yield pending.popleft().get()
+    return
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+import threading
+
+from contextlib import closing
+from queue import Queue, Full
+
+from typing import TypeVar
+from typing import Callable, Iterator, Iterable
+from typing import List, NamedTuple, Optional, Union
+from typing import IO
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+# The number of items each stage can get ahead of the next one.
+DEFAULT_DEPTH = 4
+
+# Writes are joined until at least this many characters or bytes.
+DEFAULT_BUFFER_SIZE = 2 ** 22
+
+# How often in seconds a blocked thread checks if it should stop.
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class _Failure(NamedTuple):
+
+    """ An exception raised in a thread, to re-raise in the caller. """
+
+    error: BaseException
+
+
+def _put(queue: Queue, item, stop: threading.Event) -> bool:
+    """ Put an item in a queue unless asked to stop while waiting. """
+
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=POLL_INTERVAL)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def prefetch(items: Iterable[T], depth: int = DEFAULT_DEPTH) -> Iterator[T]:
+    """ Iterate over items in a background thread, up to depth ahead.
+
+    This lets reading and parsing the next batches overlap with work on
+    the current one. Exceptions raised while iterating are re-raised here,
+    and the thread stops if the caller stops early.
+
+    Example:
+    >>> list(prefetch(range(10), depth=2))
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    >>> list(prefetch(int(s) for s in ["1", "two"]))
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid literal for int() with base 10: 'two'
+    """
+
+    queue: Queue = Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if not _put(queue, item, stop):
+                    return
+            _put(queue, _DONE, stop)
+        except BaseException as e:
+            _put(queue, _Failure(e), stop)
+        return
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            elif isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class BackgroundWriter(object):
+
+    """ Hand items to a function in a background thread, in order.
+
+    At most depth items wait to be written, so a slow writer holds back
+    the caller rather than filling memory. If writing fails, the exception
+    is re-raised by the next put or by close.
+
+    Example:
+    >>> written = []
+    >>> with BackgroundWriter(written.append, depth=2) as writer:
+    ...     for i in range(5):
+    ...         writer.put(i)
+    >>> written
+    [0, 1, 2, 3, 4]
+    """
+
+    def __init__(
+        self,
+        write: Callable[[T], None],
+        depth: int = DEFAULT_DEPTH,
+    ):
+        self.write = write
+        self.queue: Queue = Queue(maxsize=depth)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            elif self.error is not None:
+                # Keep taking items so that put doesn't block forever.
+                continue
+
+            try:
+                self.write(item)
+            except BaseException as e:
+                self.error = e
+        return
+
+    def put(self, item: T):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+        return
+
+    def close(self):
+        """ Wait for everything to be written. """
+
+        if self.thread.is_alive():
+            self.queue.put(_DONE)
+            self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+        return
+
+    def __enter__(self) -> 'BackgroundWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't hide the original exception with a write error.
+            self.error = None
+            self.queue.put(_DONE)
+            self.thread.join()
+        return
+
+
+class JoinedWriter(object):
+
+    """ Join small writes into a few large ones.
+
+    Works with both text and binary handles, as long as all writes are
+    the same type.
+
+    Example:
+    >>> import io
+    >>> handle = io.StringIO()
+    >>> writer = JoinedWriter(handle, buffer_size=4)
+    >>> writer.write("ab")
+    >>> handle.getvalue()
+    ''
+    >>> writer.write("cd")
+    >>> writer.write("e")
+    >>> writer.flush()
+    >>> handle.getvalue()
+    'abcde'
+    """
+
+    def __init__(
+        self,
+        handle: IO,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+    ):
+        self.handle = handle
+        self.buffer_size = buffer_size
+        self.parts: List[Union[str, bytes]] = []
+        self.size = 0
+        return
+
+    def write(self, data: Union[str, bytes]):
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer_size:
+            self.flush()
+        return
+
+    def flush(self):
+        if len(self.parts) > 0:
+            self.handle.write(self.parts[0][:0].join(self.parts))
+            self.parts = []
+            self.size = 0
+        return
+
+
+def run_pipeline(
+    items: Iterable[T],
+    compute: Callable[[T], U],
+    write: Callable[[U], None],
+    depth: int = DEFAULT_DEPTH,
+):
+    """ Read, compute and write with the three steps overlapping.
+
+    items is iterated in a reader thread, compute runs in this thread, and
+    each result is given to write in a writer thread, all in order.
+    Bounded queues between the steps mean that at most about 2 * depth
+    items are held in memory. An exception in any step stops the others
+    and is re-raised here.
+
+    Stages in STATS can be used in any of the steps, but their wall times
+    will overlap, and their cpu times include all of the threads.
+
+    Example:
+    >>> results = []
+    >>> run_pipeline(range(5), lambda i: i * i, results.append)
+    >>> results
+    [0, 1, 4, 9, 16]
+    """
+
+    with BackgroundWriter(write, depth) as writer, \
+            closing(prefetch(items, depth)) as reader:
+        for item in reader:
+            writer.put(compute(item))
+    return
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+from typing import Iterator, List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from pypafgraph.paf import PAFBatch, NameTable, QueryBlocks
+from pypafgraph.intervals import merge_keyed_intervals
+from pypafgraph.spill import SpillRuns
+from pypafgraph.utils import grow_array
+from pypafgraph.errors import InputOrderError
+
+# The number of buffered intervals that triggers a merge.
+DEFAULT_BUFFER_SIZE = 2 ** 20
+
+# The repeats found for some sequences: names, and the sequence index,
+# start and end of each merged interval.
+RepeatIntervals = Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]
+
+
+def repeat_pieces(
+    batch: PAFBatch,
+    sep: str,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """ The repeat intervals implied by the alignments in a batch.
+
+    Alignments between sequences from the same genome give an interval on
+    each sequence. Alignments of a sequence to an overlapping region of
+    itself give the symmetric difference of the two regions instead.
+
+    Returns the sequence id, start, end and source record of each interval.
+    Every record gives two intervals, which may be empty.
+
+    Example:
+    >>> batch = PAFBatch.from_lines([
+    ...     "g1.a\\t99\\t0\\t50\\t+\\tg1.b\\t99\\t10\\t60\\t50\\t50\\t0\\n",
+    ...     "g1.a\\t99\\t0\\t50\\t+\\tg1.a\\t99\\t30\\t80\\t50\\t50\\t0\\n",
+    ...     "g1.a\\t99\\t0\\t50\\t+\\tg2.a\\t99\\t0\\t50\\t50\\t50\\t0\\n",
+    ... ])
+    >>> keys, starts, ends, rows = repeat_pieces(batch, ".")
+    >>> keys.tolist(), starts.tolist(), ends.tolist(), rows.tolist()
+    ([0, 1, 0, 0], [0, 10, 0, 50], [50, 60, 30, 80], [0, 0, 1, 1])
+    """
+
+    genomes = batch.names.genome_ids(sep)
+    rows = np.flatnonzero(genomes[batch.query] == genomes[batch.target])
+
+    query = batch.query[rows]
+    target = batch.target[rows]
+    qstarts, qends = (a[rows] for a in batch.query_intervals())
+    tstarts, tends = (a[rows] for a in batch.target_intervals())
+
+    overlapping = (query == target) & (tstarts < qends) & (tends > qstarts)
+
+    # The symmetric difference of two overlapping intervals is the region
+    # between their starts and the region between their ends.
+    first_starts = np.where(overlapping, np.minimum(qstarts, tstarts),
+                            qstarts)
+    first_ends = np.where(overlapping, np.maximum(qstarts, tstarts), qends)
+    second_starts = np.where(overlapping, np.minimum(qends, tends), tstarts)
+    second_ends = np.where(overlapping, np.maximum(qends, tends), tends)
+
+    # Interleaved so that sequences are in the order they appear.
+    def interleave(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return np.stack([a, b], axis=1).ravel()
+
+    return (
+        interleave(query, target),
+        interleave(first_starts, second_starts),
+        interleave(first_ends, second_ends),
+        np.repeat(rows, 2),
+    )
+
+
+class RepeatAccumulator(object):
+
+    """ Merges the repeat intervals of each sequence as batches are added.
+
+    Intervals are kept as flat arrays keyed by the order that sequences
+    first appear in. New intervals are buffered, and merged into the rest
+    with a sort and running maximum sweep as the buffer grows, so memory is
+    proportional to the merged intervals rather than the alignments. If
+    max_memory is given, the merged intervals are spilled to temporary
+    files when they exceed it, and the files are merged at the end.
+
+    Sequences are output in the order they first appear, with their
+    intervals sorted by start. If the input is sorted by query, a sequence
+    is finished as soon as its block of alignments ends, and
+    finished sequences are output from add. This needs every alignment
+    where a sequence is the target to come before its own block, which
+    is true for a query sorted all-vs-all where each pair is only reported
+    once (e.g. minimap2 -X).
+
+    Example:
+    >>> batch = PAFBatch.from_lines([
+    ...     "g.a\\t99\\t0\\t50\\t+\\tg.b\\t99\\t10\\t60\\t50\\t50\\t0\\n",
+    ...     "g.b\\t99\\t40\\t90\\t+\\tg.a\\t99\\t60\\t70\\t50\\t50\\t0\\n",
+    ... ])
+    >>> accumulator = RepeatAccumulator(".")
+    >>> accumulator.add(batch) is None
+    True
+    >>> names, keys, starts, ends = next(accumulator.finish())
+    >>> [(names[k], s, e) for k, s, e in
+    ...  zip(keys.tolist(), starts.tolist(), ends.tolist())]
+    [('g.a', 0, 50), ('g.a', 60, 70), ('g.b', 10, 90)]
+    """
+
+    def __init__(
+        self,
+        sep: str,
+        sorted_by_query: bool = False,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        max_memory: Optional[int] = None,
+        tmpdir: Optional[str] = None,
+    ):
+        self.sep = sep
+        self.sorted_by_query = sorted_by_query
+        self.buffer_size = buffer_size
+        self.max_memory = max_memory
+
+        self.names: Optional[NameTable] = None
+        self.first_seen = np.zeros(0, dtype=np.int64)
+        self.seen_ids = np.zeros(0, dtype=np.int64)
+        self.nseen = 0
+
+        self.blocks = QueryBlocks()
+
+        self.state = self._empty()
+        self.pending: List[Tuple[np.ndarray, ...]] = []
+        self.npending = 0
+
+        # Sequences already output by _pop. Their intervals are left in the
+        # state until the next merge, so they're marked by rank here.
+        self.popped = np.zeros(0, dtype=bool)
+        self.nstale = 0
+
+        self.spills = SpillRuns(tmpdir)
+        self.spilled = np.zeros(0, dtype=np.int64)
+        return
+
+    @staticmethod
+    def _empty() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(3))
+
+    def nbytes(self) -> int:
+        """ An estimate of the memory used by the intervals. """
+        return sum(a.nbytes for p in [self.state] + self.pending for a in p)
+
+    def _mark_seen(self, keys: np.ndarray):
+        """ Number the sequences in the order that they first appear. """
+
+        new = keys[self.first_seen[keys] < 0]
+        if len(new) == 0:
+            return
+
+        new, first = np.unique(new, return_index=True)
+        new = new[np.argsort(first)]
+        self.first_seen[new] = np.arange(self.nseen, self.nseen + len(new))
+        self.seen_ids = grow_array(self.seen_ids, self.nseen + len(new))
+        self.seen_ids[self.nseen:self.nseen + len(new)] = new
+        self.nseen += len(new)
+        return
+
+    def _finish_blocks(
+        self,
+        query: np.ndarray,
+        keys: np.ndarray,
+        rows: np.ndarray,
+    ) -> np.ndarray:
+        """ Find the queries whose blocks end in this batch, and check that
+        the input is sorted.
+        """
+
+        ended, ended_at = self.blocks.update(query, len(self.names))
+
+        # A finished sequence mustn't get any more intervals.
+        finished = self.blocks.finished
+        finished_from = np.full(len(finished), len(query) + 1)
+        finished_from[finished] = -1
+        finished_from[ended] = ended_at
+        late = rows >= finished_from[keys]
+        if np.any(late):
+            name = self.names[int(keys[np.argmax(late)])]
+            raise InputOrderError(
+                f"Found an alignment to {name} after its block of queries "
+                "ended. With --sorted, every alignment where a sequence is "
+                "the target must come before its own block, e.g. by only "
+                "reporting each pair once."
+            )
+        return ended
+
+    def _merge(self):
+        """ Merge the buffered intervals into the state, dropping the
+        intervals of sequences that have already been output.
+        """
+
+        if self.npending == 0 and self.nstale == 0:
+            return
+
+        state = self.state
+        if self.nstale > 0:
+            self.popped = grow_array(self.popped, self.nseen, False)
+            live = ~self.popped[state[0]]
+            state = tuple(column[live] for column in state)
+            self.nstale = 0
+
+        keys, starts, ends = (
+            np.concatenate(columns)
+            for columns in zip(state, *self.pending)
+        )
+        self.state = merge_keyed_intervals(keys, starts, ends)
+        self.pending = []
+        self.npending = 0
+        return
+
+    def _output(
+        self,
+        ranks: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+    ) -> RepeatIntervals:
+        names = [] if self.names is None else self.names.names
+        return names, self.seen_ids[ranks], starts, ends
+
+    def _pop(self, ids: np.ndarray) -> RepeatIntervals:
+        """ Take the merged intervals of some finished sequences.
+
+        Only these sequences' intervals are merged, and the rest of the
+        buffer is left for the next merge. Sequences that have been spilled
+        are left to be merged at the end.
+        """
+
+        # Sequences without any intervals have never been given a rank.
+        ranks = self.first_seen[ids]
+        ranks = np.setdiff1d(ranks[ranks >= 0], self.spilled)
+        self.popped = grow_array(self.popped, self.nseen, False)
+        self.popped[ranks] = True
+
+        # The state is sorted by rank, so each sequence is a slice of it.
+        state_keys = self.state[0]
+        lo = np.searchsorted(state_keys, ranks, side="left")
+        hi = np.searchsorted(state_keys, ranks, side="right")
+        sizes = hi - lo
+        offsets = np.cumsum(sizes) - sizes
+        index = np.arange(sizes.sum()) + np.repeat(lo - offsets, sizes)
+        parts = [tuple(column[index] for column in self.state)]
+        self.nstale += len(index)
+
+        pending = []
+        for chunk in self.pending:
+            selected = self.popped[chunk[0]]
+            if np.any(selected):
+                parts.append(tuple(column[selected] for column in chunk))
+                chunk = tuple(column[~selected] for column in chunk)
+            pending.append(chunk)
+
+        self.pending = pending
+        self.npending = sum(len(chunk[0]) for chunk in pending)
+
+        keys, starts, ends = (np.concatenate(c) for c in zip(*parts))
+        return self._output(*merge_keyed_intervals(keys, starts, ends))
+
+    def spill(self):
+        """ Write the merged intervals out to a temporary file. """
+
+        self._merge()
+        ranks, starts, ends = self.state
+        if len(ranks) > 0:
+            self.spills.write({"key": ranks, "start": starts, "end": ends})
+            self.spilled = np.union1d(self.spilled, ranks)
+        self.state = self._empty()
+        return
+
+    def add(self, batch: PAFBatch) -> Optional[RepeatIntervals]:
+        """ Add the repeats found in a batch.
+
+        If the input is sorted by query, returns the intervals of the
+        sequences that this batch finishes, if there are any.
+        """
+
+        self.names = batch.names
+        nnames = len(batch.names)
+        self.first_seen = grow_array(self.first_seen, nnames, -1)
+
+        keys, starts, ends, rows = repeat_pieces(batch, self.sep)
+        self._mark_seen(keys)
+
+        nonempty = ends > starts
+        keys = keys[nonempty]
+        starts = starts[nonempty]
+        ends = ends[nonempty]
+
+        ended = np.zeros(0, dtype=np.int64)
+        if self.sorted_by_query and len(batch) > 0:
+            ended = self._finish_blocks(batch.query, keys, rows[nonempty])
+
+        self.pending.append((self.first_seen[keys], starts, ends))
+        self.npending += len(keys)
+
+        finished = None
+        if len(ended) > 0:
+            finished = self._pop(ended)
+        elif self.npending >= max(self.buffer_size, len(self.state[0])):
+            self._merge()
+
+        if self.max_memory is not None and self.nbytes() > self.max_memory:
+            self.spill()
+        return finished
+
+    def finish(self) -> Iterator[RepeatIntervals]:
+        """ The merged intervals of all remaining sequences.
+
+        Spilled runs are merged a window of sequences at a time, so the
+        intervals may come in several parts.
+        """
+
+        if len(self.spills) == 0:
+            self._merge()
+            yield self._output(*self.state)
+            self.state = self._empty()
+            return
+
+        self.spill()
+        for window in self.spills.windows():
+            yield self._output(*merge_keyed_intervals(
+                window["key"],
+                window["start"],
+                window["end"],
+            ))
+        self.spills.close()
+        return
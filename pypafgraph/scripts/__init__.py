@@ -3,56 +3,181 @@
 import sys
 import argparse
 
-from pypafgraph.scripts.filter import filter_cli, filter_main
-from pypafgraph.scripts.repeats import repeats_cli, repeats_main
-from pypafgraph.scripts.unsoftmask import unsoftmask_cli, unsoftmask_main
-from pypafgraph.scripts.cluster import cluster_cli, cluster_main
-from pypafgraph.scripts.selectseqs import selectseqs_cli, selectseqs_main
+from importlib import import_module
 
+from typing import List, NamedTuple
+from typing import Optional
 
-def cli(prog: str, args: str) -> argparse.Namespace:
+from pypafgraph.errors import InputOrderError
+from pypafgraph.stats import STATS, DEFAULT_PROGRESS_INTERVAL
 
-    parser = argparse.ArgumentParser(
-        prog=prog,
-        description=""
-    )
 
-    subparsers = parser.add_subparsers(dest='subparser_name')
+class Subcommand(NamedTuple):
 
-    filter_subparser = subparsers.add_parser(
-        "filter",
-        help="Filter matches."
-    )
+    """ A subcommand implemented by {name}_cli and {name}_main in module,
+    with any dashes in the name replaced by underscores.
 
-    filter_cli(filter_subparser)
+    The module is only imported when the subcommand is used, so that
+    running one subcommand doesn't pay for the dependencies of the others.
+    """
 
-    repeats_subparser = subparsers.add_parser(
-        "repeats",
-        help="Find segmental duplications."
-    )
+    name: str
+    module: str
+    help: str
+
+    def load(self, suffix: str):
+        function = self.name.replace("-", "_") + suffix
+        return getattr(import_module(self.module), function)
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        self.load("_cli")(parser)
+        return
+
+    def run(self, args: argparse.Namespace):
+        self.load("_main")(args)
+        return
 
-    repeats_cli(repeats_subparser)
 
-    unsoftmask_subparser = subparsers.add_parser(
+SUBCOMMANDS = [
+    Subcommand(
+        "filter",
+        "pypafgraph.scripts.filter",
+        "Filter matches."
+    ),
+    Subcommand(
+        "repeats",
+        "pypafgraph.scripts.repeats",
+        "Find segmental duplications."
+    ),
+    Subcommand(
         "unsoftmask",
-        help="Find softmasked regions and uppercase sequences."
+        "pypafgraph.scripts.unsoftmask",
+        "Find softmasked regions and uppercase sequences."
+    ),
+    Subcommand(
+        "cluster",
+        "pypafgraph.scripts.cluster",
+        "Cluster sequences."
+    ),
+    Subcommand(
+        "selectseqs",
+        "pypafgraph.scripts.selectseqs",
+        "Extract sequences given a tsv of clusters."
+    ),
+    Subcommand(
+        "convert",
+        "pypafgraph.scripts.convert",
+        "Convert a paf to a faster binary columnar format."
+    ),
+    Subcommand(
+        "index-repeats",
+        "pypafgraph.scripts.index_repeats",
+        "Save a bed of repeats as an index for filter to reuse."
+    ),
+]
+
+
+class _PeekError(Exception):
+    pass
+
+
+class _PeekParser(argparse.ArgumentParser):
+
+    """ A parser that raises instead of printing usage and exiting. """
+
+    def error(self, message: str):
+        raise _PeekError(message)
+
+    def exit(self, status: int = 0, message: Optional[str] = None):
+        raise _PeekError(message)
+
+
+def add_global_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile",
+        default=False,
+        action="store_true",
+        help=(
+            "Write the time, memory use and throughput of each stage to "
+            "stderr at exit."
+        )
     )
 
-    unsoftmask_cli(unsoftmask_subparser)
+    parser.add_argument(
+        "--stats",
+        default=None,
+        type=str,
+        help=(
+            "Write the time, memory use and throughput of each stage, and "
+            "counters like the alignments failing each filter, to this "
+            "file as JSON at exit. Use '-' for stdout."
+        )
+    )
 
-    cluster_subparser = subparsers.add_parser(
-        "cluster",
-        help="Cluster sequences."
+    parser.add_argument(
+        "--progress",
+        default=False,
+        action="store_true",
+        help="Report the throughput of each stage to stderr as it runs."
     )
 
-    cluster_cli(cluster_subparser)
+    parser.add_argument(
+        "--progress-interval",
+        default=DEFAULT_PROGRESS_INTERVAL,
+        type=float,
+        help="The number of seconds between --progress reports.",
+    )
+    return
 
-    selectseqs_subparser = subparsers.add_parser(
-        "selectseqs",
-        help="Extract sequences given a tsv of clusters."
+
+def peek_subcommand(args: List[str]) -> Optional[str]:
+    """ Find which subcommand is being run without parsing its arguments.
+
+    Examples:
+    >>> peek_subcommand(["--stats", "filter", "repeats", "in.paf"])
+    'repeats'
+    >>> peek_subcommand(["--help"]) is None
+    True
+    >>> peek_subcommand(["--stats"]) is None
+    True
+    """
+
+    parser = _PeekParser(add_help=False)
+    add_global_arguments(parser)
+    subparsers = parser.add_subparsers(dest="subparser_name")
+    for subcommand in SUBCOMMANDS:
+        subparsers.add_parser(subcommand.name, add_help=False)
+
+    try:
+        parsed, _ = parser.parse_known_args(args)
+    except _PeekError:
+        # Let the real parser report the problem.
+        return None
+    return parsed.subparser_name
+
+
+def cli(prog: str, args: List[str]) -> argparse.Namespace:
+
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description=""
     )
 
-    selectseqs_cli(selectseqs_subparser)
+    add_global_arguments(parser)
+
+    subparsers = parser.add_subparsers(dest='subparser_name')
+
+    # Only the subcommand being run needs its arguments, so the others
+    # aren't imported.
+    selected = peek_subcommand(args)
+    for subcommand in SUBCOMMANDS:
+        subparser = subparsers.add_parser(
+            subcommand.name,
+            help=subcommand.help
+        )
+
+        if subcommand.name == selected:
+            subcommand.add_arguments(subparser)
 
     parsed = parser.parse_args(args)
 
@@ -63,19 +188,29 @@ def cli(prog: str, args: str) -> argparse.Namespace:
     return parsed
 
 
+def write_stats(args: argparse.Namespace):
+    if args.profile:
+        STATS.write_table(sys.stderr)
+
+    if args.stats == "-":
+        STATS.write_json(sys.stdout)
+    elif args.stats is not None:
+        with open(args.stats, "w") as handle:
+            STATS.write_json(handle)
+    return
+
+
 def main():
     args = cli(prog=sys.argv[0], args=sys.argv[1:])
+
+    STATS.command = args.subparser_name
+    if args.progress:
+        STATS.set_progress(sys.stderr, args.progress_interval)
+
+    subcommands = {s.name: s for s in SUBCOMMANDS}
     try:
-        if args.subparser_name == "filter":
-            filter_main(args)
-        elif args.subparser_name == "repeats":
-            repeats_main(args)
-        elif args.subparser_name == "unsoftmask":
-            unsoftmask_main(args)
-        elif args.subparser_name == "cluster":
-            cluster_main(args)
-        elif args.subparser_name == "selectseqs":
-            selectseqs_main(args)
+        if args.subparser_name in subcommands:
+            subcommands[args.subparser_name].run(args)
         else:
             raise ValueError("I shouldn't reach this point ever")
 
@@ -83,6 +218,11 @@ def main():
         # Pipes get closed and that's normal
         sys.exit(0)
 
+    except InputOrderError as e:
+        # A problem with the input files rather than a bug.
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
     except KeyboardInterrupt:
         print("Received keyboard interrupt. Exiting.", file=sys.stderr)
         sys.exit(1)
@@ -103,4 +243,7 @@ def main():
         ), file=sys.stderr)
         raise e
 
+    finally:
+        write_stats(args)
+
     return
@@ -1,31 +1,51 @@
 #!/usr/bin/env python3
 
 import sys
+import time
 import argparse
 
-import networkx as nx
+from functools import partial
+from itertools import product
 
-import markov_clustering as mc
+from typing import Any, Dict, List, Tuple
+from typing import Optional
+from typing import TextIO
 
-from pypafgraph.paf import PAF
-from pypafgraph.clustering import paf_to_graph
+from pypafgraph.paf import read_paf_batches
+from pypafgraph.clustering import CoverageTable, pairwise_coverage
+from pypafgraph.clustering import mcl_clusters, cluster_components
+from pypafgraph.clustering import modularity
+from pypafgraph.cache import CoverageCache, file_key, DEFAULT_CACHE_SIZE
+from pypafgraph.utils import parse_size, is_regular_file
+from pypafgraph.parallel import get_context
+from pypafgraph.columnar import PAFInput
+from pypafgraph.files import open_output, compressed_name
+from pypafgraph.files import add_compression_arguments
+from pypafgraph.stats import STATS
+
+GRID_PARAMETERS = ("inflation", "expansion", "min-cov")
 
 
 def cluster_cli(parser: argparse.ArgumentParser):
     parser.add_argument(
         "inpaf",
         default=sys.stdin,
-        type=argparse.FileType('r'),
-        help="Input paf file. Use '-' for stdin.",
+        type=PAFInput(),
+        help=(
+            "Input paf file, optionally compressed or columnar. "
+            "Use '-' for stdin."
+        ),
     )
 
     parser.add_argument(
         "-o", "--outfile",
-        default=sys.stdout,
-        type=argparse.FileType('w'),
+        default="-",
+        type=str,
         help="Output paf file path. Default stdout.",
     )
 
+    add_compression_arguments(parser)
+
     parser.add_argument(
         "-c", "--min-cov",
         default=0.0,
@@ -34,6 +54,54 @@ def cluster_cli(parser: argparse.ArgumentParser):
               "two sequences to be called.")
     )
 
+    parser.add_argument(
+        "--sorted",
+        default=False,
+        action="store_true",
+        help=(
+            "Indicate that the input paf is sorted by query, so that pairs "
+            "can be finalised as soon as both sequences have been seen."
+        )
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        default=None,
+        type=parse_size,
+        help=(
+            "Spill partially accumulated alignments to temporary files when "
+            "they use more than this much memory, e.g. 8G."
+        )
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        default=None,
+        type=str,
+        help="Where to write temporary files. Default the system default."
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        type=str,
+        help=(
+            "Cache the pairwise coverages of the input paf in this "
+            "directory, so that later runs on the same file can skip "
+            "reading it."
+        )
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        default=DEFAULT_CACHE_SIZE,
+        type=parse_size,
+        help=(
+            "The maximum size of the cache directory. The least recently "
+            "used entries are removed first. Default 4G."
+        )
+    )
+
     parser.add_argument(
         "-i", "--inflation",
         default=1.4,
@@ -48,6 +116,120 @@ def cluster_cli(parser: argparse.ArgumentParser):
         help=""
     )
 
+    parser.add_argument(
+        "--engine",
+        default="markov_clustering",
+        choices=["markov_clustering", "native"],
+        help=(
+            "Which MCL implementation to use. The native engine works on "
+            "sparse matrices with mcl style pruning, and can use multiple "
+            "threads."
+        )
+    )
+
+    parser.add_argument(
+        "-t", "--threads",
+        default=1,
+        type=int,
+        help=(
+            "The number of worker processes used to cluster blocks of "
+            "connected components in parallel. If there is only one block, "
+            "the native engine uses this many threads for the expansion."
+        )
+    )
+
+    parser.add_argument(
+        "--min-mcl-size",
+        default=2,
+        type=int,
+        help=(
+            "Connected components with fewer nodes than this are called as "
+            "a cluster without running MCL. The default only skips single "
+            "sequences. Larger values are faster, but MCL can split "
+            "weakly linked pairs, so the clusters may differ."
+        )
+    )
+
+    parser.add_argument(
+        "--block-size",
+        default=2000,
+        type=int,
+        help=(
+            "Connected components are packed into blocks of about this many "
+            "nodes, and each block is clustered separately."
+        )
+    )
+
+    parser.add_argument(
+        "--prune",
+        default=1 / 4000,
+        type=float,
+        help=("The native engine removes matrix entries below this value. "
+              "Like mcl -P, but given as a proportion.")
+    )
+
+    parser.add_argument(
+        "--select",
+        default=500,
+        type=int,
+        help=("The native engine keeps at most this many entries per "
+              "column. Like mcl -S.")
+    )
+
+    parser.add_argument(
+        "--recover",
+        default=600,
+        type=int,
+        help=("If pruning removes too much of a column, the native engine "
+              "keeps up to this many of its largest entries. Like mcl -R.")
+    )
+
+    parser.add_argument(
+        "--recover-pct",
+        default=0.9,
+        type=float,
+        help=("The proportion of a column's mass below which the native "
+              "engine recovers entries. Like mcl -pct, but as a proportion.")
+    )
+
+    parser.add_argument(
+        "--max-iterations",
+        default=100,
+        type=int,
+        help="The maximum number of MCL iterations."
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        default=False,
+        action="store_true",
+        help="Write per-iteration statistics of the native engine to stderr."
+    )
+
+    parser.add_argument(
+        "--grid",
+        default=None,
+        action=GridAction,
+        type=grid_parameter,
+        help=(
+            "Cluster with every combination of a parameter's values, e.g. "
+            "'inflation=1.2,1.4,2.0'. Give this once per parameter to "
+            "combine several, e.g. '--grid inflation=1.2,2.0 "
+            "--grid min-cov=0.1,0.3'. Parameters can be any of inflation, "
+            "expansion and min-cov. The coverages are only "
+            "found once, and combinations are run in --threads processes. "
+            "Each combination writes a tsv starting with --grid-prefix, "
+            "and a summary is written to --outfile."
+        )
+    )
+
+    parser.add_argument(
+        "--grid-prefix",
+        default="cluster_",
+        type=str,
+        help="The prefix of the tsv files written by --grid."
+    )
+
     parser.add_argument(
         "-p", "--plot",
         default=None,
@@ -78,7 +260,56 @@ def cluster_cli(parser: argparse.ArgumentParser):
     return
 
 
+def grid_parameter(string: str) -> Tuple[str, List[float]]:
+    """ Parse a parameter and its values for --grid.
+
+    Example:
+    >>> grid_parameter("min-cov=0.1,0.3")
+    ('min-cov', [0.1, 0.3])
+    """
+
+    name, sep, values = string.partition("=")
+    if sep == "" or name not in GRID_PARAMETERS:
+        raise argparse.ArgumentTypeError(
+            f"Grid parameters must be one of {', '.join(GRID_PARAMETERS)} "
+            f"followed by '=' and a comma separated list of values. "
+            f"Got {string}."
+        )
+
+    try:
+        return name, [float(v) for v in values.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Grid parameter {name} has a value that isn't a number."
+        )
+
+
+class GridAction(argparse.Action):
+
+    """ Collect the --grid parameters, allowing each one only once. """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        name, _ = values
+        grid = getattr(namespace, self.dest) or []
+        if any(n == name for n, _ in grid):
+            parser.error(
+                f"argument {option_string}: {name} was given more than "
+                f"once. Give all of its values together, e.g. "
+                f"'{option_string} {name}=1,2'."
+            )
+        setattr(namespace, self.dest, grid + [values])
+        return
+
+
+def check_expansion(expansion: float) -> int:
+    # Older scipy versions accepted a float power, but it must be an integer.
+    if not float(expansion).is_integer():
+        raise ValueError("The expansion parameter must be a whole number.")
+    return int(expansion)
+
+
 def plot_clusters(filename, matrix, clusters, height=5, width=7, dpi=300):
+    import markov_clustering as mc
     from matplotlib import pyplot as plt
 
     fig, ax = plt.subplots(figsize=(width, height))
@@ -96,37 +327,235 @@ def plot_clusters(filename, matrix, clusters, height=5, width=7, dpi=300):
     return
 
 
-def cluster_main(args: argparse.Namespace):
-    paf = PAF.from_file(args.inpaf)
-    G = paf_to_graph(paf, min_cov=args.min_cov)
+def load_coverage(args: argparse.Namespace) -> CoverageTable:
+    """ Find the pairwise coverages, using the cache if there is one. """
 
-    nodes = list(G.nodes())
-    matrix = nx.to_scipy_sparse_matrix(G, nodelist=nodes)
-    result = mc.run_mcl(
-        matrix,
-        expansion=args.expansion,
-        inflation=args.inflation
+    cache = None
+    if args.cache_dir is not None and is_regular_file(args.inpaf):
+        cache = CoverageCache(args.cache_dir, args.cache_size)
+        key = file_key(args.inpaf.name)
+        table = cache.get(key)
+
+        if table is not None:
+            STATS.count("cluster.cache_hits")
+            return table
+
+    elif args.cache_dir is not None:
+        print(
+            "The input paf isn't a regular file, so it won't be cached.",
+            file=sys.stderr
+        )
+
+    table = pairwise_coverage(
+        STATS.timed("parse", read_paf_batches(args.inpaf)),
+        sorted_by_query=args.sorted,
+        max_memory=args.max_memory,
+        tmpdir=args.tmpdir,
     )
-    clusters = mc.get_clusters(result)
 
-    named_clusters = [
-        [nodes[i] for i in cl]
-        for cl
-        in clusters
-    ]
+    if cache is not None:
+        cache.put(key, table)
+    return table
 
-    for i, cluster_members in enumerate(named_clusters, 1):
-        for member in cluster_members:
-            print(f"{i}\t{member}", file=args.outfile)
 
-    if args.plot is not None:
-        plot_clusters(
-            args.plot,
+def write_clusters(
+    handle: TextIO,
+    names: List[str],
+    clusters: List[Tuple[int, ...]],
+):
+    for i, cluster in enumerate(clusters, 1):
+        for member in cluster:
+            print(f"{i}\t{names[member]}", file=handle)
+    return
+
+
+def base_cluster_func(args: argparse.Namespace) -> partial:
+    """ MCL with all of the settings except inflation and expansion. """
+
+    cluster_func = partial(
+        mcl_clusters,
+        engine=args.engine,
+        iterations=args.max_iterations,
+        verbose=args.verbose,
+    )
+
+    if args.engine == "native":
+        cluster_func = partial(
+            cluster_func,
+            pruning_threshold=args.prune,
+            select=args.select,
+            recover=args.recover,
+            recover_pct=args.recover_pct,
+        )
+    return cluster_func
+
+
+# Shared with the worker processes by grid_init.
+_WORKER_STATE: Dict[str, Any] = dict()
+
+
+def grid_init(
+    table: CoverageTable,
+    cluster_func: partial,
+    min_size: int,
+    block_size: int,
+    compression: Optional[str],
+):
+    _WORKER_STATE.update(
+        table=table,
+        cluster_func=cluster_func,
+        min_size=min_size,
+        block_size=block_size,
+        compression=compression,
+    )
+    return
+
+
+def grid_run(task: Tuple[Dict[str, float], str]) -> Tuple[int, float, float]:
+    """ Cluster with one combination of parameters and write the tsv.
+
+    Returns the number of clusters, the modularity and the runtime.
+    """
+
+    state = _WORKER_STATE
+    params, path = task
+
+    start = time.perf_counter()
+    graph = state["table"].to_graph(params["min-cov"])
+    clusters = cluster_components(
+        graph.matrix,
+        partial(
+            state["cluster_func"],
+            inflation=params["inflation"],
+            expansion=int(params["expansion"]),
+        ),
+        min_size=state["min_size"],
+        block_size=state["block_size"],
+    )
+
+    with open_output(path, "w", state["compression"], 1) as handle:
+        write_clusters(handle, graph.names, clusters)
+
+    seconds = time.perf_counter() - start
+    return len(clusters), modularity(graph.matrix, clusters), seconds
+
+
+def cluster_grid(
+    args: argparse.Namespace,
+    table: CoverageTable,
+    outfile: TextIO,
+):
+    """ Cluster with every combination of the --grid parameters.
+
+    The table is handed to the workers as they start, which with fork is
+    shared copy-on-write rather than copied.
+    """
+
+    grid = {
+        "inflation": [args.inflation],
+        "expansion": [args.expansion],
+        "min-cov": [args.min_cov],
+    }
+    grid.update(args.grid)
+
+    for expansion in grid["expansion"]:
+        check_expansion(expansion)
+
+    tasks = []
+    for values in product(*grid.values()):
+        params = dict(zip(grid.keys(), values))
+        name = "_".join(f"{k}{v:g}" for k, v in params.items())
+        path = compressed_name(f"{args.grid_prefix}{name}.tsv", args.compress)
+        tasks.append((params, path))
+
+    initargs = (
+        table,
+        base_cluster_func(args),
+        args.min_mcl_size,
+        args.block_size,
+        args.compress,
+    )
+
+    if args.threads > 1 and len(tasks) > 1:
+        context = get_context()
+        nprocesses = min(args.threads, len(tasks))
+        with context.Pool(nprocesses, grid_init, initargs) as pool:
+            results = pool.map(grid_run, tasks, chunksize=1)
+    else:
+        grid_init(*initargs)
+        results = [grid_run(task) for task in tasks]
+
+    print(
+        "inflation\texpansion\tmin_cov\tnclusters\tmodularity\t"
+        "seconds\tpath",
+        file=outfile
+    )
+    for (params, path), (nclusters, quality, seconds) in zip(tasks, results):
+        print(
+            f"{params['inflation']:g}\t{params['expansion']:g}\t"
+            f"{params['min-cov']:g}\t{nclusters}\t{quality:.6f}\t"
+            f"{seconds:.3f}\t{path}",
+            file=outfile
+        )
+    return
+
+
+def cluster_main(args: argparse.Namespace):
+    with STATS.stage("coverage") as stage:
+        table = load_coverage(args)
+        stage.add(records_out=len(table.cov))
+
+    if args.grid is not None:
+        if args.plot is not None:
+            print("Plots aren't drawn with --grid.", file=sys.stderr)
+
+        with open_output(
+            args.outfile,
+            "w",
+            args.compress,
+            args.compress_threads
+        ) as outfile, STATS.stage("grid"):
+            cluster_grid(args, table, outfile)
+        return
+
+    with STATS.stage("graph") as stage:
+        graph = table.to_graph(args.min_cov)
+        matrix = graph.matrix
+        stage.add(len(table.cov), matrix.nnz // 2)
+
+    cluster_func = partial(
+        base_cluster_func(args),
+        inflation=args.inflation,
+        expansion=check_expansion(args.expansion),
+    )
+
+    with STATS.stage("mcl") as stage:
+        clusters = cluster_components(
             matrix,
-            clusters,
-            args.plot_height,
-            args.plot_width,
-            args.plot_dpi
+            cluster_func,
+            min_size=args.min_mcl_size,
+            block_size=args.block_size,
+            threads=args.threads,
         )
+        stage.add(matrix.shape[0], len(clusters))
+
+    with open_output(
+        args.outfile,
+        "w",
+        args.compress,
+        args.compress_threads
+    ) as outfile, STATS.stage("write"):
+        write_clusters(outfile, graph.names, clusters)
+
+    if args.plot is not None:
+        with STATS.stage("plot"):
+            plot_clusters(
+                args.plot,
+                matrix,
+                clusters,
+                args.plot_height,
+                args.plot_width,
+                args.plot_dpi
+            )
 
     return
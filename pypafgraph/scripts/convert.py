@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+
+from pypafgraph.paf import read_paf_batches, DEFAULT_BATCH_SIZE
+from pypafgraph.columnar import PAFInput, write_columnar
+from pypafgraph.stats import STATS
+
+
+def convert_cli(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "inpaf",
+        default=sys.stdin,
+        type=PAFInput(),
+        help="Input paf file, optionally compressed. Use '-' for stdin.",
+    )
+
+    parser.add_argument(
+        "-o", "--outfile",
+        required=True,
+        type=str,
+        help=(
+            "Output columnar paf file path. This must be a regular file, "
+            "which the other subcommands memory map instead of parsing."
+        ),
+    )
+
+    parser.add_argument(
+        "-c", "--chunk-size",
+        default=DEFAULT_BATCH_SIZE,
+        type=int,
+        help=(
+            "The number of records in each chunk. Smaller chunks let "
+            "readers skip more records using the per-chunk min and max "
+            "values, but add overhead."
+        ),
+    )
+
+    parser.add_argument(
+        "--no-tags",
+        dest="tags",
+        default=True,
+        action="store_false",
+        help="Drop the optional tag columns to save space.",
+    )
+    return
+
+
+def convert_main(args: argparse.Namespace):
+    if args.chunk_size < 1:
+        raise ValueError("The chunk size must be at least 1.")
+
+    with STATS.stage("convert") as stage:
+        nrecords = write_columnar(
+            args.outfile,
+            STATS.timed("parse", read_paf_batches(args.inpaf,
+                                                  args.chunk_size)),
+            args.tags,
+        )
+        stage.add(nrecords, nrecords)
+    return
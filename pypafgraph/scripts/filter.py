@@ -3,35 +3,60 @@
 import sys
 import argparse
 
-from intervaltree import Interval, IntervalTree
+from collections import Counter
+from contextlib import ExitStack
 
-from pypafgraph.bed import BED, bed_to_itree
-from pypafgraph.paf import PAF
-from pypafgraph.interval_utils import total_intersection
-from pypafgraph.utils import get_genome_name
+from typing import Any, Dict, List
+from typing import Optional
+from typing import TextIO
+from typing import Tuple
+from typing import Union
+
+import numpy as np
+
+from pypafgraph.bed import BED, RepeatIndex, RepeatsInput
+from pypafgraph.bed import SortedBedRepeats, DEFAULT_WINDOW_SIZE
+from pypafgraph.paf import PAFBatch, NameTable, QueryBlocks
+from pypafgraph.paf import read_paf_batches
+from pypafgraph.paf import ColumnRanges
+from pypafgraph.columnar import ColumnarPAF, PAFInput
+from pypafgraph.files import open_output, is_plain_file
+from pypafgraph.files import add_compression_arguments
+from pypafgraph.parallel import get_context, file_chunks, read_range
+from pypafgraph.parallel import imap_ordered
+from pypafgraph.pipeline import run_pipeline
+from pypafgraph.stats import STATS
 
 
 def filter_cli(parser: argparse.ArgumentParser):
     parser.add_argument(
         "inbed",
         default=sys.stdin,
-        type=argparse.FileType('r'),
-        help="Input bed file. Use '-' for stdin.",
+        type=RepeatsInput(),
+        help=(
+            "Input bed file, optionally compressed, or an index from "
+            "ppg index-repeats. Use '-' for stdin."
+        ),
     )
     parser.add_argument(
         "inpaf",
         default=sys.stdin,
-        type=argparse.FileType('r'),
-        help="Input paf file. Use '-' for stdin.",
+        type=PAFInput(),
+        help=(
+            "Input paf file, optionally compressed or columnar. "
+            "Use '-' for stdin."
+        ),
     )
 
     parser.add_argument(
         "-o", "--outfile",
-        default=sys.stdout,
-        type=argparse.FileType('w'),
+        default="-",
+        type=str,
         help="Output paf file path. Default stdout.",
     )
 
+    add_compression_arguments(parser)
+
     parser.add_argument(
         "-m", "--min-length",
         default=1,
@@ -56,59 +81,354 @@ def filter_cli(parser: argparse.ArgumentParser):
         help="The maximum proportion of bases allowed to be in repeat regions."
     )
 
+    parser.add_argument(
+        "-t", "--threads",
+        default=1,
+        type=int,
+        help=(
+            "The number of processes to filter with. "
+            "The input paf must be a regular file to use more than one."
+        )
+    )
+
+    parser.add_argument(
+        "--sorted",
+        default=False,
+        action="store_true",
+        help=(
+            "The paf is sorted by query and the bed by sequence and start, "
+            "e.g. with sort -k1,1 -k2,2n. The bed is scanned once to find "
+            "where each sequence's repeats are, and repeats are then read "
+            "as they're needed, keeping the most recent --window-size "
+            "intervals. Memory is a file offset per sequence in the bed "
+            "plus the window, rather than every repeat. Targets come in "
+            "any order, so this isn't a single pass merge of the two "
+            "files. The bed must be an uncompressed regular file, and "
+            "filtering uses a single process."
+        )
+    )
+
+    parser.add_argument(
+        "--window-size",
+        default=DEFAULT_WINDOW_SIZE,
+        type=int,
+        help=(
+            "With --sorted, the number of merged repeat intervals to keep "
+            "in memory for reuse."
+        )
+    )
+
     return
 
 
-def filter_by_interval(
-    itree: IntervalTree,
-    interval: Interval,
+def filter_by_repeats(
+    index: RepeatIndex,
+    rows: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
     min_length: int,
     prop_coverage: float
-) -> bool:
-    """ """
+) -> np.ndarray:
+    """ Find the alignment intervals that are mostly repeats.
 
-    if itree is None and interval.length() >= min_length:
-        return False
+    rows are the RepeatIndex rows of each interval's sequence, or -1 for
+    sequences without repeats. An interval is removed if fewer than
+    min_length of its bases are outside repeats, or if at least
+    prop_coverage of it is covered by repeats.
 
-    len_intersect = total_intersection(itree, interval)
+    Returns True for the intervals that should be removed.
+    """
 
-    if interval.length() <= 0:
-        prop_intersect = 0
-    else:
-        prop_intersect = len_intersect / interval.length()
+    lengths = ends - starts
+    len_intersect = index.covered(rows, starts, ends)
+
+    prop_intersect = np.zeros(len(lengths), dtype=np.float64)
+    np.divide(len_intersect, lengths, out=prop_intersect, where=lengths > 0)
 
-    lt_min_length = (interval.length() - len_intersect) < min_length
+    lt_min_length = (lengths - len_intersect) < min_length
     gt_max_cov = prop_intersect >= prop_coverage
-    return lt_min_length or gt_max_cov
+
+    # Sequences without any repeats are only filtered by length.
+    return np.where(
+        rows >= 0,
+        lt_min_length | gt_max_cov,
+        lengths < min_length
+    )
+
+
+def filter_batch(
+    batch: PAFBatch,
+    index: Union[RepeatIndex, SortedBedRepeats],
+    min_length: int,
+    prop_coverage: float,
+    sep: Optional[str] = None,
+    counts: Optional[Counter] = None,
+) -> np.ndarray:
+    """ Find the records in a batch that pass all of the filters.
+
+    If counts is given, the number of records failing each filter is added
+    to it. A record can fail more than one.
+    """
+
+    nrecords = len(batch)
+    passes = {"min_length": batch.alilen >= min_length}
+
+    # Work out the per-sequence values once for each distinct sequence.
+    ids, inverse = np.unique(
+        np.concatenate([batch.query, batch.target]),
+        return_inverse=True
+    )
+    seqids = [batch.names[i] for i in ids.tolist()]
+
+    if sep is not None:
+        genomes = batch.names.genome_ids(sep)
+        passes["same_genome"] = genomes[batch.query] != genomes[batch.target]
+
+    rows = index.lookup(seqids)[inverse]
+
+    qstarts, qends = batch.query_intervals()
+    passes["query_repeats"] = ~filter_by_repeats(
+        index, rows[:nrecords], qstarts, qends, min_length, prop_coverage
+    )
+
+    tstarts, tends = batch.target_intervals()
+    passes["target_repeats"] = ~filter_by_repeats(
+        index, rows[nrecords:], tstarts, tends, min_length, prop_coverage
+    )
+
+    keep = np.ones(nrecords, dtype=bool)
+    for name, mask in passes.items():
+        keep &= mask
+        if counts is not None:
+            counts[f"filter.rejected_{name}"] += int(nrecords - mask.sum())
+    return keep
+
+
+def min_length_range(min_length: int) -> ColumnRanges:
+    """ Records with shorter alignments are always filtered, so columnar
+    chunks without any longer alignments can be skipped.
+    """
+    return {"alilen": (min_length, None)}
+
+
+def count_skipped(paf: ColumnarPAF, chunks: List[int]):
+    """ Record how many records are in columnar chunks that are skipped
+    without being read.
+    """
+
+    nread = sum(paf.chunks[i]["nrecords"] for i in chunks)
+    STATS.count("filter.skipped_records", paf.nrecords - nread)
+    return
+
+
+# Shared with the worker processes by filter_init.
+_WORKER_STATE: Dict[str, Any] = dict()
+
+
+def filter_init(
+    paf: Union[str, ColumnarPAF],
+    index: RepeatIndex,
+    min_length: int,
+    prop_coverage: float,
+    sep: Optional[str],
+):
+    # Reusing a NameTable between chunks means that each sequence's genome
+    # is only found once per worker.
+    _WORKER_STATE.update(
+        paf=paf,
+        names=NameTable(),
+        index=index,
+        min_length=min_length,
+        prop_coverage=prop_coverage,
+        sep=sep,
+    )
+    return
+
+
+def filter_chunk(
+    task: Union[int, Tuple[int, int]],
+) -> Tuple[str, int, int, Counter]:
+    """ Filter the records in a chunk of a columnar paf, or a byte range of
+    a text paf.
+
+    Returns the passing records, the number of input and output records,
+    and the number failing each filter.
+    """
+
+    state = _WORKER_STATE
+    if isinstance(state["paf"], ColumnarPAF):
+        batch = state["paf"].batch(task)
+    else:
+        chunk = read_range(state["paf"], *task)
+        if len(chunk) == 0:
+            return "", 0, 0, Counter()
+
+        batch = PAFBatch.from_bytes(chunk, state["names"])
+
+    counts: Counter = Counter()
+    keep = filter_batch(
+        batch,
+        state["index"],
+        state["min_length"],
+        state["prop_coverage"],
+        state["sep"],
+        counts,
+    )
+    return batch.text(keep), len(batch), int(keep.sum()), counts
+
+
+def filter_parallel(
+    args: argparse.Namespace,
+    index: RepeatIndex,
+    outfile: TextIO,
+):
+    """ Filter byte ranges or columnar chunks of the input in worker
+    processes.
+
+    The index is handed to the workers as they start, which with fork is
+    shared copy-on-write rather than copied. Chunks are written in input
+    order.
+    """
+
+    if isinstance(args.inpaf, ColumnarPAF):
+        paf = args.inpaf
+        chunks = paf.chunk_ids(min_length_range(args.min_length))
+        count_skipped(paf, chunks)
+    else:
+        paf = args.inpaf.name
+        chunks = file_chunks(paf)
+
+    context = get_context()
+    initargs = (
+        paf,
+        index,
+        args.min_length,
+        args.prop_overlap,
+        args.sep,
+    )
+
+    # The workers' time is only counted once the pool has finished.
+    with STATS.stage("filter") as stage:
+        with context.Pool(args.threads, filter_init, initargs) as pool:
+            results = imap_ordered(pool, filter_chunk, chunks,
+                                   2 * args.threads)
+            for text, nin, nout, counts in results:
+                outfile.write(text)
+                stage.add(nin, nout)
+                STATS.update(counts)
+    return
+
+
+def load_repeats(
+    args: argparse.Namespace,
+) -> Union[RepeatIndex, SortedBedRepeats]:
+    """ Load the repeats, or with --sorted, get ready to read them as
+    they're needed.
+    """
+
+    if isinstance(args.inbed, RepeatIndex):
+        # Saved indices are memory mapped, so are already cheap to use.
+        return args.inbed
+
+    if not args.sorted:
+        return RepeatIndex.from_beds(BED.from_file(args.inbed))
+
+    if not is_plain_file(args.inbed):
+        raise ValueError(
+            "With --sorted, the bed must be an uncompressed regular file, "
+            "or an index from ppg index-repeats."
+        )
+
+    args.inbed.close()
+    return SortedBedRepeats(args.inbed.name, args.window_size)
+
+
+def filter_serial(
+    args: argparse.Namespace,
+    index: Union[RepeatIndex, SortedBedRepeats],
+    outfile: TextIO,
+):
+    """ Filter the input a batch at a time in this process.
+
+    With --sorted, this also checks that the paf is sorted by query.
+    """
+
+    blocks = QueryBlocks() if args.sorted else None
+
+    ranges = min_length_range(args.min_length)
+    if isinstance(args.inpaf, ColumnarPAF):
+        count_skipped(args.inpaf, args.inpaf.chunk_ids(ranges))
+
+    def compute(batch: PAFBatch) -> Tuple[str, int]:
+        if blocks is not None:
+            blocks.update(batch.query, len(batch.names))
+
+        with STATS.stage("filter") as stage:
+            keep = filter_batch(
+                batch,
+                index,
+                args.min_length,
+                args.prop_overlap,
+                args.sep,
+                STATS.counters,
+            )
+            nkept = int(keep.sum())
+            stage.add(len(batch), nkept)
+            return batch.text(keep), nkept
+
+    def write(result: Tuple[str, int]):
+        text, nkept = result
+        with STATS.stage("write") as stage:
+            outfile.write(text)
+            stage.add(nkept, nkept)
+        return
+
+    # Parsing the next batches and writing the previous ones happen in
+    # threads while this one filters.
+    batches = read_paf_batches(args.inpaf, ranges=ranges)
+    run_pipeline(STATS.timed("parse", batches), compute, write)
+    return
 
 
 def filter_main(args: argparse.Namespace):
 
-    bed = BED.from_file(args.inbed)
-    bed_tree = bed_to_itree(bed)
+    with ExitStack() as stack:
+        with STATS.stage("index") as stage:
+            index = load_repeats(args)
+            stage.add(len(index))
 
-    paf = PAF.from_file(args.inpaf)
-    for p in paf:
-        if args.sep is not None:
-            qgenome = get_genome_name(p.query, args.sep)
-            tgenome = get_genome_name(p.target, args.sep)
+        if isinstance(index, SortedBedRepeats):
+            stack.enter_context(index)
 
-            if qgenome == tgenome:
-                continue
+        outfile = stack.enter_context(open_output(
+            args.outfile,
+            "w",
+            args.compress,
+            args.compress_threads
+        ))
 
-        if p.alilen < args.min_length:
-            continue
+        if args.sorted:
+            if args.threads > 1:
+                print(
+                    "With --sorted, the paf will be filtered in a single "
+                    "process.",
+                    file=sys.stderr
+                )
 
-        query, qinterval = p.query_as_interval()
-        if filter_by_interval(bed_tree.get(query, None), qinterval,
-                              args.min_length, args.prop_overlap):
-            continue
+            filter_serial(args, index, outfile)
+            return
 
-        target, tinterval = p.target_as_interval()
-        if filter_by_interval(bed_tree.get(target, None), tinterval,
-                              args.min_length, args.prop_overlap):
-            continue
+        columnar = isinstance(args.inpaf, ColumnarPAF)
+        if args.threads > 1 and (columnar or is_plain_file(args.inpaf)):
+            filter_parallel(args, index, outfile)
+            return
+        elif args.threads > 1:
+            print(
+                "The input paf isn't an uncompressed regular file, "
+                "so it will be filtered in a single process.",
+                file=sys.stderr
+            )
 
-        print(p, file=args.outfile)
+        filter_serial(args, index, outfile)
 
     return
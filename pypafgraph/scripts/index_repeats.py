@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+
+from pypafgraph.bed import BED, RepeatIndex
+from pypafgraph.files import InputFile
+from pypafgraph.stats import STATS
+
+
+def index_repeats_cli(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "inbed",
+        default=sys.stdin,
+        type=InputFile('r'),
+        help="Input bed file, optionally compressed. Use '-' for stdin.",
+    )
+
+    parser.add_argument(
+        "-o", "--outfile",
+        required=True,
+        type=str,
+        help=(
+            "Output index file path. It can be given to ppg filter in "
+            "place of the bed file."
+        ),
+    )
+    return
+
+
+def index_repeats_main(args: argparse.Namespace):
+    with STATS.stage("index") as stage:
+        index = RepeatIndex.from_beds(BED.from_file(args.inbed))
+        stage.add(len(index.intervals), len(index.intervals))
+
+    with STATS.stage("write"):
+        index.save(args.outfile)
+    return
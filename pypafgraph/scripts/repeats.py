@@ -2,34 +2,38 @@
 
 import sys
 import argparse
-from collections import defaultdict
 
-from typing import Dict
-from typing import List
+from typing import TextIO
 
-from intervaltree import Interval, IntervalTree
-
-from pypafgraph.bed import BED
-from pypafgraph.paf import PAF
-from pypafgraph.interval_utils import sym_diff
-from pypafgraph.utils import get_genome_name
+from pypafgraph.paf import read_paf_batches
+from pypafgraph.repeats import RepeatAccumulator, RepeatIntervals
+from pypafgraph.utils import parse_size
+from pypafgraph.columnar import PAFInput
+from pypafgraph.files import open_output
+from pypafgraph.files import add_compression_arguments
+from pypafgraph.stats import STATS
 
 
 def repeats_cli(parser: argparse.ArgumentParser):
     parser.add_argument(
         "inpaf",
         default=sys.stdin,
-        type=argparse.FileType('r'),
-        help="Input paf file. Use '-' for stdin.",
+        type=PAFInput(),
+        help=(
+            "Input paf file, optionally compressed or columnar. "
+            "Use '-' for stdin."
+        ),
     )
 
     parser.add_argument(
         "-o", "--outfile",
-        default=sys.stdout,
-        type=argparse.FileType('w'),
+        default="-",
+        type=str,
         help="Output bed file path. Default stdout.",
     )
 
+    add_compression_arguments(parser)
+
     parser.add_argument(
         "-s", "--sep",
         default=".",
@@ -39,35 +43,76 @@ def repeats_cli(parser: argparse.ArgumentParser):
             "both members have the same prefix."
         )
     )
-    return
 
+    parser.add_argument(
+        "--sorted",
+        default=False,
+        action="store_true",
+        help=(
+            "Indicate that the input paf is sorted by query, and that every "
+            "alignment where a sequence is the target comes before its own "
+            "block of queries (e.g. each pair is only reported once). "
+            "Sequences are written as soon as their block ends, so memory "
+            "is bounded by the largest block."
+        )
+    )
 
-def repeats_main(args: argparse.Namespace):
-    paf = PAF.from_file(args.inpaf)
+    parser.add_argument(
+        "--max-memory",
+        default=None,
+        type=parse_size,
+        help=(
+            "Spill merged repeat intervals to temporary files when they use "
+            "more than this much memory, e.g. 8G."
+        )
+    )
 
-    repeats: Dict[str, List[Interval]] = defaultdict(list)
+    parser.add_argument(
+        "--tmpdir",
+        default=None,
+        type=str,
+        help="Where to write temporary files. Default the system default."
+    )
+    return
 
-    for p in paf:
-        qgenome = get_genome_name(p.query, args.sep)
-        tgenome = get_genome_name(p.target, args.sep)
 
-        if qgenome != tgenome:
-            continue
+def write_repeats(handle: TextIO, repeats: RepeatIntervals):
+    names, keys, starts, ends = repeats
+    seqids = [names[k] for k in keys.tolist()]
+    lines = zip(seqids, starts.tolist(), ends.tolist())
+    handle.write("".join(f"{s}\t{b}\t{e}\n" for s, b, e in lines))
+    return
 
-        query, qinterval = p.query_as_interval()
-        target, tinterval = p.target_as_interval()
 
-        if (query == target) and qinterval.overlaps(tinterval):
-            filtered = sym_diff(qinterval, tinterval)
-            repeats[query].extend(filtered)
-        else:
-            repeats[query].append(qinterval)
-            repeats[target].append(tinterval)
+def repeats_main(args: argparse.Namespace):
+    accumulator = RepeatAccumulator(
+        args.sep,
+        sorted_by_query=args.sorted,
+        max_memory=args.max_memory,
+        tmpdir=args.tmpdir,
+    )
+
+    outfile = open_output(
+        args.outfile,
+        "w",
+        args.compress,
+        args.compress_threads
+    )
 
-    for seqid, intervals in repeats.items():
-        itree = IntervalTree(intervals)
-        itree.merge_overlaps()
-        for interval in itree:
-            bed = BED(seqid, interval.begin, interval.end)
-            print(bed, file=args.outfile)
+    with outfile:
+        for batch in STATS.timed("parse", read_paf_batches(args.inpaf)):
+            with STATS.stage("merge") as stage:
+                finished = accumulator.add(batch)
+                stage.add(len(batch))
+
+            if finished is not None:
+                with STATS.stage("write") as stage:
+                    write_repeats(outfile, finished)
+                    stage.add(len(finished[1]), len(finished[1]))
+
+        for repeats in STATS.timed("finish", accumulator.finish(),
+                                   lambda r: len(r[1])):
+            with STATS.stage("write") as stage:
+                write_repeats(outfile, repeats)
+                stage.add(len(repeats[1]), len(repeats[1]))
     return
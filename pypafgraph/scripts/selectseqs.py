@@ -1,24 +1,43 @@
 #!/usr/bin/env python3
 
+import os
+import sys
 import argparse
+import tempfile
 
 from os import mkdir
 from os.path import join as pjoin
 from collections import defaultdict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from Bio import SeqIO
+from typing import Any, BinaryIO
+from typing import Dict, List, Tuple
+from typing import Optional
+
+from pypafgraph.fasta import Fasta, format_fasta, DEFAULT_LINE_WIDTH
+from pypafgraph.fasta import FaiRecord, IndexedFasta, load_fai
+from pypafgraph.files import InputFile, open_output, is_plain_file
+from pypafgraph.files import compressed_name, add_compression_arguments
+from pypafgraph.files import DEFAULT_THREADS
+from pypafgraph.parallel import get_context
+from pypafgraph.stats import STATS
+
+DEFAULT_MAX_OPEN = 256
+DEFAULT_BUFFER_SIZE = 2 ** 16
+DEFAULT_MAX_BUFFERED = 2 ** 27
 
 
 def selectseqs_cli(parser: argparse.ArgumentParser):
     parser.add_argument(
         "table",
-        type=argparse.FileType('r'),
+        type=InputFile('r'),
         help="Input clusters tsv file. Use '-' for stdin.",
     )
     parser.add_argument(
         "infile",
-        type=argparse.FileType('r'),
-        help="Input fasta file. Use '-' for stdin.",
+        type=InputFile('rb'),
+        help="Input fasta file, optionally compressed. Use '-' for stdin.",
     )
 
     parser.add_argument(
@@ -52,6 +71,71 @@ def selectseqs_cli(parser: argparse.ArgumentParser):
         )
     )
 
+    parser.add_argument(
+        "-w", "--line-width",
+        default=DEFAULT_LINE_WIDTH,
+        type=int,
+        help=(
+            "The line width of the output fasta files. "
+            "Use 0 to write each sequence on one line."
+        ),
+    )
+
+    parser.add_argument(
+        "--no-unplaced",
+        default=False,
+        action="store_true",
+        help="Don't write the sequences that aren't assigned a cluster.",
+    )
+
+    parser.add_argument(
+        "--index",
+        default=False,
+        action="store_true",
+        help=(
+            "Extract sequences using a samtools style .fai index of the "
+            "input fasta, which is built if it doesn't exist. Sequences "
+            "that are already wrapped to --line-width are copied without "
+            "being parsed."
+        ),
+    )
+
+    parser.add_argument(
+        "-t", "--threads",
+        default=1,
+        type=int,
+        help=(
+            "The number of worker processes used to write component files "
+            "with --index."
+        ),
+    )
+
+    parser.add_argument(
+        "--max-open-files",
+        default=DEFAULT_MAX_OPEN,
+        type=int,
+        help="The maximum number of output files to keep open at once.",
+    )
+
+    parser.add_argument(
+        "--spool",
+        default=False,
+        action="store_true",
+        help=(
+            "Write the records to a temporary spool file, and copy them into "
+            "the output files at the end. Each output file is then opened "
+            "only once, which helps with very many clusters."
+        ),
+    )
+
+    parser.add_argument(
+        "--tmpdir",
+        default=None,
+        type=str,
+        help="Where to write the spool file. Default the system default."
+    )
+
+    add_compression_arguments(parser)
     return
 
 
@@ -81,21 +165,353 @@ def filter_clusters(clusters, counts, min_size=1):
     return out
 
 
-def write_components(components, touched, outdir):
-    for component in components:
-        if touched[component]:
-            mode = "a"
+def component_filename(
+    outdir: str,
+    component: str,
+    compression: Optional[str] = None
+) -> str:
+    """ The fasta file that a component is written to.
+
+    Example:
+    >>> component_filename("out", "component1", "gzip")
+    'out/component1.fasta.gz'
+    """
+
+    return pjoin(outdir, compressed_name(f"{component}.fasta", compression))
+
+
+class ComponentWriter(object):
+
+    """ Write records to many component files through buffers.
+
+    Each component's records are buffered until it has buffer_size bytes,
+    or all components together have max_buffered bytes. At most max_open
+    files are kept open, closing the least recently used one first.
+    A file is truncated the first time it is written to and appended to
+    afterwards, and files are only created for components with records.
+    Compressed files share one pool of compression threads.
+    """
+
+    def __init__(
+        self,
+        outdir: str,
+        max_open: int = DEFAULT_MAX_OPEN,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        max_buffered: int = DEFAULT_MAX_BUFFERED,
+        compression: Optional[str] = None,
+        threads: int = DEFAULT_THREADS,
+    ):
+        self.outdir = outdir
+        self.compression = compression
+        self.threads = threads
+        self.executor: Optional[ThreadPoolExecutor] = None
+        if compression in ("gzip", "bgzf"):
+            self.executor = ThreadPoolExecutor(threads)
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.max_buffered = max_buffered
+
+        self.buffers: Dict[str, List[bytes]] = defaultdict(list)
+        self.sizes: Dict[str, int] = defaultdict(int)
+        self.buffered = 0
+
+        self.handles: 'OrderedDict[str, BinaryIO]' = OrderedDict()
+        self.touched: Dict[str, bool] = dict()
+        return
+
+    def __enter__(self) -> 'ComponentWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def filename(self, component: str) -> str:
+        return component_filename(self.outdir, component, self.compression)
+
+    def _handle(self, component: str) -> BinaryIO:
+        handle = self.handles.get(component, None)
+        if handle is not None:
+            self.handles.move_to_end(component)
+            return handle
+
+        if len(self.handles) >= self.max_open:
+            _, oldest = self.handles.popitem(last=False)
+            oldest.close()
+
+        mode = "ab" if self.touched.get(component, False) else "wb"
+        self.touched[component] = True
+
+        # zstd starts its own threads, so don't give each file a pool.
+        handle = open_output(
+            self.filename(component),
+            mode,
+            self.compression,
+            self.threads if self.compression != "zstd" else 0,
+            self.executor,
+        )
+        self.handles[component] = handle
+        return handle
+
+    def write(self, component: str, data: bytes):
+        self.buffers[component].append(data)
+        self.sizes[component] += len(data)
+        self.buffered += len(data)
+
+        if self.sizes[component] >= self.buffer_size:
+            self.flush(component)
+        elif self.buffered >= self.max_buffered:
+            self.flush_all()
+        return
+
+    def flush(self, component: str):
+        buffer = self.buffers.pop(component, None)
+        if buffer is None:
+            return
+
+        self._handle(component).write(b"".join(buffer))
+        self.buffered -= self.sizes.pop(component)
+        return
+
+    def flush_all(self):
+        for component in list(self.buffers.keys()):
+            self.flush(component)
+        return
+
+    def close(self):
+        self.flush_all()
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+        if self.executor is not None:
+            self.executor.shutdown()
+        return
+
+
+def copy_range(source: int, dest: int, offset: int, length: int):
+    """ Copy a byte range between file descriptors, in the kernel if we can.
+    """
+
+    if hasattr(os, "sendfile"):
+        while length > 0:
+            sent = os.sendfile(dest, source, offset, length)
+            if sent == 0:
+                raise EOFError("The spool file ended unexpectedly.")
+            offset += sent
+            length -= sent
+        return
+
+    while length > 0:
+        chunk = os.pread(source, min(length, DEFAULT_BUFFER_SIZE), offset)
+        if len(chunk) == 0:
+            raise EOFError("The spool file ended unexpectedly.")
+        os.write(dest, chunk)
+        offset += len(chunk)
+        length -= len(chunk)
+    return
+
+
+class SpoolWriter(object):
+
+    """ Write records to one spool file, and assemble the component files
+    from it at the end.
+
+    The byte range of each record is indexed by component, so each output
+    file is opened once and filled by copying its ranges, with adjacent
+    ranges copied together.
+    """
+
+    def __init__(
+        self,
+        outdir: str,
+        tmpdir: Optional[str] = None,
+        compression: Optional[str] = None,
+        threads: int = DEFAULT_THREADS,
+    ):
+        self.outdir = outdir
+        self.compression = compression
+        self.threads = threads
+        self.spool = tempfile.TemporaryFile(prefix="pypafgraph_", dir=tmpdir)
+        self.offset = 0
+        self.ranges: Dict[str, List[List[int]]] = defaultdict(list)
+        return
+
+    def __enter__(self) -> 'SpoolWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def filename(self, component: str) -> str:
+        return component_filename(self.outdir, component, self.compression)
+
+    def write(self, component: str, data: bytes):
+        ranges = self.ranges[component]
+
+        # Extend the previous range if this record directly follows it.
+        if len(ranges) > 0 and sum(ranges[-1]) == self.offset:
+            ranges[-1][1] += len(data)
         else:
-            mode = "w"
+            ranges.append([self.offset, len(data)])
+
+        self.spool.write(data)
+        self.offset += len(data)
+        return
+
+    def close(self):
+        if self.spool.closed:
+            return
+
+        self.spool.flush()
+        source = self.spool.fileno()
+
+        for component, ranges in self.ranges.items():
+            filename = self.filename(component)
+
+            if self.compression is None:
+                with open(filename, "wb") as handle:
+                    dest = handle.fileno()
+                    for offset, length in ranges:
+                        copy_range(source, dest, offset, length)
+                continue
+
+            # Compressed output has to go through the compressor.
+            with open_output(
+                filename,
+                "wb",
+                self.compression,
+                self.threads
+            ) as handle:
+                for offset, length in ranges:
+                    handle.write(os.pread(source, length, offset))
+
+        self.spool.close()
+        self.ranges.clear()
+        return
+
+
+def get_component(
+    seqid_to_component: Dict[str, str],
+    seqid: str,
+    prefix: str,
+    unplaced: Optional[str],
+) -> Optional[str]:
+    component = seqid_to_component.get(seqid, None)
+    if component is None:
+        return unplaced
+    return f"{prefix}{component}"
+
+
+# Shared with the worker processes by selectseqs_init.
+_WORKER_STATE: Dict[str, Any] = dict()
+
+
+def selectseqs_init(
+    path: str,
+    records: List[FaiRecord],
+    outdir: str,
+    width: int,
+    compression: Optional[str],
+):
+    _WORKER_STATE.update(
+        fasta=IndexedFasta(path, records),
+        outdir=outdir,
+        width=width,
+        compression=compression,
+    )
+    return
+
+
+def write_component(task: Tuple[str, List[int]]) -> str:
+    """ Write the records of a component from the indexed fasta. """
+
+    state = _WORKER_STATE
+    component, indices = task
 
-        touched[component] = True
+    fasta = state["fasta"]
+    filename = component_filename(
+        state["outdir"],
+        component,
+        state["compression"]
+    )
+
+    # Each worker process compresses its own files.
+    with open_output(filename, "wb", state["compression"], 1) as handle:
+        for i in indices:
+            handle.write(fasta.format(i, state["width"]))
+    return component
+
+
+def selectseqs_indexed(
+    args: argparse.Namespace,
+    records: List[FaiRecord],
+    seqid_to_component: Dict[str, str],
+    unplaced: Optional[str],
+):
+    """ Write each component's records straight from the indexed fasta.
+
+    Components are written by worker processes, each of which memory maps
+    the fasta.
+    """
+
+    components: Dict[str, List[int]] = defaultdict(list)
+    for i, record in enumerate(records):
+        component = get_component(
+            seqid_to_component,
+            record.name,
+            args.prefix,
+            unplaced
+        )
+
+        if component is not None:
+            components[component].append(i)
 
-        filename = pjoin(outdir, f"{component}.fasta")
-        with open(filename, mode) as handle:
-            SeqIO.write(components[component], handle, format="fasta")
+    tasks = list(components.items())
+    initargs = (
+        args.infile.name,
+        records,
+        args.outdir,
+        args.line_width,
+        args.compress,
+    )
+
+    if args.threads > 1 and len(tasks) > 1:
+        context = get_context()
+        chunksize = max(1, len(tasks) // (args.threads * 16))
+        with context.Pool(args.threads, selectseqs_init, initargs) as pool:
+            for _ in pool.imap_unordered(write_component, tasks, chunksize):
+                pass
+    else:
+        selectseqs_init(*initargs)
+        try:
+            for task in tasks:
+                write_component(task)
+        finally:
+            _WORKER_STATE.pop("fasta").close()
     return
 
 
+def load_index(args: argparse.Namespace) -> Optional[List[FaiRecord]]:
+    """ Find the index of the input fasta, or None if it can't be indexed.
+    """
+
+    if not is_plain_file(args.infile):
+        print(
+            "The input fasta isn't an uncompressed regular file, "
+            "so it can't be indexed.",
+            file=sys.stderr
+        )
+        return None
+
+    try:
+        return load_fai(args.infile.name)
+    except ValueError as e:
+        print(f"{e} Reading the fasta without an index.", file=sys.stderr)
+        return None
+
+
 def selectseqs_main(args: argparse.Namespace):
 
     seqid_to_component = parse_tsv(args.table)
@@ -105,31 +521,54 @@ def selectseqs_main(args: argparse.Namespace):
         cluster_counts,
         min_size=args.min_size
     )
-    touched_components = {
-        f"{args.prefix}{c}": False
-        for c in seqid_to_component.values()
-    }
-    touched_components[args.unplaced] = False
 
-    chunk_size = 10000
-    components = defaultdict(list)
-    seqs = SeqIO.parse(args.infile, format="fasta")
+    unplaced = None if args.no_unplaced else args.unplaced
 
     if args.outdir != ".":
         mkdir(args.outdir)
 
-    for i, seq in enumerate(seqs, 1):
-        component = seqid_to_component.get(seq.id, None)
-        if component is None:
-            component = args.unplaced
-        else:
-            component = f"{args.prefix}{component}"
-
-        components[component].append(seq)
-
-        if i % chunk_size == 0:
-            write_components(components, touched_components, args.outdir)
-            components = defaultdict(list)
+    if args.index:
+        records = load_index(args)
+        if records is not None:
+            with STATS.stage("write_indexed"):
+                selectseqs_indexed(args, records, seqid_to_component,
+                                   unplaced)
+            return
+
+    if args.spool:
+        writer = SpoolWriter(
+            args.outdir,
+            args.tmpdir,
+            args.compress,
+            args.compress_threads
+        )
+    else:
+        writer = ComponentWriter(
+            args.outdir,
+            args.max_open_files,
+            compression=args.compress,
+            threads=args.compress_threads,
+        )
 
-    write_components(components, touched_components, args.outdir)
+    with writer:
+        sequences = STATS.timed("parse", Fasta.from_file(args.infile),
+                                lambda s: 1)
+        for seq in sequences:
+            component = get_component(
+                seqid_to_component,
+                seq.id,
+                args.prefix,
+                unplaced
+            )
+
+            if component is None:
+                STATS.count("selectseqs.skipped")
+                continue
+
+            with STATS.stage("write") as stage:
+                writer.write(
+                    component,
+                    format_fasta(seq.description, seq.seq, args.line_width)
+                )
+                stage.add(1, 1)
     return
@@ -1,70 +1,145 @@
 #!/usr/bin/env python3
 
+import re
 import sys
 import argparse
 
-from typing import Iterator
+from contextlib import ExitStack
 
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
 
 from pypafgraph.bed import BED
+from pypafgraph.fasta import Fasta, format_fasta, DEFAULT_LINE_WIDTH
+from pypafgraph.files import InputFile, open_output
+from pypafgraph.files import add_compression_arguments
+from pypafgraph.pipeline import run_pipeline, JoinedWriter
+from pypafgraph.stats import STATS
 
 
 def unsoftmask_cli(parser: argparse.ArgumentParser):
     parser.add_argument(
         "infile",
-        default=sys.stdin,
-        type=argparse.FileType('r'),
-        help="Input fasta file. Use '-' for stdin.",
+        default=sys.stdin.buffer,
+        type=InputFile('rb'),
+        help="Input fasta file, optionally compressed. Use '-' for stdin.",
     )
 
     parser.add_argument(
         "-o", "--outbed",
-        default=sys.stdout,
-        type=argparse.FileType('w'),
+        default="-",
+        type=str,
         help="Output bed file path. Default stdout.",
     )
 
     parser.add_argument(
         "-f", "--outfasta",
         default=None,
-        type=argparse.FileType('w'),
+        type=str,
         help="Output fasta file path. Default not written.",
     )
 
+    parser.add_argument(
+        "-w", "--line-width",
+        default=DEFAULT_LINE_WIDTH,
+        type=int,
+        help=(
+            "The line width of the output fasta. "
+            "Use 0 to write each sequence on one line."
+        ),
+    )
+
+    add_compression_arguments(parser)
+
     return
 
 
-def find_lowercase_stretches(sr: SeqRecord) -> Iterator[BED]:
+# A stretch starts at a lowercase letter and runs until the next uppercase
+# letter. Other characters like N's or gaps don't start or end a stretch.
+LOWERCASE_STRETCH = re.compile(rb"[a-z][^A-Z]*")
+
 
-    start = None
-    pos = 0
+def find_lowercase_runs(seq: bytes) -> Iterator[Tuple[int, int]]:
+    """ Find the start and end of lowercase stretches in a sequence.
 
-    for base in sr.seq:
-        if base.islower() and start is None:
-            start = pos
-        elif base.isupper() and start is not None:
-            yield BED(sr.id, start, pos)
-            start = None
+    Example:
+    >>> list(find_lowercase_runs(b"--acGT-tt.AcNnc"))
+    [(2, 4), (7, 10), (11, 12), (13, 15)]
+    """
 
-        pos += 1
+    for match in LOWERCASE_STRETCH.finditer(seq):
+        yield match.span()
+    return
 
-    if start is not None:
-        yield BED(sr.id, start, pos)
 
+def find_lowercase_stretches(record: Fasta) -> Iterator[BED]:
+    for start, end in find_lowercase_runs(record.seq):
+        yield BED(record.id, start, end)
     return
 
 
 def unsoftmask_main(args: argparse.Namespace):
 
-    seqs = SeqIO.parse(args.infile, format="fasta")
-    for seq in seqs:
-        for bed_row in find_lowercase_stretches(seq):
-            print(bed_row, file=args.outbed)
-
-        if args.outfasta is not None:
-            seq.seq = seq.seq.upper()
-            SeqIO.write(seq, args.outfasta, format="fasta")
+    with ExitStack() as stack:
+        outbed = stack.enter_context(open_output(
+            args.outbed,
+            "w",
+            args.compress,
+            args.compress_threads
+        ))
+
+        if args.outfasta is None:
+            outfasta = None
+        else:
+            outfasta = stack.enter_context(open_output(
+                args.outfasta,
+                "wb",
+                args.compress,
+                args.compress_threads
+            ))
+
+        bed_writer = JoinedWriter(outbed)
+        if outfasta is None:
+            fasta_writer = None
+        else:
+            fasta_writer = JoinedWriter(outfasta)
+
+        def compute(record: Fasta) -> Tuple[str, int, Optional[bytes]]:
+            with STATS.stage("unsoftmask") as stage:
+                stretches = find_lowercase_stretches(record)
+                bed_rows = [f"{bed_row}\n" for bed_row in stretches]
+
+                if outfasta is None:
+                    fasta = None
+                else:
+                    fasta = format_fasta(
+                        record.description,
+                        record.seq.upper(),
+                        args.line_width
+                    )
+
+                stage.add(1, len(bed_rows))
+                STATS.count("unsoftmask.bases", len(record.seq))
+            return "".join(bed_rows), len(bed_rows), fasta
+
+        def write(result: Tuple[str, int, Optional[bytes]]):
+            bed, nstretches, fasta = result
+            with STATS.stage("write") as stage:
+                bed_writer.write(bed)
+                if fasta_writer is not None and fasta is not None:
+                    fasta_writer.write(fasta)
+                stage.add(nstretches, nstretches)
+            return
+
+        # Records are parsed and written in threads while this one looks
+        # for lowercase stretches.
+        records = STATS.timed("parse", Fasta.from_file(args.infile),
+                              lambda r: 1)
+        run_pipeline(records, compute, write)
+
+        bed_writer.flush()
+        if fasta_writer is not None:
+            fasta_writer.flush()
 
     return
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import shutil
+import tempfile
+
+from os.path import join as pjoin
+
+from typing import Dict, List
+from typing import Iterator
+from typing import Optional
+
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 2 ** 20
+
+
+class SpillRuns(object):
+
+    """ Runs of keyed rows spilled to temporary files.
+
+    Each run is a set of equal length column arrays that is sorted by the
+    "key" column. The runs are read back with windows, which merge the runs
+    by key so that every row with a given key is in the same window.
+
+    Example:
+    >>> with SpillRuns() as runs:
+    ...     runs.write({"key": np.array([0, 2, 4]), "v": np.array([1, 2, 3])})
+    ...     runs.write({"key": np.array([1, 2]), "v": np.array([4, 5])})
+    ...     windows = list(runs.windows(block_size=1))
+    >>> [w["key"].tolist() for w in windows]
+    [[0, 1, 2, 2], [4]]
+    >>> [w["v"].tolist() for w in windows]
+    [[1, 4, 2, 5], [3]]
+    """
+
+    def __init__(self, tmpdir: Optional[str] = None):
+        self.tmpdir = tmpdir
+        self.directory: Optional[str] = None
+        self.runs: List[Dict[str, str]] = []
+        return
+
+    def __len__(self) -> int:
+        return len(self.runs)
+
+    def __enter__(self) -> 'SpillRuns':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def close(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+        self.runs = []
+        return
+
+    def write(self, columns: Dict[str, np.ndarray]):
+        """ Write a run, which must already be sorted by key. """
+
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(
+                prefix="pypafgraph_",
+                dir=self.tmpdir
+            )
+
+        run = dict()
+        for name, column in columns.items():
+            path = pjoin(self.directory, f"run{len(self.runs)}_{name}.npy")
+            np.save(path, column)
+            run[name] = path
+
+        self.runs.append(run)
+        return
+
+    def windows(
+        self,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """ Merge the runs by key, a window of keys at a time.
+
+        Each window takes roughly block_size rows from each run, so memory
+        use is bounded by the number of runs rather than their size.
+        """
+
+        runs = [
+            {k: np.load(v, mmap_mode="r") for k, v in run.items()}
+            for run in self.runs
+        ]
+        positions = [0 for _ in runs]
+
+        while True:
+            active = [
+                i for i, run in enumerate(runs)
+                if positions[i] < len(run["key"])
+            ]
+
+            if len(active) == 0:
+                break
+
+            # The window ends at the smallest key found block_size rows
+            # ahead, so no run can have more than a block of smaller keys.
+            upper = min(
+                runs[i]["key"][min(positions[i] + block_size,
+                                   len(runs[i]["key"]) - 1)]
+                for i in active
+            )
+
+            pieces: Dict[str, List[np.ndarray]] = {k: [] for k in runs[0]}
+            for i in active:
+                run = runs[i]
+                start = positions[i]
+                end = start + int(np.searchsorted(
+                    run["key"][start:],
+                    upper,
+                    side="right"
+                ))
+
+                for k, v in run.items():
+                    pieces[k].append(np.asarray(v[start:end]))
+
+                positions[i] = end
+
+            window = {k: np.concatenate(v) for k, v in pieces.items()}
+            order = np.argsort(window["key"], kind="stable")
+            yield {k: v[order] for k, v in window.items()}
+
+        return
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import resource
+
+from collections import Counter
+
+from typing import Any, Dict, Iterable, Iterator
+from typing import Optional
+from typing import TextIO
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# The minimum number of seconds between --progress reports.
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+
+def peak_rss() -> int:
+    """ The peak resident set size in bytes of this process, and of any
+    child processes that have finished.
+    """
+
+    # ru_maxrss is in kilobytes on linux, but bytes on macos.
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def cpu_time() -> float:
+    """ The user and system time used by this process and by any child
+    processes that have finished, e.g. pool workers.
+    """
+
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def human(value: float) -> str:
+    """ Format a count with an SI suffix.
+
+    Examples:
+    >>> human(950)
+    '950'
+    >>> human(1234567)
+    '1.23M'
+    """
+
+    for suffix in ("", "k", "M", "G"):
+        if abs(value) < 1000:
+            break
+        value /= 1000
+    else:
+        suffix = "T"
+
+    if suffix == "":
+        return f"{value:.0f}"
+    return f"{value:.2f}{suffix}"
+
+
+class Stage(object):
+
+    """ The time, memory and throughput of one stage of a run.
+
+    A stage can be entered many times, e.g. once per batch, and the
+    measurements are summed.
+
+    Example:
+    >>> stage = Stage("parse")
+    >>> with stage:
+    ...     stage.add(100, 90)
+    >>> stage.calls, stage.records_in, stage.records_out
+    (1, 100, 90)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        progress: Optional[TextIO] = None,
+        interval: float = DEFAULT_PROGRESS_INTERVAL,
+    ):
+        self.name = name
+        self.progress = progress
+        self.interval = interval
+
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.records_in = 0
+        self.records_out = 0
+
+        self._active = False
+        self._wall_start = 0.0
+        self._cpu_start = 0.0
+        self._last_report = time.perf_counter()
+        return
+
+    def __enter__(self) -> 'Stage':
+        self._active = True
+        self._wall_start = time.perf_counter()
+        self._cpu_start = cpu_time()
+        return self
+
+    def __exit__(self, *args):
+        self._active = False
+        self.calls += 1
+        self.wall += time.perf_counter() - self._wall_start
+        self.cpu += cpu_time() - self._cpu_start
+        self.peak_rss = max(self.peak_rss, peak_rss())
+        return
+
+    def add(self, records_in: int = 0, records_out: int = 0):
+        """ Count records going through the stage. """
+
+        self.records_in += records_in
+        self.records_out += records_out
+
+        if self.progress is not None:
+            now = time.perf_counter()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                self.report(self.progress)
+        return
+
+    def rate(self) -> float:
+        """ The number of input records per second of wall time. """
+        return self.records_in / self.wall if self.wall > 0 else 0.0
+
+    def report(self, handle: TextIO):
+        # Include the time spent in the stage so far.
+        wall = self.wall
+        if self._active:
+            wall += time.perf_counter() - self._wall_start
+
+        rate = self.records_in / wall if wall > 0 else 0.0
+        print(
+            f"[{self.name}] {human(self.records_in)} records in, "
+            f"{human(self.records_out)} out, {human(rate)}/s",
+            file=handle,
+            flush=True,
+        )
+        return
+
+    def to_dict(self) -> Dict[str, Any]:
+        rate_out = self.records_out / self.wall if self.wall > 0 else 0.0
+        return {
+            "calls": self.calls,
+            "wall_seconds": round(self.wall, 6),
+            "cpu_seconds": round(self.cpu, 6),
+            "peak_rss_bytes": self.peak_rss,
+            "records_in": self.records_in,
+            "records_out": self.records_out,
+            "records_in_per_second": round(self.rate(), 3),
+            "records_out_per_second": round(rate_out, 3),
+        }
+
+
+class RunStats(object):
+
+    """ Collects per-stage measurements and named counters for a run.
+
+    Measuring a stage costs a few microseconds, so stages should wrap
+    batches rather than single records. Stages may be nested, e.g. parsing
+    inside a coverage stage, in which case their times overlap.
+
+    Example:
+    >>> stats = RunStats()
+    >>> for batch in stats.timed("parse", [[1, 2], [3]], len):
+    ...     with stats.stage("filter") as stage:
+    ...         stage.add(len(batch), 1)
+    >>> stats.count("rejected", 1)
+    >>> summary = stats.to_dict()
+    >>> summary["stages"]["parse"]["records_in"]
+    3
+    >>> summary["stages"]["filter"]["records_out"]
+    2
+    >>> summary["counters"]
+    {'rejected': 1}
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = dict()
+        self.counters: Counter = Counter()
+        self.progress: Optional[TextIO] = None
+        self.interval = DEFAULT_PROGRESS_INTERVAL
+        self.command: Optional[str] = None
+
+        self._wall_start = time.perf_counter()
+        self._cpu_start = cpu_time()
+        return
+
+    def set_progress(
+        self,
+        handle: Optional[TextIO],
+        interval: float = DEFAULT_PROGRESS_INTERVAL,
+    ):
+        """ Report the throughput of each stage to handle as it runs. """
+
+        self.progress = handle
+        self.interval = interval
+        for stage in self.stages.values():
+            stage.progress = handle
+            stage.interval = interval
+        return
+
+    def stage(self, name: str) -> Stage:
+        """ Get a stage to use as a context manager. """
+
+        if name not in self.stages:
+            self.stages[name] = Stage(name, self.progress, self.interval)
+        return self.stages[name]
+
+    def timed(
+        self,
+        name: str,
+        items: Iterable[T],
+        size=len,
+    ) -> Iterator[T]:
+        """ Time getting each item from an iterable, e.g. parsing batches,
+        and count the records with size.
+        """
+
+        stage = self.stage(name)
+        iterator = iter(items)
+        while True:
+            with stage:
+                item = next(iterator, None)
+                if item is None:
+                    return
+
+                nrecords = size(item)
+                stage.add(nrecords, nrecords)
+            yield item
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] += int(value)
+        return
+
+    def update(self, counters: Dict[str, int]):
+        """ Add counters, e.g. ones returned by a worker process. """
+
+        for name, value in counters.items():
+            self.count(name, value)
+        return
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "command": self.command,
+            "wall_seconds": round(time.perf_counter() - self._wall_start, 6),
+            "cpu_seconds": round(cpu_time() - self._cpu_start, 6),
+            "peak_rss_bytes": peak_rss(),
+            "stages": {k: v.to_dict() for k, v in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def write_json(self, handle: TextIO):
+        json.dump(self.to_dict(), handle, indent=2)
+        handle.write("\n")
+        return
+
+    def write_table(self, handle: TextIO):
+        """ Write a human readable summary of the stages. """
+
+        summary = self.to_dict()
+        print(
+            "stage\tcalls\twall_s\tcpu_s\tpeak_rss\trecords_in\t"
+            "records_out\tin_per_s",
+            file=handle
+        )
+        for name, stage in self.stages.items():
+            print(
+                f"{name}\t{stage.calls}\t{stage.wall:.3f}\t{stage.cpu:.3f}\t"
+                f"{human(stage.peak_rss)}B\t{stage.records_in}\t"
+                f"{stage.records_out}\t{human(stage.rate())}",
+                file=handle
+            )
+        print(
+            f"total\t1\t{summary['wall_seconds']:.3f}\t"
+            f"{summary['cpu_seconds']:.3f}\t"
+            f"{human(summary['peak_rss_bytes'])}B\t\t\t",
+            file=handle
+        )
+        for name, value in summary["counters"].items():
+            print(f"{name}\t{value}", file=handle)
+        return
+
+
+# The measurements for the current run. Subcommands record their stages
+# here, and the main entry point writes them out if asked.
+STATS = RunStats()
@@ -1,5 +1,12 @@
 #!/usr/bin/env python3
 
+import os
+import stat
+
+from typing import IO
+
+import numpy as np
+
 
 def get_genome_name(string: str, sep: str) -> str:
     """ Just split by separator and return first element.
@@ -11,3 +18,61 @@ def get_genome_name(string: str, sep: str) -> str:
     'test_one'
     """
     return string.split(sep, maxsplit=1)[0]
+
+
+def is_regular_file(handle: IO) -> bool:
+    """ Check if an open handle is a regular file that we can re-open.
+
+    Example:
+    >>> import sys
+    >>> is_regular_file(sys.stdin)
+    False
+    """
+
+    try:
+        mode = os.stat(handle.name).st_mode
+    except (AttributeError, TypeError, OSError):
+        return False
+
+    return stat.S_ISREG(mode)
+
+
+def parse_size(string: str) -> int:
+    """ Parse a size in bytes with an optional K, M, G or T suffix.
+
+    Example:
+    >>> parse_size("512")
+    512
+    >>> parse_size("1.5K")
+    1536
+    >>> parse_size("4G")
+    4294967296
+    """
+
+    units = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+    string = string.strip().upper().rstrip("B")
+
+    if len(string) > 0 and string[-1] in units:
+        return int(float(string[:-1]) * units[string[-1]])
+    return int(string)
+
+
+def grow_array(array: np.ndarray, size: int, fill=0) -> np.ndarray:
+    """ Extend an array to at least size elements.
+
+    The array at least doubles in size, so that growing it one batch at a
+    time takes amortised linear time.
+
+    Example:
+    >>> grow_array(np.array([1, 2]), 3, fill=-1)
+    array([ 1,  2, -1, -1])
+    >>> grow_array(np.array([1, 2]), 1)
+    array([1, 2])
+    """
+
+    if len(array) >= size:
+        return array
+
+    extra = np.full(max(size, 2 * len(array)) - len(array), fill,
+                    dtype=array.dtype)
+    return np.concatenate([array, extra])
@@ -74,7 +74,6 @@ setup(
     # The way that the PCA model is stored is not necessarily stable across
     # versions of scikit-learn, so I have to keep it fixed.
     install_requires=[
-        'biopython>=1.70',
         'intervaltree>=3.0.2',
         'markov-clustering>=0.0.6.dev0',
         'networkx>=2.4',
@@ -87,8 +86,9 @@ setup(
     # for example:
     # $ pip install -e .[dev,test]
     extras_require={
-        'dev': ['check-manifest', 'mypy', 'jupyter'],
+        'dev': ['check-manifest', 'mypy', 'jupyter', 'biopython>=1.70'],
         'test': ['coverage', 'pytest'],
+        'zstd': ['zstandard'],
     },
 
     # If there are data files included in your packages that need to be
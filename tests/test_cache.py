@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import os
+
+import numpy as np
+
+from pypafgraph.cache import CoverageCache
+from pypafgraph.clustering import CoverageTable
+
+
+def make_table(cov: float) -> CoverageTable:
+    return CoverageTable(
+        ["a", "b"],
+        np.array([0]),
+        np.array([1]),
+        np.array([cov]),
+    )
+
+
+def test_put_keeps_existing_entry(tmp_path):
+    cache = CoverageCache(str(tmp_path))
+    cache.put("key", make_table(0.5))
+    cache.put("key", make_table(0.9))
+    assert cache.get("key").cov.tolist() == [0.5]
+
+
+def test_put_loses_race_quietly(tmp_path, monkeypatch):
+    cache = CoverageCache(str(tmp_path))
+    cache.put("key", make_table(0.5))
+
+    # Pretend that the entry was written by another run after this one
+    # checked for it, so that the rename fails.
+    monkeypatch.setattr(os.path, "isdir", lambda path: False)
+    cache.put("key", make_table(0.9))
+
+    assert cache.get("key").cov.tolist() == [0.5]
+    assert [e.name for e in os.scandir(tmp_path)] == ["key"]
+
+
+def test_get_ignores_failed_touch(tmp_path, monkeypatch):
+    cache = CoverageCache(str(tmp_path))
+    cache.put("key", make_table(0.5))
+
+    def utime(path, *args, **kwargs):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(os, "utime", utime)
+    assert cache.get("key").cov.tolist() == [0.5]
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+from typing import List
+
+import pytest
+
+from pypafgraph.scripts import cli
+
+
+@pytest.mark.parametrize("args, message", [
+    (["--stats"], "argument --stats: expected one argument"),
+    (["--progress-interval", "x", "filter"], "invalid float value: 'x'"),
+    (["--stats", "filter", "in.bed", "in.paf"], "invalid choice: 'in.bed'"),
+    (["filter", "missing.bed", "in.paf"], "can't open 'missing.bed'"),
+])
+def test_parse_errors_are_reported(
+    tmp_path,
+    monkeypatch,
+    capsys,
+    args: List[str],
+    message: str,
+):
+    (tmp_path / "in.paf").touch()
+    monkeypatch.chdir(tmp_path)
+
+    with pytest.raises(SystemExit) as excinfo:
+        cli("ppg", args)
+    assert excinfo.value.code == 2
+    assert message in capsys.readouterr().err
+
+
+def test_subcommand_options_after_global_options(tmp_path, monkeypatch):
+    (tmp_path / "in.paf").touch()
+    monkeypatch.chdir(tmp_path)
+
+    args = cli("ppg", ["--stats", "s.json", "repeats", "--sorted", "in.paf"])
+    assert args.stats == "s.json"
+    assert args.subparser_name == "repeats"
+    assert args.sorted
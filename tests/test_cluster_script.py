@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+
+from typing import List
+
+import pytest
+
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.cluster import cluster_main
+
+
+def paf_line(query: str, target: str, aligned: int) -> str:
+    return (
+        f"{query}\t1000\t0\t{aligned}\t+\t"
+        f"{target}\t1000\t0\t{aligned}\t{aligned}\t{aligned}\t60\n"
+    )
+
+
+def run_cluster(tmp_path, name: str, options: List[str]) -> str:
+    outfile = tmp_path / f"{name}.tsv"
+    args = cli("ppg", ["cluster", str(tmp_path / "in.paf"),
+                       "-o", str(outfile)] + options)
+    cluster_main(args)
+    return outfile.read_text()
+
+
+def test_default_min_mcl_size_matches_mcl(tmp_path):
+    with open(tmp_path / "in.paf", "w") as handle:
+        # A weakly linked pair, which MCL splits.
+        handle.write(paf_line("g1.a", "g2.a", 50))
+        # A strongly linked pair and a triangle, which it doesn't.
+        handle.write(paf_line("g1.b", "g2.b", 900))
+        handle.write(paf_line("g1.c", "g2.c", 900))
+        handle.write(paf_line("g1.c", "g3.c", 900))
+        handle.write(paf_line("g2.c", "g3.c", 900))
+
+    default = run_cluster(tmp_path, "default", [])
+    every = run_cluster(tmp_path, "every", ["--min-mcl-size", "1"])
+    assert default == every
+
+    clusters = [line.split("\t")[0] for line in default.splitlines()]
+    assert len(set(clusters)) == 4
+
+
+def test_grid_options_before_the_paf(tmp_path):
+    with open(tmp_path / "in.paf", "w") as handle:
+        handle.write(paf_line("g1.a", "g2.a", 900))
+
+    prefix = str(tmp_path / "grid_")
+    args = cli("ppg", [
+        "cluster",
+        "--grid", "inflation=1.5,2",
+        "--grid", "min-cov=0.1",
+        str(tmp_path / "in.paf"),
+        "--grid-prefix", prefix,
+        "-o", str(tmp_path / "summary.tsv"),
+    ])
+    assert args.grid == [("inflation", [1.5, 2.0]), ("min-cov", [0.1])]
+
+    cluster_main(args)
+    summary = (tmp_path / "summary.tsv").read_text().splitlines()
+    assert len(summary) == 3
+    for line in summary[1:]:
+        assert os.path.exists(line.split("\t")[-1])
+
+
+def test_grid_rejects_repeated_parameters(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        cli("ppg", [
+            "cluster",
+            "--grid", "inflation=1.5",
+            "--grid", "inflation=2",
+            str(tmp_path / "in.paf"),
+        ])
+    assert "inflation was given more than once" in capsys.readouterr().err
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import random
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pytest
+
+from scipy import sparse
+
+from pypafgraph.clustering import CoverageAccumulator, _expand
+from pypafgraph.paf import read_paf_batches
+
+
+def random_matrix(
+    size: int = 12,
+    density: float = 0.4,
+) -> sparse.csc_matrix:
+    matrix = sparse.random(size, size, density=density, format="csc",
+                           random_state=np.random.RandomState(1))
+    # Column stochastic, like the matrices that MCL expands.
+    matrix = matrix + sparse.identity(size, format="csc")
+    return (matrix / matrix.sum(axis=0)).tocsc()
+
+
+@pytest.mark.parametrize("power", [2, 3, 4])
+def test_expand_matches_matrix_power(power: int):
+    matrix = random_matrix()
+    expected = np.linalg.matrix_power(matrix.toarray(), power)
+    np.testing.assert_allclose(_expand(matrix, power).toarray(), expected)
+
+
+@pytest.mark.parametrize("power", [2, 3, 4])
+def test_expand_in_blocks_matches_matrix_power(power: int):
+    matrix = random_matrix()
+    expected = np.linalg.matrix_power(matrix.toarray(), power)
+    with ThreadPoolExecutor(2) as executor:
+        result = _expand(matrix, power, executor, nblocks=3)
+    np.testing.assert_allclose(result.toarray(), expected)
+
+
+def sorted_paf(seed: int = 1) -> List[str]:
+    """ A query sorted all-vs-all, with most pairs reported both ways. """
+
+    rng = random.Random(seed)
+    names = [f"g{g}.c{c}" for g in range(8) for c in range(4)]
+    lengths = {name: rng.choice([500, 800, 1000]) for name in names}
+
+    records = []
+    for _ in range(400):
+        query, target = rng.sample(names, 2)
+        qstart = rng.randint(0, 400)
+        tstart = rng.randint(0, 400)
+        length = rng.randint(10, 100)
+        records.append((query, qstart, (
+            f"{query}\t{lengths[query]}\t{qstart}\t{qstart + length}\t+\t"
+            f"{target}\t{lengths[target]}\t{tstart}\t{tstart + length}\t"
+            f"{length}\t{length}\t60\n"
+        )))
+    return [line for _, _, line in sorted(records)]
+
+
+def coverages(
+    lines: List[str],
+    batch_size: int,
+    sorted_by_query: bool,
+    max_memory: Optional[int] = None,
+    buffer_size: int = 16,
+) -> List[Tuple[str, str, float]]:
+    accumulator = CoverageAccumulator(
+        sorted_by_query=sorted_by_query,
+        max_memory=max_memory,
+        buffer_size=buffer_size,
+    )
+    for batch in read_paf_batches(lines, batch_size=batch_size):
+        accumulator.add(batch)
+
+    queries, targets, covs = accumulator.finish()
+    names = accumulator.names
+    return [
+        (names[q], names[t], c)
+        for q, t, c in zip(queries.tolist(), targets.tolist(), covs.tolist())
+    ]
+
+
+@pytest.mark.parametrize("max_memory", [None, 2048])
+@pytest.mark.parametrize("batch_size", [3, 7, 13, 50, 1000])
+def test_sorted_coverages_match_unsorted(
+    batch_size: int,
+    max_memory: Optional[int],
+):
+    lines = sorted_paf()
+    expected = coverages(lines, len(lines), sorted_by_query=False)
+    assert len(expected) > 100
+
+    result = coverages(lines, batch_size, True, max_memory)
+    assert result == expected
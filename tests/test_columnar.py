@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import random
+
+from typing import List
+
+import pytest
+
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.convert import convert_main
+from pypafgraph.scripts.filter import filter_main
+from pypafgraph.scripts.repeats import repeats_main
+from pypafgraph.scripts.cluster import cluster_main
+
+
+def write_inputs(tmp_path, seed: int = 1):
+    """ Alignments within and between genomes, some with several tags and
+    some with none, and a bed of repeats.
+    """
+
+    rng = random.Random(seed)
+    lengths = {
+        f"g{g}.c{c}": rng.randint(1000, 5000)
+        for g in range(5)
+        for c in range(4)
+    }
+    names = sorted(lengths)
+
+    with open(tmp_path / "in.paf", "w") as handle:
+        for _ in range(500):
+            query, target = rng.choice(names), rng.choice(names)
+            qstart = rng.randint(0, lengths[query] - 500)
+            tstart = rng.randint(0, lengths[target] - 500)
+            length = rng.randint(5, 500)
+            tags = rng.choice(["", "\ttp:A:P", "\ttp:A:S\tcm:i:12\ts1:i:40"])
+            handle.write(
+                f"{query}\t{lengths[query]}\t{qstart}\t{qstart + length}\t"
+                f"{rng.choice('+-')}\t{target}\t{lengths[target]}\t{tstart}\t"
+                f"{tstart + length}\t{length}\t{length}\t60{tags}\n"
+            )
+
+    with open(tmp_path / "in.bed", "w") as handle:
+        for name in names:
+            for _ in range(rng.randint(0, 5)):
+                start = rng.randint(0, lengths[name] - 300)
+                end = start + rng.randint(1, 300)
+                handle.write(f"{name}\t{start}\t{end}\n")
+    return
+
+
+def convert(tmp_path, options: List[str]) -> str:
+    path = str(tmp_path / "in.ppaf")
+    convert_main(cli("ppg", [
+        "convert", str(tmp_path / "in.paf"), "-o", path,
+    ] + options))
+    return path
+
+
+def run(tmp_path, command: List[str], inpaf: str, name: str) -> List[str]:
+    """ Run a subcommand with inpaf as its last positional argument. """
+
+    mains = {
+        "filter": filter_main,
+        "repeats": repeats_main,
+        "cluster": cluster_main,
+    }
+
+    outfile = tmp_path / name
+    args = cli("ppg", [command[0]] + command[1:] + [inpaf, "-o", str(outfile)])
+    mains[command[0]](args)
+
+    with open(outfile) as handle:
+        return handle.readlines()
+
+
+def without_tags(lines: List[str]) -> List[str]:
+    return ["\t".join(line.split("\t")[:12]).rstrip("\n") + "\n"
+            for line in lines]
+
+
+@pytest.mark.parametrize("options", [[], ["-c", "7"], ["--no-tags"]])
+@pytest.mark.parametrize("command", [
+    ["filter", "BED"],
+    ["filter", "-t", "2", "BED"],
+    ["filter", "-m", "100", "-s", ".", "BED"],
+    ["repeats"],
+    ["cluster"],
+])
+def test_columnar_matches_text(
+    tmp_path,
+    command: List[str],
+    options: List[str],
+):
+    write_inputs(tmp_path)
+    command = [str(tmp_path / "in.bed") if c == "BED" else c for c in command]
+
+    expected = run(tmp_path, command, str(tmp_path / "in.paf"), "text")
+    assert len(expected) > 0
+
+    columnar = convert(tmp_path, options)
+    result = run(tmp_path, command, columnar, "columnar")
+
+    if command[0] == "filter" and "--no-tags" in options:
+        expected = without_tags(expected)
+    assert result == expected
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import io
+import random
+
+from typing import List, Tuple
+
+import pytest
+
+from pypafgraph.fasta import Fasta, write_fasta
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.unsoftmask import unsoftmask_main
+
+Record = Tuple[str, str, bytes]
+
+
+def random_records(seed: int = 1) -> List[Record]:
+    """ Records with and without descriptions, including an empty one and
+    some long enough to be wrapped with numpy.
+    """
+
+    rng = random.Random(seed)
+    records = [("empty", "empty", b"")]
+    for i in range(30):
+        id = f"g{i % 3}.c{i}"
+        description = id if i % 2 == 0 else f"{id} contig {i} len=x"
+        length = rng.choice([1, 59, 60, 61, 500, 5000])
+        seq = bytes(rng.choice(b"ACGTacgtN") for _ in range(length))
+        records.append((id, description, seq))
+    return records
+
+
+def read(data: bytes, chunk_size: int) -> List[Record]:
+    handle = io.BytesIO(data)
+    return [tuple(r) for r in Fasta.from_file(handle, chunk_size)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 2 ** 20])
+@pytest.mark.parametrize("width", [None, 1, 60, 80])
+def test_round_trip(width, chunk_size: int):
+    records = random_records()
+
+    handle = io.BytesIO()
+    for _, description, seq in records:
+        write_fasta(handle, description, seq, width)
+
+    assert read(handle.getvalue(), chunk_size) == records
+
+
+def messy_fasta() -> bytes:
+    """ Blank lines, carriage returns, spaces and ragged lines. """
+
+    return (
+        b">one first record\r\n"
+        b"ACGT\r\nAC GT\r\n\r\n"
+        b">two\n"
+        b"A\nCCCCCCCCCC\nGG\n"
+        b">three  spaced   description \n"
+        b">four\n"
+        b"ac>gt\n"
+        b"tt"
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 2 ** 20])
+def test_reads_like_seqio(chunk_size: int):
+    SeqIO = pytest.importorskip("Bio.SeqIO")
+
+    data = messy_fasta()
+    expected = [
+        (r.id, r.description, str(r.seq).encode())
+        for r in SeqIO.parse(io.StringIO(data.decode()), "fasta")
+    ]
+    assert read(data, chunk_size) == expected
+
+
+def test_writes_like_seqio():
+    SeqIO = pytest.importorskip("Bio.SeqIO")
+    from Bio.Seq import Seq
+    from Bio.SeqRecord import SeqRecord
+
+    records = random_records()
+
+    expected = io.StringIO()
+    SeqIO.write(
+        [
+            SeqRecord(Seq(seq.decode()), id=id, description=description)
+            for id, description, seq in records
+        ],
+        expected,
+        "fasta",
+    )
+
+    handle = io.BytesIO()
+    for _, description, seq in records:
+        write_fasta(handle, description, seq)
+    assert handle.getvalue().decode() == expected.getvalue()
+
+
+@pytest.mark.parametrize("width", [0, 60])
+def test_unsoftmask_fasta_round_trip(tmp_path, width: int):
+    records = random_records()
+    with open(tmp_path / "in.fasta", "wb") as handle:
+        for _, description, seq in records:
+            write_fasta(handle, description, seq, 70)
+
+    args = cli("ppg", [
+        "unsoftmask", str(tmp_path / "in.fasta"),
+        "-o", str(tmp_path / "out.bed"),
+        "-f", str(tmp_path / "out.fasta"),
+        "-w", str(width),
+    ])
+    unsoftmask_main(args)
+
+    with open(tmp_path / "out.fasta", "rb") as handle:
+        data = handle.read()
+
+    expected = [(id, desc, seq.upper()) for id, desc, seq in records]
+    assert read(data, 2 ** 20) == expected
+
+    lines = data.splitlines()
+    if width == 0:
+        assert len(lines) == 2 * len(records) - 1
+    else:
+        assert max(len(line) for line in lines if line[:1] != b">") == 60
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import random
+
+from typing import List, Optional
+
+import pytest
+
+from intervaltree import Interval, IntervalTree
+
+from pypafgraph.paf import PAF
+from pypafgraph.utils import get_genome_name
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.filter import filter_main
+
+
+def write_inputs(tmp_path, seed: int = 1):
+    """ Repeats that overlap and touch, and alignments between genomes. """
+
+    rng = random.Random(seed)
+    lengths = {
+        f"g{g}.c{c}": rng.randint(1000, 5000)
+        for g in range(5)
+        for c in range(4)
+    }
+    names = sorted(lengths)
+
+    with open(tmp_path / "in.bed", "w") as handle:
+        # The last sequence has no repeats.
+        for name in names[:-1]:
+            for _ in range(rng.randint(0, 8)):
+                start = rng.randint(0, lengths[name] - 200)
+                end = start + rng.randint(1, 200)
+                handle.write(f"{name}\t{start}\t{end}\n")
+                if rng.random() < 0.2:
+                    handle.write(f"{name}\t{end}\t{end + 50}\n")
+
+    with open(tmp_path / "in.paf", "w") as handle:
+        for _ in range(1000):
+            query, target = rng.sample(names, 2)
+            qstart = rng.randint(0, lengths[query] - 500)
+            tstart = rng.randint(0, lengths[target] - 500)
+            length = rng.randint(5, 500)
+            strand = rng.choice("+-")
+            handle.write(
+                f"{query}\t{lengths[query]}\t{qstart}\t{qstart + length}\t"
+                f"{strand}\t{target}\t{lengths[target]}\t{tstart}\t"
+                f"{tstart + length}\t{length}\t{length}\t60\ttp:A:P\n"
+            )
+    return
+
+
+def repeat_bases(itree: Optional[IntervalTree], interval: Interval) -> int:
+    if itree is None or interval.length() <= 0:
+        return 0
+
+    overlaps = IntervalTree(itree.overlap(interval))
+    overlaps.merge_overlaps()
+    return sum(
+        min(o.end, interval.end) - max(o.begin, interval.begin)
+        for o in overlaps
+    )
+
+
+def baseline_filter(
+    tmp_path,
+    min_length: int,
+    prop_overlap: float,
+    sep: Optional[str],
+) -> List[str]:
+    """ The filter from before it was vectorised, one record at a time. """
+
+    trees = {}
+    with open(tmp_path / "in.bed") as handle:
+        for line in handle:
+            seqid, start, end = line.split("\t")
+            trees.setdefault(seqid, IntervalTree()).addi(int(start),
+                                                         int(end))
+    for tree in trees.values():
+        tree.merge_overlaps()
+
+    def excluded(seqid: str, interval: Interval) -> bool:
+        covered = repeat_bases(trees.get(seqid), interval)
+        prop = covered / interval.length() if interval.length() > 0 else 0
+        return (
+            (interval.length() - covered) < min_length or
+            prop >= prop_overlap
+        )
+
+    kept = []
+    with open(tmp_path / "in.paf") as handle:
+        for p in PAF.from_file(handle):
+            if sep is not None:
+                qgenome = get_genome_name(p.query, sep)
+                tgenome = get_genome_name(p.target, sep)
+                if qgenome == tgenome:
+                    continue
+
+            if p.alilen < min_length:
+                continue
+
+            if excluded(*p.query_as_interval()):
+                continue
+
+            if excluded(*p.target_as_interval()):
+                continue
+
+            kept.append(f"{p}\n")
+    return kept
+
+
+@pytest.mark.parametrize("threads", [1, 2])
+@pytest.mark.parametrize("min_length, prop_overlap, sep", [
+    (1, 0.5, None),
+    (100, 0.5, "."),
+    (50, 0.1, None),
+    (1, 1.0, "."),
+])
+def test_filter_matches_baseline(
+    tmp_path,
+    min_length: int,
+    prop_overlap: float,
+    sep: Optional[str],
+    threads: int,
+):
+    write_inputs(tmp_path)
+    expected = baseline_filter(tmp_path, min_length, prop_overlap, sep)
+    assert 0 < len(expected) < 1000
+
+    options = [
+        "-m", str(min_length),
+        "-p", str(prop_overlap),
+        "-t", str(threads),
+    ]
+    if sep is not None:
+        options.extend(["-s", sep])
+
+    args = cli("ppg", [
+        "filter", str(tmp_path / "in.bed"), str(tmp_path / "in.paf"),
+        "-o", str(tmp_path / "out.paf"),
+    ] + options)
+    filter_main(args)
+
+    with open(tmp_path / "out.paf") as handle:
+        assert handle.readlines() == expected
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import gzip
+import random
+
+from typing import List
+
+import pytest
+
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.filter import filter_main
+from pypafgraph.scripts.index_repeats import index_repeats_main
+
+
+def write_inputs(tmp_path, seed: int = 1):
+    """ An unsorted bed with overlapping and touching repeats, and
+    alignments that include sequences without any repeats.
+    """
+
+    rng = random.Random(seed)
+    lengths = {
+        f"g{g}.c{c}": rng.randint(1000, 5000)
+        for g in range(5)
+        for c in range(4)
+    }
+    names = sorted(lengths)
+
+    lines = []
+    for name in names[:-3]:
+        for _ in range(rng.randint(0, 8)):
+            start = rng.randint(0, lengths[name] - 200)
+            end = start + rng.randint(1, 200)
+            lines.append(f"{name}\t{start}\t{end}\n")
+            if rng.random() < 0.2:
+                lines.append(f"{name}\t{end}\t{end + 50}\n")
+    rng.shuffle(lines)
+
+    with open(tmp_path / "in.bed", "w") as handle:
+        handle.writelines(lines)
+    with gzip.open(tmp_path / "in.bed.gz", "wt") as handle:
+        handle.writelines(lines)
+
+    with open(tmp_path / "in.paf", "w") as handle:
+        for _ in range(1000):
+            query, target = rng.sample(names, 2)
+            qstart = rng.randint(0, lengths[query] - 500)
+            tstart = rng.randint(0, lengths[target] - 500)
+            length = rng.randint(5, 500)
+            handle.write(
+                f"{query}\t{lengths[query]}\t{qstart}\t{qstart + length}\t"
+                f"+\t{target}\t{lengths[target]}\t{tstart}\t"
+                f"{tstart + length}\t{length}\t{length}\t60\n"
+            )
+    return
+
+
+def run_filter(tmp_path, repeats: str, options: List[str]) -> List[str]:
+    outfile = tmp_path / "out.paf"
+    filter_main(cli("ppg", [
+        "filter", repeats, str(tmp_path / "in.paf"), "-o", str(outfile),
+    ] + options))
+
+    with open(outfile) as handle:
+        return handle.readlines()
+
+
+@pytest.mark.parametrize("bed", ["in.bed", "in.bed.gz"])
+@pytest.mark.parametrize("options", [
+    [],
+    ["-t", "2"],
+    ["-m", "100", "-p", "0.1", "-s", "."],
+])
+def test_index_matches_bed(tmp_path, bed: str, options: List[str]):
+    write_inputs(tmp_path)
+    expected = run_filter(tmp_path, str(tmp_path / "in.bed"), options)
+    assert 0 < len(expected) < 1000
+
+    index = str(tmp_path / "repeats.idx")
+    index_repeats_main(cli("ppg", [
+        "index-repeats", str(tmp_path / bed), "-o", index,
+    ]))
+
+    assert run_filter(tmp_path, index, options) == expected
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import gzip
+import time
+import random
+
+from typing import Iterator, List, Tuple
+
+import pytest
+
+from pypafgraph.pipeline import run_pipeline
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.unsoftmask import unsoftmask_main
+
+
+def jittered(items: List[int], seed: int) -> Iterator[int]:
+    rng = random.Random(seed)
+    for item in items:
+        time.sleep(rng.random() / 1000)
+        yield item
+
+
+def test_run_pipeline_keeps_order():
+    rng = random.Random(1)
+
+    def compute(item: int) -> int:
+        time.sleep(rng.random() / 1000)
+        return item * 2
+
+    written: List[int] = []
+    run_pipeline(jittered(list(range(200)), 2), compute, written.append,
+                 depth=2)
+    assert written == [i * 2 for i in range(200)]
+
+
+def fail_at(n: int):
+    def step(item: int) -> int:
+        if item == n:
+            raise RuntimeError(f"failed at {n}")
+        return item
+    return step
+
+
+@pytest.mark.parametrize("step", ["read", "compute", "write"])
+def test_run_pipeline_reraises(step: str):
+    def items() -> Iterator[int]:
+        for i in range(1000):
+            if step == "read" and i == 10:
+                raise RuntimeError("failed at 10")
+            yield i
+
+    compute = fail_at(10) if step == "compute" else (lambda i: i)
+    written: List[int] = []
+    write = fail_at(10) if step == "write" else written.append
+
+    with pytest.raises(RuntimeError, match="failed at 10"):
+        run_pipeline(items(), compute, write, depth=2)
+
+
+def lowercase_runs(seq: str) -> List[Tuple[int, int]]:
+    """ Stretches from a lowercase letter up to the next uppercase one. """
+
+    runs = []
+    start = None
+    for i, base in enumerate(seq):
+        if start is None and base.islower():
+            start = i
+        elif start is not None and base.isupper():
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, len(seq)))
+    return runs
+
+
+@pytest.mark.parametrize("outbed", ["out.bed", "out.bed.gz"])
+def test_unsoftmask_matches_expected(tmp_path, outbed: str):
+    rng = random.Random(1)
+
+    expected = []
+    with open(tmp_path / "in.fasta", "w") as handle:
+        for i in range(300):
+            seq = "".join(
+                rng.choice("ACGT" if rng.random() < 0.7 else "acgtnN-")
+                for _ in range(rng.randint(0, 300))
+            )
+            handle.write(f">seq{i} description\n{seq}\n")
+            expected.extend(
+                f"seq{i}\t{start}\t{end}\n"
+                for start, end in lowercase_runs(seq)
+            )
+
+    path = tmp_path / outbed
+    unsoftmask_main(cli("ppg", [
+        "unsoftmask", str(tmp_path / "in.fasta"), "-o", str(path),
+    ]))
+
+    with (gzip.open if outbed.endswith(".gz") else open)(path, "rt") as out:
+        assert out.readlines() == expected
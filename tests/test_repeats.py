@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import random
+
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from pypafgraph.paf import read_paf_batches
+from pypafgraph.repeats import RepeatAccumulator
+
+
+def sorted_paf(seed: int = 1) -> List[str]:
+    """ A query sorted all-vs-all with each pair reported once. Some
+    sequences only align to other genomes, so they have no repeats.
+    """
+
+    rng = random.Random(seed)
+    names = [f"g{g}.c{c}" for g in range(10) for c in range(4)]
+
+    records = []
+    for _ in range(500):
+        query, target = sorted(rng.sample(names, 2))
+        qstart = rng.randint(0, 900)
+        tstart = rng.randint(0, 900)
+        length = rng.randint(10, 100)
+        records.append((query, qstart, (
+            f"{query}\t1000\t{qstart}\t{qstart + length}\t+\t"
+            f"{target}\t1000\t{tstart}\t{tstart + length}\t"
+            f"{length}\t{length}\t60\n"
+        )))
+    return [line for _, _, line in sorted(records)]
+
+
+Intervals = Dict[str, List[Tuple[int, int]]]
+
+
+def accumulate(
+    lines: List[str],
+    batch_size: int,
+    sorted_by_query: bool,
+    max_memory: Optional[int] = None,
+) -> Tuple[Intervals, List[str]]:
+    """ The intervals of each sequence, and the order they were output. """
+
+    accumulator = RepeatAccumulator(
+        ".",
+        sorted_by_query=sorted_by_query,
+        max_memory=max_memory,
+    )
+
+    parts = []
+    for batch in read_paf_batches(lines, batch_size=batch_size):
+        finished = accumulator.add(batch)
+        if finished is not None:
+            parts.append(finished)
+    parts.extend(accumulator.finish())
+
+    intervals: Intervals = dict()
+    order: List[str] = []
+    for names, keys, starts, ends in parts:
+        for key, start, end in zip(keys.tolist(), starts.tolist(),
+                                   ends.tolist()):
+            name = names[key]
+            if len(order) == 0 or order[-1] != name:
+                order.append(name)
+            intervals.setdefault(name, []).append((start, end))
+    return intervals, order
+
+
+@pytest.mark.parametrize("batch_size", [3, 7, 13, 50, 1000])
+@pytest.mark.parametrize("max_memory", [None, 2048])
+def test_sorted_matches_unsorted(batch_size: int, max_memory: Optional[int]):
+    lines = sorted_paf()
+    expected, _ = accumulate(lines, 1000, sorted_by_query=False)
+    intervals, order = accumulate(lines, batch_size, True, max_memory)
+
+    assert len(expected) > 0
+    assert intervals == expected
+
+    # Each sequence is output once, with all of its intervals.
+    assert len(order) == len(set(order))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import random
+
+from typing import Dict, List, Tuple
+
+import pytest
+
+from pypafgraph.fasta import Fasta, wrap
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.selectseqs import selectseqs_main
+
+
+def write_inputs(tmp_path, seed: int = 1) -> List[str]:
+    """ A fasta with sequences at the output line width, which can be
+    copied, and at other widths, which are parsed. Returns the expected
+    .fai lines.
+    """
+
+    rng = random.Random(seed)
+    fai = []
+    with open(tmp_path / "in.fasta", "wb") as handle, \
+            open(tmp_path / "clusters.tsv", "w") as table:
+        for i in range(40):
+            name = f"g{i % 4}.c{i}"
+            header = f">{name} contig {i}\n".encode()
+            width = rng.choice([60, 60, 50, 1000])
+            length = rng.choice([1, 60, 61, 119, 120, 500])
+            seq = bytes(rng.choice(b"ACGTacgtN") for _ in range(length))
+
+            handle.write(header)
+            offset = handle.tell()
+            handle.write(wrap(seq, width))
+            fai.append(f"{name}\t{length}\t{offset}\t"
+                       f"{min(width, length)}\t{min(width, length) + 1}")
+
+            # One sequence in three isn't in the table, and cluster 0 is
+            # too small, so both are unplaced.
+            if i % 3 != 0:
+                cluster = 0 if i == 4 else i % 3
+                table.write(f"{cluster}\t{name}\n")
+    return fai
+
+
+def run_selectseqs(tmp_path, name: str, options: List[str]) -> Dict:
+    outdir = tmp_path / name
+    args = cli("ppg", [
+        "selectseqs",
+        str(tmp_path / "clusters.tsv"),
+        str(tmp_path / "in.fasta"),
+        "-o", str(outdir),
+        "-p", "cl",
+        "-m", "2",
+    ] + options)
+    selectseqs_main(args)
+
+    outputs = {}
+    for entry in sorted(os.scandir(outdir), key=lambda e: e.name):
+        with open(entry.path, "rb") as handle:
+            outputs[entry.name] = handle.read()
+    return outputs
+
+
+def records(data: bytes) -> List[Tuple[str, str, bytes]]:
+    return [tuple(r) for r in Fasta.from_file(io.BytesIO(data))]
+
+
+@pytest.mark.parametrize("options", [
+    ["--index"],
+    ["--index", "-t", "2"],
+    ["--index", "-w", "0"],
+    ["--spool"],
+])
+def test_selectseqs_matches_streaming(tmp_path, options: List[str]):
+    fai = write_inputs(tmp_path)
+    width = options[options.index("-w") + 1] if "-w" in options else "60"
+
+    expected = run_selectseqs(tmp_path, "streamed", ["-w", width])
+    assert sorted(expected) == ["cl1.fasta", "cl2.fasta", "unplaced.fasta"]
+
+    result = run_selectseqs(tmp_path, "result", options)
+    assert result == expected
+
+    if "--index" in options:
+        with open(tmp_path / "in.fasta.fai") as handle:
+            assert handle.read().splitlines() == fai
+
+
+def test_selectseqs_writes_every_sequence_once(tmp_path):
+    write_inputs(tmp_path)
+    with open(tmp_path / "in.fasta", "rb") as handle:
+        inputs = records(handle.read())
+
+    outputs = run_selectseqs(tmp_path, "result", ["--index"])
+    written = [r for data in outputs.values() for r in records(data)]
+    assert sorted(written) == sorted(inputs)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import subprocess
+
+from typing import List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_ppg(args: List[str]) -> subprocess.CompletedProcess:
+    code = (
+        "import sys; sys.argv[0] = 'ppg'; "
+        "from pypafgraph.scripts import main; main()"
+    )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (REPO, env.get("PYTHONPATH")) if p
+    )
+    return subprocess.run(
+        [sys.executable, "-c", code] + args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def paf_line(query: str, target: str) -> str:
+    return (
+        f"{query}\t1000\t0\t500\t+\t{target}\t1000\t0\t500\t500\t500\t60\n"
+    )
+
+
+def assert_input_error(result: subprocess.CompletedProcess, message: str):
+    assert result.returncode == 1
+    assert "Traceback" not in result.stderr
+    assert "bug report" not in result.stderr
+    assert message in result.stderr
+
+
+def test_filter_sorted_rejects_unsorted_paf(tmp_path):
+    with open(tmp_path / "in.paf", "w") as handle:
+        handle.write(paf_line("g1.a", "g2.a"))
+        handle.write(paf_line("g1.b", "g2.a"))
+        handle.write(paf_line("g1.a", "g2.b"))
+
+    with open(tmp_path / "in.bed", "w") as handle:
+        handle.write("g1.a\t0\t10\n")
+
+    result = run_ppg([
+        "filter", "--sorted", str(tmp_path / "in.bed"),
+        str(tmp_path / "in.paf"), "-o", str(tmp_path / "out.paf"),
+    ])
+    assert_input_error(result, "not sorted by query")
+
+
+def test_filter_sorted_rejects_unsorted_bed(tmp_path):
+    with open(tmp_path / "in.paf", "w") as handle:
+        handle.write(paf_line("g1.a", "g2.a"))
+
+    with open(tmp_path / "in.bed", "w") as handle:
+        handle.write("g1.a\t50\t60\ng1.a\t0\t10\n")
+
+    result = run_ppg([
+        "filter", "--sorted", str(tmp_path / "in.bed"),
+        str(tmp_path / "in.paf"), "-o", str(tmp_path / "out.paf"),
+    ])
+    assert_input_error(result, "is not sorted")
+
+
+def test_repeats_sorted_rejects_two_way_pairs(tmp_path):
+    with open(tmp_path / "in.paf", "w") as handle:
+        handle.write(paf_line("g1.a", "g1.b"))
+        handle.write(paf_line("g1.b", "g1.a"))
+
+    result = run_ppg([
+        "repeats", "--sorted", str(tmp_path / "in.paf"),
+        "-o", str(tmp_path / "out.bed"),
+    ])
+    assert_input_error(result, "after its block of queries ended")
+
+
+
+def test_cluster_sorted_rejects_unsorted_paf(tmp_path):
+    with open(tmp_path / "in.paf", "w") as handle:
+        handle.write(paf_line("g1.a", "g2.a"))
+        handle.write(paf_line("g1.b", "g2.a"))
+        handle.write(paf_line("g1.a", "g2.b"))
+
+    result = run_ppg([
+        "cluster", "--sorted", str(tmp_path / "in.paf"),
+        "-o", str(tmp_path / "out.tsv"),
+    ])
+    assert_input_error(result, "not sorted by query")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import random
+
+from typing import List
+
+import pytest
+
+from pypafgraph.spill import SpillRuns
+from pypafgraph.scripts import cli
+from pypafgraph.scripts.convert import convert_main
+from pypafgraph.scripts.repeats import repeats_main
+from pypafgraph.scripts.cluster import cluster_main
+
+
+def write_columnar(tmp_path, seed: int = 1) -> str:
+    """ An unsorted all-vs-all, converted with small chunks so that it's
+    read in many batches.
+    """
+
+    rng = random.Random(seed)
+    lengths = {
+        f"g{g}.c{c}": rng.randint(1000, 5000)
+        for g in range(6)
+        for c in range(5)
+    }
+    names = sorted(lengths)
+
+    with open(tmp_path / "in.paf", "w") as handle:
+        for _ in range(2000):
+            query, target = rng.choice(names), rng.choice(names)
+            qstart = rng.randint(0, lengths[query] - 500)
+            tstart = rng.randint(0, lengths[target] - 500)
+            length = rng.randint(5, 500)
+            handle.write(
+                f"{query}\t{lengths[query]}\t{qstart}\t{qstart + length}\t"
+                f"+\t{target}\t{lengths[target]}\t{tstart}\t"
+                f"{tstart + length}\t{length}\t{length}\t60\n"
+            )
+
+    path = str(tmp_path / "in.ppaf")
+    convert_main(cli("ppg", [
+        "convert", str(tmp_path / "in.paf"), "-o", path, "-c", "50",
+    ]))
+    return path
+
+
+@pytest.mark.parametrize("command, main", [
+    ("repeats", repeats_main),
+    ("cluster", cluster_main),
+])
+@pytest.mark.parametrize("max_memory", ["1", "4K"])
+def test_spilled_outputs_match(
+    tmp_path,
+    monkeypatch,
+    command: str,
+    main,
+    max_memory: str,
+):
+    inpaf = write_columnar(tmp_path)
+
+    def run(name: str, options: List[str]) -> List[str]:
+        outfile = tmp_path / name
+        main(cli("ppg", [command, inpaf, "-o", str(outfile)] + options))
+        with open(outfile) as handle:
+            return handle.readlines()
+
+    expected = run("in_memory", [])
+    assert len(expected) > 0
+
+    spills = []
+    write = SpillRuns.write
+
+    def counted_write(self, columns):
+        spills.append(len(columns["key"]))
+        return write(self, columns)
+
+    monkeypatch.setattr(SpillRuns, "write", counted_write)
+    result = run("spilled", [
+        "--max-memory", max_memory,
+        "--tmpdir", str(tmp_path),
+    ])
+
+    assert len(spills) > 1
+    assert result == expected
+
+    # The temporary files are removed at the end.
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "in.paf", "in.ppaf", "in_memory", "spilled",
+    ]
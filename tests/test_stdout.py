@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import subprocess
+
+from typing import List
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_ppg(args: List[str]) -> subprocess.CompletedProcess:
+    code = (
+        "import sys; sys.argv[0] = 'ppg'; "
+        "from pypafgraph.scripts import main; main()"
+    )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (REPO, env.get("PYTHONPATH")) if p
+    )
+    return subprocess.run(
+        [sys.executable, "-c", code] + args,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def paf_line(query: str, target: str, qstart: int, tstart: int) -> str:
+    return (
+        f"{query}\t1000\t{qstart}\t{qstart + 500}\t+\t"
+        f"{target}\t1000\t{tstart}\t{tstart + 500}\t500\t500\t60\n"
+    )
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    with open(tmp_path / "in.paf", "w") as handle:
+        handle.write(paf_line("g1.a", "g1.a", 0, 500))
+        handle.write(paf_line("g1.a", "g2.a", 100, 100))
+        handle.write(paf_line("g1.b", "g2.b", 0, 0))
+
+    with open(tmp_path / "in.bed", "w") as handle:
+        handle.write("g1.a\t0\t100\n")
+
+    with open(tmp_path / "in.fasta", "w") as handle:
+        handle.write(">g1.a\nACGTacgtACGT\n>g1.b\nacgtACGT\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize("command", [
+    ["filter", "in.bed", "in.paf"],
+    ["repeats", "in.paf"],
+    ["cluster", "in.paf"],
+    ["unsoftmask", "in.fasta"],
+])
+def test_stats_after_output_to_stdout(inputs, command: List[str]):
+    args = [command[0]] + [str(inputs / f) for f in command[1:]]
+    result = run_ppg(["--stats", "-"] + args + ["-o", "-"])
+    assert result.returncode == 0, result.stderr
+
+    output, brace, stats = result.stdout.partition("{")
+    assert len(output.splitlines()) > 0
+    assert json.loads(brace + stats)["command"] == command[0]